@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+
+The change feed (/feed/) is an async streaming view, serve it from this
+application (e.g. `uvicorn task_managment.asgi:application`) so that
+long-lived connections don't each hold a worker thread.
 """
 
 import os
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from task_managment import database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -39,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'taskmanager',
     'rest_framework',
+    'rest_framework.authtoken',
     'django_filters',
     'rest_framework_simplejwt',
 
@@ -50,6 +54,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'taskmanager.profiling.ProfilingMiddleware',
+    'taskmanager.audit.AuditMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,12 +84,29 @@ WSGI_APPLICATION = 'task_managment.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# DATABASE_URL, connection pooling and timeouts come from the environment, see
+# task_managment/database.py. Without DATABASE_URL the local SQLite file is used.
+DATABASES = database.databases(os.environ, default_url=f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
+
+# Sends the tasks of workspaces with their own database there
+DATABASE_ROUTERS = ['taskmanager.tenancy.WorkspaceRouter']
+
+
+# Password hashing. The first hasher encodes new passwords, the others only verify old ones.
+PASSWORD_HASHERS = [
+    'taskmanager.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# PBKDF2 work factor: every login costs this many SHA-256 rounds of CPU. 600000 is the
+# OWASP recommendation, changing it rehashes each password on its next successful login.
+PASSWORD_PBKDF2_ITERATIONS = 600000
+
+# Runs the suite at a low work factor, see task_managment/test_runner.py
+TEST_RUNNER = 'task_managment.test_runner.TestRunner'
 
 
 # Password validation
@@ -111,13 +134,27 @@ REST_FRAMEWORK = {
     
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'rest_framework.authentication.TokenAuthentication',  # Tokens issued by auth/
     ],
     
     'DEFAULT_PERMISSION_CLASSES' : [
         'rest_framework.permissions.DjangoModelPermissions',
     ],
+
+    # Token buckets, see taskmanager/throttling.py
+    'DEFAULT_THROTTLE_CLASSES': [
+        'taskmanager.throttling.WriteThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '20/min',
+        'login_username': '5/min',
+        'login_account': '100/hour',
+        'write': '300/min',
+    },
 }
 
+TASK_THROTTLE_STORE = 'local'  # 'cache' to share the buckets between processes through CACHES
+
 
 from datetime import timedelta
 
@@ -157,3 +194,51 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER =''
 EMAIL_HOST_PASSWORD = ''
 
+# Notification digests, see taskmanager/notifications.py
+TASK_NOTIFICATION_WINDOW = 600  # seconds a recipient's notifications are collected into one email, 0 to send on the next send_notification_digests run
+
+
+# Workspaces (tenants), see taskmanager/tenancy.py
+TASK_WORKSPACE_AUTO_JOIN = 'default'  # slug new users join, None when every user is added to a workspace by hand
+
+
+# Auto-assignment, see taskmanager/assignment.py
+TASK_ASSIGNMENT_INDEX_TTL = 60  # seconds before a process rebuilds its load index, to see other workers' writes
+
+
+# Change feed (Server-Sent Events), see taskmanager/feed.py
+TASK_FEED_POLL_INTERVAL = 1.0  # seconds between the per-process polls for new events
+TASK_FEED_QUEUE_SIZE = 1000  # events buffered per client before it is disconnected
+TASK_FEED_HEARTBEAT = 15  # seconds of silence before a keep-alive comment is sent
+
+
+# Idempotency-Key on POST /tasks/ and /deadline-extension-requests/, see taskmanager/idempotency.py
+TASK_IDEMPOTENCY_TTL = 24 * 60 * 60  # seconds a key and its response are kept
+TASK_IDEMPOTENCY_LOCK_TIMEOUT = 60  # seconds after which an unfinished request's key can be taken over
+
+
+# Webhooks, see taskmanager/webhooks.py
+TASK_WEBHOOK_MAX_CONNECTIONS = 20  # requests in flight over all endpoints
+TASK_WEBHOOK_TIMEOUT = 10  # seconds per request
+TASK_WEBHOOK_BATCH_SIZE = 200  # deliveries claimed per poll
+TASK_WEBHOOK_POLL_INTERVAL = 1.0  # seconds between polls when nothing is due
+TASK_WEBHOOK_MAX_ATTEMPTS = 8
+TASK_WEBHOOK_RETRY_BASE = 10  # seconds, doubled per attempt, with full jitter
+TASK_WEBHOOK_RETRY_CAP = 60 * 60
+TASK_WEBHOOK_BREAKER_THRESHOLD = 5  # consecutive failures that open an endpoint's circuit
+TASK_WEBHOOK_BREAKER_COOLDOWN = 5 * 60  # seconds before a probe delivery
+
+
+# Per-developer metrics, see taskmanager/metrics.py
+TASK_METRICS_WINDOWS = (7, 30)  # rolling windows (days) kept per developer
+
+
+# Request profiling, see taskmanager/profiling.py
+TASK_PROFILING_ENABLED = False  # the middleware removes itself when False
+TASK_PROFILING_SAMPLE_RATE = 0  # also profile 1 request in N, 0 for staff requests only
+TASK_PROFILING_DIR = BASE_DIR / 'profiles'
+TASK_PROFILING_KEEP = 50  # captures kept, the oldest are deleted first
+
+
+# Worker start-up budget, checked by `manage.py check_startup` (e.g. in CI)
+TASK_STARTUP_BUDGET_MS = 1500  # wall time to import the WSGI application and the URLconf
@@ -0,0 +1,18 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    The test suite creates hundreds of users, none of which needs a production
+    PBKDF2 work factor.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.fast_hashing = override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+        self.fast_hashing.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.fast_hashing.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,43 +1,184 @@
+from django import forms
 from django.contrib import admin
-from taskmanager.models import Task, DeadlineExtensionLog
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from taskmanager.models import Task, DeadlineExtensionLog, Workspace, WebhookEndpoint, WebhookDelivery
+from taskmanager.roles import has_role, DEVELOPER
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Never runs an unbounded COUNT(*). The unfiltered list uses PostgreSQL's
+    row estimate, everything else is counted up to `count_limit` rows.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > self.count_limit:
+                return int(row[0])
+        return queryset.order_by()[:self.count_limit].count()
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    Filter on a foreign key picked through the admin autocomplete widget,
+    instead of rendering a link for every related row.
+    """
+    template = 'admin/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = f'{self.field_name}__id__exact'
+        super().__init__(request, params, model, model_admin)
+        field = model._meta.get_field(self.field_name)
+        # A form field gives the widget its choices, so only the selected row gets loaded
+        self.form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+            required=False,
+        )
+
+    def lookups(self, request, model_admin):
+        # Options are fetched by the widget, nothing is listed up front
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        self.reset_query_string = changelist.get_query_string(remove=[self.parameter_name])
+        yield {
+            'selected': self.value() is None,
+            'query_string': self.reset_query_string,
+            'display': _('All'),
+        }
+
+    def render_widget(self):
+        return self.form_field.widget.render(self.parameter_name, self.value(), attrs={'id': f'filter_{self.parameter_name}', 'style': 'width: 100%'})
+
+
+class TaskAutocompleteFilter(AutocompleteFilter):
+    title = _('task')
+    field_name = 'task'
+
+
+class PerformanceModeAdmin(admin.ModelAdmin):
+    """
+    Changelist settings that keep the admin usable on very large tables:
+    estimated counts, no facet counts, autocomplete filters and a narrow
+    SELECT (`list_only`) for the list page.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    list_only = None
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        if self.list_only and match and match.url_name and match.url_name.endswith('_changelist'):
+            queryset = queryset.only(*self.list_only)
+        return queryset
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, type) and issubclass(list_filter, AutocompleteFilter):
+                media += AutocompleteSelect(self.model._meta.get_field(list_filter.field_name), self.admin_site).media
+        return media
+
 
 # Customizing the task admin
-class TaskAdmin(admin.ModelAdmin):
+class TaskAdmin(PerformanceModeAdmin):
     list_display = ['name', 'assigned_by', 'assigned_to', 'status', 'due_date']  # Columns to display
-    list_filter = ['status', 'priority', 'due_date']  # Filters for the admin interface
+    list_select_related = ['assigned_by', 'assigned_to']  # Join the users instead of one query per row
+    list_only = ['name', 'status', 'due_date', 'assigned_by__username', 'assigned_to__username']
+    list_filter = ['workspace', 'status', 'priority', 'due_date']  # Filters for the admin interface
     search_fields = ['name', 'description']  # Fields that can be searched
     ordering = ['due_date']  # Default ordering for tasks
+    autocomplete_fields = ['parent_task']
 
     readonly_fields = ['assigned_by', 'assigned_to', 'status']  # Fields that developers shouldn't modify
-    
+
     def get_queryset(self, request):
         # Restrict developers to only see their own tasks
         queryset = super().get_queryset(request)
-        if request.user.groups.filter(name='Developer').exists():
+        if has_role(request.user, DEVELOPER):
             # Developers can only see tasks assigned to them
             return queryset.filter(assigned_to=request.user)
         return queryset
 
     def has_change_permission(self, request, obj=None):
         # Restrict change permissions for developers
-        if obj and request.user.groups.filter(name='Developer').exists():
+        if obj and has_role(request.user, DEVELOPER):
             # Developers cannot change the 'assigned_by', 'assigned_to', or 'status' fields
             return False
         return super().has_change_permission(request, obj)
 
     def get_readonly_fields(self, request, obj=None):
         # For developers, make the relevant fields readonly
-        if request.user.groups.filter(name='Developer').exists():
+        if has_role(request.user, DEVELOPER):
             return self.readonly_fields + ['name', 'due_date', 'priority']
         return self.readonly_fields
 
 admin.site.register(Task, TaskAdmin)
 
 # Customizing the DeadlineExtensionLog admin
-class DeadlineExtensionLogAdmin(admin.ModelAdmin):
+class DeadlineExtensionLogAdmin(PerformanceModeAdmin):
     list_display = ['task', 'request_by', 'new_deadline', 'reason']
-    list_filter = ['task', 'new_deadline']
-    search_fields = ['task', 'request_by']
+    list_select_related = ['task', 'request_by']  # __str__ of both is shown on every row
+    list_only = ['new_deadline', 'reason', 'status', 'task__name', 'request_by__username']
+    list_filter = [TaskAutocompleteFilter, 'new_deadline']  # No dropdown listing every task
+    search_fields = ['task__name', 'request_by__username']
     ordering = ['new_deadline']
+    autocomplete_fields = ['task']
 
 admin.site.register(DeadlineExtensionLog, DeadlineExtensionLogAdmin)  # Register the model
+
+# Workspaces (tenants) and their members
+class WorkspaceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug', 'database', 'created_at']
+    search_fields = ['name', 'slug']
+    filter_horizontal = ['members']
+    prepopulated_fields = {'slug': ['name']}
+
+admin.site.register(Workspace, WorkspaceAdmin)
+
+# Webhook endpoints and their deliveries, which only the dispatcher writes
+class WebhookEndpointAdmin(admin.ModelAdmin):
+    list_display = ['url', 'workspace', 'events', 'is_active', 'failure_count', 'circuit_open_until']
+    list_filter = ['is_active', 'workspace']
+    search_fields = ['url']
+    readonly_fields = ['failure_count', 'circuit_open_until']
+
+admin.site.register(WebhookEndpoint, WebhookEndpointAdmin)
+
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ['event', 'endpoint', 'status', 'attempts', 'response_status', 'next_attempt_at', 'created_at']
+    list_select_related = ['endpoint']
+    list_filter = ['status', 'event']
+    ordering = ['-created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+admin.site.register(WebhookDelivery, WebhookDeliveryAdmin)
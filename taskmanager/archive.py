@@ -0,0 +1,198 @@
+"""
+Cold storage for finished work.
+
+The archiver moves whole task trees (a root task and every subtask below
+it) out of the hot Task table once every task in the tree is Completed,
+none was touched for `days` days and none has an extension request still
+pending. Each task becomes one ArchivedTask row: the columns the archive
+is searched by, plus a JSON document holding the rest of the task and its
+extension logs.
+
+Candidate roots are walked in primary key order in small batches, each in
+its own short transaction that locks only the rows of that batch. An
+interrupted run loses nothing: archived trees are already gone from the
+hot table and the next run simply picks up the rest.
+"""
+import datetime
+
+from django.db import router, transaction
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import now
+
+from . import feed, tenancy
+from .models import Task, DeadlineExtensionLog, TaskTemplate, ArchivedTask
+from .transitions import tasks_bulk_created
+
+
+ARCHIVE_AFTER_DAYS = 90
+BATCH_SIZE = 200  # Root tasks per transaction
+
+TASK_DATA_FIELDS = (
+    'description', 'status', 'version', 'template_id', 'occurrence_key', 'created_at', 'updated_at', 'started_at', 'completed_at',
+    'descendant_count', 'completed_descendant_count', 'earliest_descendant_due',
+)
+EXTENSION_FIELDS = ('id', 'reason', 'new_deadline', 'request_by_id', 'status', 'created_at', 'approved_by_id', 'approved_at')
+
+
+class NotArchived(Exception):
+    pass
+
+
+def _dump(value):
+    # DjangoJSONEncoder would cut datetimes to milliseconds
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def _load_trees(roots, using):
+    """
+    Every task below `roots`, locked, as (task, depth, root id) tuples. One query per tree level.
+    """
+    rows = [(root, 0, root.pk) for root in roots]
+    root_of = {root.pk: root.pk for root in roots}
+    parents, depth = list(root_of), 0
+    while parents:
+        depth += 1
+        children = list(Task.objects.using(using).select_for_update().filter(parent_task__in=parents).order_by('pk'))
+        for child in children:
+            root_of[child.pk] = root_of[child.parent_task_id]
+            rows.append((child, depth, root_of[child.pk]))
+        parents = [child.pk for child in children]
+    return rows
+
+
+def _archive_batch(root_ids, cutoff, using):
+    with transaction.atomic(using=using):
+        roots = list(
+            Task.objects.using(using).select_for_update()
+            .filter(pk__in=root_ids, parent_task__isnull=True, status='Completed', updated_at__lt=cutoff)
+        )
+        rows = _load_trees(roots, using)
+        task_ids = [task.pk for task, depth, root_id in rows]
+
+        extensions = {}
+        for extension in DeadlineExtensionLog.objects.using(using).filter(task__in=task_ids).order_by('pk'):
+            extensions.setdefault(extension.task_id, []).append(extension)
+        links = {}
+        for task_id, extension_id in Task.deadline_extension_logs.through.objects.using(using).filter(task__in=task_ids).values_list('task_id', 'deadlineextensionlog_id'):
+            links.setdefault(task_id, []).append(extension_id)
+
+        # A tree is only archived as a whole
+        blocked = set()
+        for task, depth, root_id in rows:
+            if task.status != 'Completed' or task.updated_at >= cutoff:
+                blocked.add(root_id)
+            if any(extension.status == 'PENDING' for extension in extensions.get(task.pk, ())):
+                blocked.add(root_id)
+
+        archived = []
+        for task, depth, root_id in rows:
+            if root_id in blocked:
+                continue
+            data = {field: _dump(getattr(task, field)) for field in TASK_DATA_FIELDS}
+            data['extension_logs'] = [{field: _dump(getattr(extension, field)) for field in EXTENSION_FIELDS} for extension in extensions.get(task.pk, ())]
+            data['linked_extension_logs'] = links.get(task.pk, [])
+            archived.append(ArchivedTask(
+                id=task.pk, workspace_id=task.workspace_id, root_id=root_id, parent_task_id=task.parent_task_id,
+                depth=depth, name=task.name, priority=task.priority, due_date=task.due_date,
+                assigned_to_id=task.assigned_to_id, assigned_by_id=task.assigned_by_id,
+                completed_at=task.updated_at, data=data,
+            ))
+
+        ArchivedTask.objects.using(using).bulk_create(archived, batch_size=1000)
+        # Subtasks and extension logs go with their root (CASCADE)
+        Task.objects.using(using).filter(pk__in=[root.pk for root in roots if root.pk not in blocked]).delete()
+    return len(archived)
+
+
+def archive(days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE):
+    """
+    Archive every eligible tree. Returns the number of tasks archived.
+    """
+    cutoff = now() - datetime.timedelta(days=days)
+    archived = 0
+    for using in tenancy.databases():
+        candidates = (
+            Task.objects.using(using)
+            .filter(parent_task__isnull=True, status='Completed', updated_at__lt=cutoff)
+            .order_by('pk')
+        )
+        last_pk = 0
+        while True:
+            root_ids = list(candidates.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not root_ids:
+                break
+            archived += _archive_batch(root_ids, cutoff, using)
+            last_pk = root_ids[-1]
+    return archived
+
+
+def restore(task_id, user=None):
+    """
+    Move the archived tree containing `task_id` back into the hot tables,
+    with the original ids. Returns the restored tasks.
+    """
+    root_id = ArchivedTask.objects.filter(pk=task_id).values_list('root_id', flat=True).first()
+    if root_id is None:
+        raise NotArchived(f"Task {task_id} is not in the archive.")
+
+    using = router.db_for_write(Task)
+    with transaction.atomic(using=using):
+        rows = list(ArchivedTask.objects.using(using).select_for_update().filter(root_id=root_id).order_by('depth', 'pk'))
+        templates = set(TaskTemplate.objects.using(using).filter(pk__in={row.data['template_id'] for row in rows}).values_list('pk', flat=True))
+
+        tasks, extensions, links = [], [], []
+        for row in rows:
+            data = row.data
+            tasks.append(Task(
+                id=row.pk, workspace_id=row.workspace_id, parent_task_id=row.parent_task_id,
+                name=row.name, description=data['description'], status=data['status'],
+                priority=row.priority, priority_rank=Task.PRIORITY_RANKS.get(row.priority, 0),
+                due_date=row.due_date, assigned_to_id=row.assigned_to_id, assigned_by_id=row.assigned_by_id,
+                version=data['version'], occurrence_key=data['occurrence_key'],
+                template_id=data['template_id'] if data['template_id'] in templates else None,
+                # Archived before the timestamps existed: no start, completed when last updated
+                started_at=data.get('started_at') and parse_datetime(data['started_at']),
+                completed_at=parse_datetime(data.get('completed_at') or data['updated_at']) if data['status'] == 'Completed' else None,
+                # Archived before the rollups existed: recomputed by the rollup refresh after the insert
+                descendant_count=data.get('descendant_count', 0),
+                completed_descendant_count=data.get('completed_descendant_count', 0),
+                earliest_descendant_due=data.get('earliest_descendant_due') and parse_date(data['earliest_descendant_due']),
+            ))
+            for extension in data['extension_logs']:
+                # The JSON document holds dates as ISO strings
+                extension.update(
+                    new_deadline=parse_date(extension['new_deadline']),
+                    created_at=parse_datetime(extension['created_at']),
+                    approved_at=extension['approved_at'] and parse_datetime(extension['approved_at']),
+                )
+                extensions.append(DeadlineExtensionLog(task_id=row.pk, workspace_id=row.workspace_id, **extension))
+            links += [(row.pk, extension_id) for extension_id in data['linked_extension_logs']]
+
+        # Parents come first (depth order), so the self-references resolve
+        Task.objects.using(using).bulk_create(tasks)
+        extension_created_at = [extension.created_at for extension in extensions]
+        DeadlineExtensionLog.objects.using(using).bulk_create(extensions)
+
+        # auto_now/auto_now_add overwrote the original timestamps on insert, bulk_update does not
+        for task, row in zip(tasks, rows):
+            task.created_at = parse_datetime(row.data['created_at'])
+            task.updated_at = parse_datetime(row.data['updated_at'])
+        Task.objects.using(using).bulk_update(tasks, ['created_at', 'updated_at'])
+        for extension, created_at in zip(extensions, extension_created_at):
+            extension.created_at = created_at
+        DeadlineExtensionLog.objects.using(using).bulk_update(extensions, ['created_at'])
+
+        existing = set(DeadlineExtensionLog.objects.using(using).filter(pk__in=[extension_id for task_id, extension_id in links]).values_list('pk', flat=True))
+        Task.deadline_extension_logs.through.objects.using(using).bulk_create([
+            Task.deadline_extension_logs.through(task_id=task_id, deadlineextensionlog_id=extension_id)
+            for task_id, extension_id in links if extension_id in existing
+        ], ignore_conflicts=True)
+
+        ArchivedTask.objects.using(using).filter(root_id=root_id).delete()
+
+        tasks_bulk_created.send(sender=Task, tasks=tasks, user=user)
+        by_id = {task.pk: task for task in tasks}
+        for extension in extensions:
+            extension.task = by_id[extension.task_id]
+        feed.capture_all(extensions)
+    return tasks
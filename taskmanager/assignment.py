@@ -0,0 +1,280 @@
+"""
+Workload-aware assignment of tasks to developers.
+
+Every open task adds a load to its developer: the task's priority weight,
+scaled up as its due date gets closer. LoadIndex keeps the total load per
+developer in a min-heap, so picking the developer with the most spare
+capacity is O(log n) and never aggregates over the task table. There is one
+index per workspace, holding its member developers and its tasks.
+
+The indexes live in the process's memory. A process builds an index from
+the database on first use. The task and membership signals (see
+signals.py) then keep it current with the writes of this process, applied
+once their transaction commits, so rolled-back changes never reach it. The
+index does not see other workers' writes or queryset .update() calls, so it
+is rebuilt every TASK_ASSIGNMENT_INDEX_TTL seconds. Until then its loads
+are approximate, which is good enough to balance assignments. Urgency
+depends on today's date, so an index is also rebuilt the first time it is
+used on a new day.
+"""
+import datetime
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import router, transaction
+
+from . import tenancy
+from .models import Task, default_workspace
+from .roles import DEVELOPER
+
+
+# Each priority step doubles the load: When Free 1, Next Week 2, ASAP 4, URGENT 8
+PRIORITY_WEIGHTS = {priority: 2 ** rank for priority, rank in Task.PRIORITY_RANKS.items()}
+
+URGENCY_HORIZON_DAYS = 14  # Tasks due further out than this count at their base weight
+INDEX_TTL = 60  # seconds, when TASK_ASSIGNMENT_INDEX_TTL is not set
+OPEN_STATUSES = ('Pending', 'In Progress')
+
+
+class NoDevelopersAvailable(Exception):
+    pass
+
+
+def task_load(priority, due_date, today=None):
+    """
+    Load one open task puts on its developer: the priority weight, up to doubled
+    when the due date is today or already passed.
+    """
+    today = today or datetime.date.today()
+    days_left = (due_date - today).days
+    urgency = 1 + max(0, min(URGENCY_HORIZON_DAYS, URGENCY_HORIZON_DAYS - days_left)) / URGENCY_HORIZON_DAYS
+    return PRIORITY_WEIGHTS.get(priority, 1) * urgency
+
+
+class LoadIndex:
+    """
+    Per-developer load scores in a heap with lazy deletion: updating a
+    developer pushes a fresh entry and stale ones are skipped when popped.
+    """
+
+    def __init__(self, developer_ids=(), built_on=None):
+        self.built_on = built_on
+        self.built_at = time.monotonic()
+        self.lock = threading.RLock()
+        self.loads = {}
+        self.task_loads = {}  # task id -> (developer id, load) for every open task
+        self.heap = []
+        for developer_id in developer_ids:
+            self.add_developer(developer_id)
+
+    def __len__(self):
+        return len(self.loads)
+
+    def _push(self, developer_id):
+        heapq.heappush(self.heap, (self.loads[developer_id], developer_id))
+        # Keep lazy deletion from growing the heap without bound
+        if len(self.heap) > 4 * len(self.loads) + 64:
+            self.heap = [(load, developer_id) for developer_id, load in self.loads.items()]
+            heapq.heapify(self.heap)
+
+    def add_developer(self, developer_id):
+        with self.lock:
+            if developer_id not in self.loads:
+                self.loads[developer_id] = 0.0
+                self._push(developer_id)
+
+    def remove_developer(self, developer_id):
+        with self.lock:
+            self.loads.pop(developer_id, None)
+
+    def set_task(self, task_id, developer_id, load):
+        """
+        Record (or move, or re-weigh) the load of an open task.
+        """
+        with self.lock:
+            self.discard_task(task_id)
+            if developer_id not in self.loads:
+                return
+            self.task_loads[task_id] = (developer_id, load)
+            self.loads[developer_id] += load
+            self._push(developer_id)
+
+    def discard_task(self, task_id):
+        with self.lock:
+            previous = self.task_loads.pop(task_id, None)
+            if previous is None:
+                return
+            developer_id, load = previous
+            if developer_id in self.loads:
+                self.loads[developer_id] = max(0.0, self.loads[developer_id] - load)
+                self._push(developer_id)
+
+    def least_loaded(self):
+        with self.lock:
+            while self.heap:
+                load, developer_id = self.heap[0]
+                if self.loads.get(developer_id) == load:
+                    return developer_id
+                heapq.heappop(self.heap)  # Stale entry
+            raise NoDevelopersAvailable("There are no developers to assign the task to.")
+
+    def assign(self, loads, excluding=()):
+        """
+        Batch mode: pick a developer for each load, biggest loads first (LPT),
+        reserving the capacity as it goes. The tasks in `excluding` (being
+        re-assigned) do not count against their developers while choosing.
+        Returns developer ids in input order.
+        """
+        with self.lock:
+            reserved = {}
+            for task_id in excluding:
+                developer_id, load = self.task_loads.get(task_id, (None, 0.0))
+                if developer_id in self.loads:
+                    self.loads[developer_id] -= load
+                    reserved[developer_id] = reserved.get(developer_id, 0.0) - load
+                    self._push(developer_id)
+            try:
+                chosen = [None] * len(loads)
+                for position in sorted(range(len(loads)), key=lambda i: -loads[i]):
+                    developer_id = self.least_loaded()
+                    chosen[position] = developer_id
+                    self.loads[developer_id] += loads[position]
+                    reserved[developer_id] = reserved.get(developer_id, 0.0) + loads[position]
+                    self._push(developer_id)
+                return chosen
+            finally:
+                # The reservations are replaced by real task loads once the tasks are saved
+                for developer_id, load in reserved.items():
+                    if developer_id in self.loads:
+                        self.loads[developer_id] -= load
+                        self._push(developer_id)
+
+
+_indexes = {}  # workspace id -> LoadIndex
+_index_lock = threading.Lock()
+
+
+def _stale(index, today):
+    ttl = getattr(settings, 'TASK_ASSIGNMENT_INDEX_TTL', INDEX_TTL)
+    return index is None or index.built_on != today or time.monotonic() - index.built_at >= ttl
+
+
+def get_index(workspace_id=None):
+    """
+    The process-wide index of a workspace (the active one by default), built
+    from the database on first use and again once it is stale.
+    """
+    if workspace_id is None:
+        workspace_id = default_workspace()
+    today = datetime.date.today()
+    index = _indexes.get(workspace_id)
+    if _stale(index, today):
+        with _index_lock:
+            index = _indexes.get(workspace_id)
+            if _stale(index, today):
+                index = _indexes[workspace_id] = build_index(workspace_id, today)
+    return index
+
+
+def reset_index():
+    _indexes.clear()
+
+
+def current_index(workspace_id):
+    # The signal handlers only maintain indexes that already exist
+    return _indexes.get(workspace_id)
+
+
+def current_indexes():
+    return dict(_indexes)
+
+
+def build_index(workspace_id, today=None):
+    today = today or datetime.date.today()
+    developers = User.objects.filter(is_active=True, groups__name=DEVELOPER, workspaces=workspace_id).values_list('id', flat=True)
+    index = LoadIndex(developers, built_on=today)
+    open_tasks = (
+        Task.objects.filter(workspace_id=workspace_id, status__in=OPEN_STATUSES)
+        .values_list('id', 'assigned_to_id', 'priority', 'due_date')
+    )
+    for task_id, developer_id, priority, due_date in open_tasks.iterator(chunk_size=2000):
+        index.set_task(task_id, developer_id, task_load(priority, due_date, today))
+    return index
+
+
+def track(task):
+    """
+    Bring the index up to date with a saved task, once the transaction commits.
+    """
+    if current_index(task.workspace_id) is None:
+        return
+    # Read now, the instance may change before the commit
+    workspace_id, task_id, developer_id = task.workspace_id, task.pk, task.assigned_to_id
+    load = task_load(task.priority, task.due_date) if task.status in OPEN_STATUSES else None
+
+    def apply():
+        index = current_index(workspace_id)
+        if index is None:
+            return
+        if load is None:
+            index.discard_task(task_id)
+        else:
+            index.set_task(task_id, developer_id, load)
+    tenancy.on_commit(apply)
+
+
+def untrack(task_id):
+    def apply():
+        for index in current_indexes().values():
+            index.discard_task(task_id)
+    tenancy.on_commit(apply)
+
+
+def developers_changed(memberships, joined):
+    """
+    Add (or remove) (workspace id, developer id) pairs to the existing
+    indexes, once the transaction commits.
+    """
+    memberships = list(memberships)
+
+    def apply():
+        for workspace_id, developer_id in memberships:
+            index = current_index(workspace_id)
+            if index is None:
+                continue
+            if joined:
+                index.add_developer(developer_id)
+            else:
+                index.remove_developer(developer_id)
+    transaction.on_commit(apply, using=router.db_for_write(User))
+
+
+def pick_developer(workspace_id=None):
+    """
+    The workspace's active developer with the lowest load, for a single new task.
+    """
+    return User.objects.get(pk=get_index(workspace_id).least_loaded())
+
+
+def assign_batch(tasks):
+    """
+    Fill in `assigned_to` for many (saved or unsaved) tasks at once, balancing
+    the load across each workspace's developers. The saved tasks' current
+    load is left out while choosing. Nothing is written, the caller saves
+    the tasks.
+    """
+    by_workspace = {}
+    for task in tasks:
+        by_workspace.setdefault(task.workspace_id, []).append(task)
+
+    for workspace_id, workspace_tasks in by_workspace.items():
+        chosen = get_index(workspace_id).assign(
+            [task_load(task.priority, task.due_date) for task in workspace_tasks],
+            excluding=[task.pk for task in workspace_tasks if task.pk is not None],
+        )
+        for task, developer_id in zip(workspace_tasks, chosen):
+            task.assigned_to_id = developer_id
+    return tasks
@@ -0,0 +1,142 @@
+"""
+Request-scoped batching of TaskEvent rows.
+
+Signal handlers call `record()` for every task change. Inside a request (see
+AuditMiddleware) or an explicit `batch()` block the events are only
+collected, and written with a single bulk INSERT at the end, no matter how
+many tasks were touched. Outside of both, events are written immediately.
+
+An event joins the buffer only once the transaction of its change commits
+(on_commit). Events of a rolled-back atomic block, or savepoint, are
+dropped with it and never show up in the history.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.utils.timezone import now
+
+from .models import TaskEvent
+from . import tenancy
+from .tenancy import active_workspace
+
+
+# Fields whose changes are kept in the history. description is left out on
+# purpose: it is unbounded and would bloat every diff.
+AUDITED_FIELDS = ('name', 'status', 'priority', 'due_date', 'assigned_to_id', 'parent_task_id')
+
+_pending = ContextVar('taskmanager_audit_pending', default=None)
+
+
+def snapshot(task):
+    return {field: getattr(task, field) for field in AUDITED_FIELDS}
+
+
+def diff(task):
+    """
+    Audited fields that differ from what was loaded from the database. A task
+    that was never loaded (just created, or built by hand) diffs as a full snapshot.
+    """
+    loaded = getattr(task, '_loaded_values', None)
+    if loaded is None:
+        return snapshot(task)
+
+    # Deferred fields were neither loaded nor changed, and reading them would cost a query
+    deferred = task.get_deferred_fields()
+    changes = {}
+    for field in AUDITED_FIELDS:
+        if field in deferred:
+            continue
+        value = getattr(task, field)
+        if loaded.get(field) != value:
+            changes[field] = value
+    return changes
+
+
+def mark_saved(task):
+    """
+    Make the instance's current values the baseline for its next diff.
+    """
+    deferred = task.get_deferred_fields()
+    loaded = getattr(task, '_loaded_values', None) or {}
+    loaded.update({field: getattr(task, field) for field in AUDITED_FIELDS if field not in deferred})
+    task._loaded_values = loaded
+
+
+def record(task_id, changes, actor=None, workspace_id=None):
+    if workspace_id is None:
+        workspace = active_workspace()
+        workspace_id = workspace.pk if workspace is not None else None
+    event = TaskEvent(task_id=task_id, changes=changes, actor=actor, created_at=now(), workspace_id=workspace_id)
+    pending = _pending.get()
+    if pending is None:
+        event.save()
+    else:
+        # Runs right away outside of a transaction, and never for a rolled-back one
+        tenancy.on_commit(lambda: pending.append(event))
+
+
+def flush(events, actor=None):
+    if not events:
+        return
+    if actor is not None:
+        for event in events:
+            if event.actor_id is None:
+                event.actor = actor
+    TaskEvent.objects.bulk_create(events)
+
+
+@contextmanager
+def batch(actor=None):
+    """
+    Collect every event recorded inside the block and write them with one INSERT.
+    """
+    pending = []
+    token = _pending.set(pending)
+    try:
+        yield pending
+    finally:
+        _pending.reset(token)
+        # Inside a transaction the events join the buffer on commit, so this has to wait for it too
+        tenancy.on_commit(lambda: flush(pending, actor))
+
+
+class AuditMiddleware:
+    """
+    Buffers the task events of one request and writes them in a single INSERT
+    once the response is ready, attributing them to the authenticated user.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        pending = []
+        token = _pending.set(pending)
+        try:
+            return self.get_response(request)
+        finally:
+            _pending.reset(token)
+            flush(pending, self._actor(request))
+
+    async def __acall__(self, request):
+        pending = []
+        token = _pending.set(pending)
+        try:
+            return await self.get_response(request)
+        finally:
+            _pending.reset(token)
+            if pending:
+                await sync_to_async(flush)(pending, self._actor(request))
+
+    def _actor(self, request):
+        # DRF copies the token-authenticated user back onto the Django request
+        user = getattr(request, 'user', None)
+        return user if user is not None and user.is_authenticated else None
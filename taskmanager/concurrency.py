@@ -0,0 +1,39 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PreconditionFailed(APIException):
+    """
+    Raised when the version sent in If-Match no longer matches the stored row.
+    """
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource has been modified by another request. Reload it and try again.'
+    default_code = 'precondition_failed'
+
+
+def etag_for(version):
+    return f'"{version}"'
+
+
+def parse_if_match(request):
+    """
+    Return the version number sent in the If-Match header, or None when the
+    client did not send one (or sent the `*` wildcard).
+    """
+    if request is None:
+        return None
+
+    header = request.headers.get('If-Match')
+    if not header or header.strip() == '*':
+        return None
+
+    # Only a single entity tag makes sense for a version check
+    tag = header.split(',')[0].strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    tag = tag.strip('"')
+
+    try:
+        return int(tag)
+    except ValueError:
+        raise PreconditionFailed('If-Match must contain the ETag returned for this resource.')
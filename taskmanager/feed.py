@@ -0,0 +1,272 @@
+"""
+Change feed for tasks and deadline extension logs.
+
+Writes are captured into ChangeEvent rows by the signal handlers in
+signals.py. Each worker process runs one
+Broadcaster per workspace with listeners, which polls for the workspace's
+new events once per interval and fans them out to every connected
+Server-Sent Events client, so the number of connected clients does not
+change the number of queries. The stream is async and runs outside of an
+activated workspace, so its queries name their workspace explicitly.
+
+Events are inserted in the same transaction as the change they describe,
+so a rolled back write never shows up in the feed and a committed one is
+never missing from it. Their ids are handed out at INSERT time, so with
+concurrent writers a long transaction can commit an event below an id that
+was already read. Readers therefore go by `sequence` instead: once a
+transaction has committed, number_events gives its events the next
+sequence numbers while holding the ChangeSequence row, so numbers become
+visible in the order they are given and a reader that has seen n has seen
+everything below it. Events without a number are not delivered yet.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router, transaction
+from django.db.models import F, Max, Q
+
+from .models import ChangeEvent, ChangeSequence, Task, DeadlineExtensionLog
+
+
+TASK_FIELDS = ('id', 'name', 'status', 'priority', 'due_date', 'assigned_to_id', 'assigned_by_id', 'parent_task_id', 'version', 'updated_at')
+EXTENSION_FIELDS = ('id', 'task_id', 'status', 'new_deadline', 'request_by_id', 'approved_by_id', 'approved_at', 'created_at')
+
+BATCH_SIZE = 500
+
+
+def remember_previous_users(task):
+    """
+    Keep the owner and assignee the task was loaded with, when the coming save
+    changes them. Call before the save, the audit handlers reset the loaded values.
+    """
+    loaded = getattr(task, '_loaded_values', None)
+    if not loaded or task.pk is None:
+        return
+    deferred = task.get_deferred_fields()
+    task._previous_users = {
+        column: loaded.get(field)
+        for field, column in (('assigned_by_id', 'previous_owner_id'), ('assigned_to_id', 'previous_assignee_id'))
+        if field not in deferred and field in loaded and loaded[field] != getattr(task, field)
+    }
+
+
+def _build_event(instance, operation):
+    if isinstance(instance, Task):
+        return ChangeEvent(
+            model='task', object_id=instance.pk, operation=operation,
+            data={field: getattr(instance, field) for field in TASK_FIELDS},
+            owner_id=instance.assigned_by_id, assignee_id=instance.assigned_to_id,
+            workspace_id=instance.workspace_id, **instance.__dict__.pop('_previous_users', {}),
+        )
+
+    task = instance.task
+    return ChangeEvent(
+        model='deadlineextensionlog', object_id=instance.pk, operation=operation,
+        data={field: getattr(instance, field) for field in EXTENSION_FIELDS},
+        owner_id=task.assigned_by_id, assignee_id=task.assigned_to_id, requester_id=instance.request_by_id,
+        workspace_id=instance.workspace_id,
+    )
+
+
+def capture(instance, operation='upsert'):
+    """
+    Record one created/updated/deleted Task or DeadlineExtensionLog.
+    """
+    event = _build_event(instance, operation)
+    if operation == 'delete':
+        # The row is gone, the data only keeps its primary key
+        event.data = {'id': instance.pk}
+    event.save()
+    _number_on_commit()
+
+
+def capture_many(model, pks):
+    """
+    Record rows changed by a queryset UPDATE (no post_save is sent for those),
+    using one SELECT and one INSERT however many rows there are.
+    """
+    queryset = model.objects.filter(pk__in=pks)
+    if model is DeadlineExtensionLog:
+        queryset = queryset.select_related('task')
+    capture_all(queryset)
+
+
+def capture_all(instances):
+    """
+    Record already loaded rows that were written with bulk_update, in one INSERT.
+    """
+    events = [_build_event(instance, 'upsert') for instance in instances]
+    if events:
+        ChangeEvent.objects.bulk_create(events)
+        _number_on_commit()
+
+
+def _number_on_commit():
+    using = router.db_for_write(ChangeEvent)
+    # Robust: events left unnumbered by a failed run are numbered by the next one
+    transaction.on_commit(lambda: number_events(using), using=using, robust=True)
+
+
+def number_events(using=None):
+    """
+    Give the committed events that have no sequence number the next numbers,
+    in id order, in one short transaction holding the ChangeSequence row.
+    """
+    using = using or router.db_for_write(ChangeEvent)
+    events = ChangeEvent._base_manager.db_manager(using)
+    if not events.filter(sequence__isnull=True).exists():
+        return 0
+    counters = ChangeSequence.objects.db_manager(using)
+    with transaction.atomic(using=using):
+        # Write first: takes the row lock on Postgres, and the write lock on SQLite before anything is read
+        if not counters.filter(pk=1).update(value=F('value')):
+            counters.get_or_create(pk=1, defaults={'value': events.aggregate(Max('sequence'))['sequence__max'] or 0})
+        value = counters.select_for_update().get(pk=1).value
+        pending = [
+            ChangeEvent(pk=pk, sequence=value + number)
+            for number, pk in enumerate(events.filter(sequence__isnull=True).order_by('id').values_list('pk', flat=True), 1)
+        ]
+        events.bulk_update(pending, ['sequence'], batch_size=BATCH_SIZE)
+        counters.filter(pk=1).update(value=value + len(pending))
+    return len(pending)
+
+
+def visible_to(user):
+    """
+    Filter for the events `user` may see: anything about tasks they assigned or
+    were assigned, the change that took a task away from them, and extension
+    requests they made.
+    """
+    if user.is_superuser:
+        return Q()
+    return (
+        Q(owner_id=user.pk) | Q(assignee_id=user.pk) | Q(requester_id=user.pk)
+        | Q(previous_owner_id=user.pk) | Q(previous_assignee_id=user.pk)
+    )
+
+
+def _events(workspace_id=None):
+    # The active workspace's events, or those of `workspace_id`
+    if workspace_id is None:
+        return ChangeEvent.objects.all()
+    return ChangeEvent._base_manager.filter(workspace_id=workspace_id)
+
+
+def events_after(sequence, user=None, limit=BATCH_SIZE, workspace_id=None):
+    events = _events(workspace_id).filter(sequence__gt=sequence or 0)
+    if user is not None:
+        events = events.filter(visible_to(user))
+    return list(events.order_by('sequence')[:limit])
+
+
+def latest_sequence(workspace_id=None):
+    return _events(workspace_id).filter(sequence__isnull=False).order_by('-sequence').values_list('sequence', flat=True).first() or 0
+
+
+def format_sse(event):
+    payload = json.dumps({'op': event.operation, 'model': event.model, 'id': event.object_id, 'data': event.data}, cls=DjangoJSONEncoder)
+    return f"id: {event.sequence}\nevent: {event.model}\ndata: {payload}\n\n"
+
+
+class Subscription:
+
+    def __init__(self, user, queue_size):
+        self.user = user
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+
+class Broadcaster:
+    """
+    One database poller per process and workspace, shared by the workspace's
+    connected clients.
+    """
+
+    def __init__(self, workspace_id):
+        self.workspace_id = workspace_id
+        self.subscribers = set()
+        self.sequence = None
+        self.poller = None
+
+    @property
+    def interval(self):
+        return getattr(settings, 'TASK_FEED_POLL_INTERVAL', 1.0)
+
+    async def subscribe(self, user):
+        subscription = Subscription(user, getattr(settings, 'TASK_FEED_QUEUE_SIZE', 1000))
+        if self.poller is None or self.poller.done():
+            # Nobody was listening, so start from the current end of the log
+            self.sequence = await sync_to_async(latest_sequence)(self.workspace_id)
+            self.poller = asyncio.ensure_future(self._poll())
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, events):
+        for event in events:
+            self.sequence = event.sequence
+            for subscription in list(self.subscribers):
+                if not event.is_visible_to(subscription.user):
+                    continue
+                try:
+                    subscription.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # A client this far behind reconnects and resumes from its Last-Event-ID
+                    subscription.overflowed = True
+                    self.unsubscribe(subscription)
+
+    async def _poll(self):
+        while self.subscribers:
+            events = await sync_to_async(events_after)(self.sequence, workspace_id=self.workspace_id)
+            self.publish(events)
+            if len(events) < BATCH_SIZE:
+                await asyncio.sleep(self.interval)
+
+
+_broadcasters = {}  # workspace id -> Broadcaster
+
+
+def broadcaster_for(workspace_id):
+    if workspace_id not in _broadcasters:
+        _broadcasters[workspace_id] = Broadcaster(workspace_id)
+    return _broadcasters[workspace_id]
+
+
+async def stream(user, workspace_id, last_event_id=None):
+    """
+    Async generator of SSE frames for `user` in a workspace: first everything
+    after `last_event_id` straight from the database, then live events.
+    """
+    broadcaster = broadcaster_for(workspace_id)
+    subscription = await broadcaster.subscribe(user)
+    sent = last_event_id
+    heartbeat = getattr(settings, 'TASK_FEED_HEARTBEAT', 15)
+    try:
+        if last_event_id is not None:
+            # Catch up on what was missed while disconnected
+            while True:
+                backlog = await sync_to_async(events_after)(sent, user, workspace_id=workspace_id)
+                for event in backlog:
+                    sent = event.sequence
+                    yield format_sse(event)
+                if len(backlog) < BATCH_SIZE:
+                    break
+
+        while not subscription.overflowed:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            # Already delivered by the backlog query
+            if sent is not None and event.sequence <= sent:
+                continue
+            sent = event.sequence
+            yield format_sse(event)
+    finally:
+        broadcaster.unsubscribe(subscription)
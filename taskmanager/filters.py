@@ -1,9 +1,29 @@
 import django_filters
-from .models import Task, DeadlineExtensionLog
-from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from .models import Task, DeadlineExtensionLog, ArchivedTask
+from .tenancy import active_workspace
 import datetime
 
-class TaskFilter(django_filters.FilterSet):
+
+class WorkspaceFilterSet(django_filters.FilterSet):
+    """
+    Keeps both the filtered rows and the choices of related-object filters
+    inside the active workspace, whatever queryset the view passed in.
+    """
+    def __init__(self, data=None, queryset=None, *, request=None, prefix=None):
+        super().__init__(data, queryset, request=request, prefix=prefix)
+        workspace = active_workspace()
+        if workspace is None:
+            return
+
+        self.queryset = self.queryset.filter(workspace_id=workspace.pk)
+        for filter_ in self.filters.values():
+            choices = getattr(filter_, 'queryset', None)
+            if isinstance(choices, QuerySet) and any(field.attname == 'workspace_id' for field in choices.model._meta.concrete_fields):
+                filter_.queryset = choices.filter(workspace_id=workspace.pk)
+
+
+class TaskFilter(WorkspaceFilterSet):
     
     status = django_filters.ChoiceFilter(
         choices=Task.STATUS_CHOICES,  # Use predefined choices
@@ -38,7 +58,7 @@ class TaskFilter(django_filters.FilterSet):
         return queryset
 
 
-class DeadlineExtensionLogFilter(django_filters.FilterSet):
+class DeadlineExtensionLogFilter(WorkspaceFilterSet):
     task = django_filters.ModelChoiceFilter(
         queryset=DeadlineExtensionLog.objects.all(),
         lookup_expr='exact',
@@ -58,3 +78,14 @@ class DeadlineExtensionLogFilter(django_filters.FilterSet):
         model = DeadlineExtensionLog
         fields = ['task', 'extended_by', 'new_due_date']
 
+
+
+class ArchivedTaskFilter(WorkspaceFilterSet):
+    completed_at = django_filters.DateFromToRangeFilter(
+        label='Completed Date Range',
+        field_name='completed_at__date',
+    )
+
+    class Meta:
+        model = ArchivedTask
+        fields = ['root_id', 'assigned_to_id', 'assigned_by_id', 'priority', 'completed_at']
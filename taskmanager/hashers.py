@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the work factor taken from settings.PASSWORD_PBKDF2_ITERATIONS.
+
+    It keeps the algorithm name of Django's hasher, so every stored hash stays
+    valid. A hash made with another iteration count is re-encoded with the
+    configured one the next time its user logs in (Django's must_update).
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
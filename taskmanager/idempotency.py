@@ -0,0 +1,168 @@
+"""
+Idempotency-Key support for create endpoints.
+
+A client that retries a POST sends the same Idempotency-Key header with
+each attempt. The first attempt claims the key by inserting an
+IdempotencyKey row (unique per user and key) before the view runs, and
+stores the response status and body once it is done. Later attempts with
+the key get that response back without the view running again, marked by
+the Idempotent-Replayed header. Responses:
+
+- 409 Conflict while the first attempt is still running. The unique
+  insert serializes concurrent duplicates, exactly one of them runs.
+- 422 when the key comes with a different request (method, path,
+  workspace or body).
+
+The view runs in one transaction on the workspace's task database.
+Attempts whose transaction rolled back (an exception, validation errors
+included, or a 5xx response) release the key, so the retry runs. An
+exception raised after the commit (an on_commit callback) does not: the
+response is stored, the retry gets it and does not create a duplicate. A claim whose attempt
+died (worker killed) can be taken over after TASK_IDEMPOTENCY_LOCK_TIMEOUT
+seconds. Keys are kept for TASK_IDEMPOTENCY_TTL seconds. After that, a
+repeated key counts as new, and `manage.py purge_idempotency_keys` (cron,
+e.g. hourly) deletes the rows.
+
+The keys live in the default database, the writes of the request may not:
+if a worker dies between committing the task and storing the response, a
+retry after the lock timeout runs again.
+"""
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, router, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey, Task
+
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+TTL = 24 * 60 * 60  # seconds, when TASK_IDEMPOTENCY_TTL is not set
+LOCK_TIMEOUT = 60  # seconds, when TASK_IDEMPOTENCY_LOCK_TIMEOUT is not set
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(request):
+    workspace = getattr(request, 'workspace', None)
+    payload = json.dumps(
+        [request.method, request.path, workspace.pk if workspace is not None else None, request.data],
+        sort_keys=True, cls=DjangoJSONEncoder,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _abandoned(moment):
+    # Expired keys and claims whose request never finished
+    lock_timeout = getattr(settings, 'TASK_IDEMPOTENCY_LOCK_TIMEOUT', LOCK_TIMEOUT)
+    return Q(expires_at__lte=moment) | Q(status_code__isnull=True, created_at__lte=moment - datetime.timedelta(seconds=lock_timeout))
+
+
+def claim(user, key, request_fingerprint):
+    """
+    (IdempotencyKey, True) if this request now owns the key, or the existing
+    row and False if another request with the key came first.
+    """
+    using = router.db_for_write(IdempotencyKey)
+    ttl = getattr(settings, 'TASK_IDEMPOTENCY_TTL', TTL)
+    while True:
+        moment = now()
+        try:
+            with transaction.atomic(using=using):
+                record = IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=request_fingerprint,
+                    expires_at=moment + datetime.timedelta(seconds=ttl),
+                )
+            return record, True
+        except IntegrityError:
+            pass
+
+        existing = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if existing is None:
+            continue  # Released in between
+        # Only the request that deletes an abandoned row retries the insert
+        if IdempotencyKey.objects.filter(_abandoned(moment), pk=existing.pk).delete()[0]:
+            continue
+        return existing, False
+
+
+def replay(record):
+    response = Response(record.response, status=record.status_code)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def run(request, key, execute):
+    """
+    The response of `execute()` for the first request with `key`, the stored
+    one for the following requests.
+    """
+    if len(key) > MAX_KEY_LENGTH:
+        return Response({HEADER: f'Must be at most {MAX_KEY_LENGTH} characters.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    request_fingerprint = fingerprint(request)
+    record, claimed = claim(request.user, key, request_fingerprint)
+    if not claimed:
+        if record.fingerprint != request_fingerprint:
+            return Response({'detail': f'This {HEADER} was already used for a different request.'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if record.status_code is None:
+            return Response(
+                {'detail': f'A request with this {HEADER} is still being processed.'},
+                status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'},
+            )
+        return replay(record)
+
+    using = router.db_for_write(Task)
+    committed = []
+    try:
+        with transaction.atomic(using=using):
+            # Registered first, so it runs before any callback that could fail
+            transaction.on_commit(lambda: committed.append(True), using=using)
+            response = execute()
+            if response.status_code >= 500:
+                transaction.set_rollback(True, using=using)
+    except Exception:
+        if committed:
+            store(record, response)
+        else:
+            record.delete()
+        raise
+    if response.status_code >= 500:
+        record.delete()
+        return response
+
+    store(record, response)
+    return response
+
+
+def store(record, response):
+    record.status_code = response.status_code
+    record.response = response.data
+    record.save(update_fields=['status_code', 'response'])
+
+
+def purge_expired(moment=None):
+    """
+    Delete the expired keys and abandoned claims. Returns how many.
+    """
+    return IdempotencyKey.objects.filter(_abandoned(moment or now())).delete()[0]
+
+
+class IdempotentCreateMixin:
+    """
+    For create views: POSTs with an Idempotency-Key header run at most once
+    per user and key, see above.
+    """
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        return run(request, key, lambda: super(IdempotentCreateMixin, self).create(request, *args, **kwargs))
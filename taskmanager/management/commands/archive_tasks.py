@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from taskmanager import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move Completed task trees that were not touched for --days days into the archive. "
+        "Runs in small batches with short transactions, can be stopped and rerun at any time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=archive.ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE, help="Root tasks per transaction.")
+
+    def handle(self, *args, **options):
+        archived = archive.archive(options['days'], options['batch_size'])
+        self.stdout.write(f"Archived {archived} task(s).")
@@ -0,0 +1,99 @@
+import copy
+import importlib.util
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import ConnectionHandler
+
+from task_managment import database
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test of the connection handling: simulated requests (connection check at "
+        "request start, one query, connection check at request end, as Django's request "
+        "signals do) from several threads, with a new connection per request, persistent "
+        "connections (CONN_MAX_AGE) and, on Postgres with psycopg-pool, a connection pool. "
+        "Point --url at a local Postgres container to measure the connection set-up cost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Database URL (default: the 'default' database).")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per thread.")
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--query', default='SELECT 1')
+
+    def modes(self, config):
+        per_request = dict(copy.deepcopy(config), CONN_MAX_AGE=0)
+        per_request['OPTIONS'].pop('pool', None)
+        persistent = dict(copy.deepcopy(per_request), CONN_MAX_AGE=600)
+        yield 'per request', per_request
+        yield 'persistent', persistent
+        if config['ENGINE'] == database.POSTGRES:
+            if importlib.util.find_spec('psycopg_pool') is None:
+                self.stderr.write("psycopg-pool is not installed, skipping the pool.")
+                return
+            pooled = copy.deepcopy(per_request)
+            pooled['OPTIONS']['pool'] = config['OPTIONS'].get('pool') or {'min_size': 1, 'max_size': self.threads}
+            yield 'pool', pooled
+
+    def handle(self, *args, **options):
+        if options['url']:
+            config = database.parse_url(options['url'])
+        else:
+            config = {key: value for key, value in connections.settings['default'].items() if key != 'TEST'}
+        self.threads = options['threads']
+
+        self.stdout.write(f"{config['ENGINE']} {config['NAME']}, {options['threads']} threads x {options['requests']} requests")
+        self.stdout.write(f"{'mode':<12} {'req/s':>8} {'avg ms':>8} {'p95 ms':>8} {'connect ms':>11} {'connects':>9}")
+        for mode, mode_config in self.modes(config):
+            self.bench(mode, mode_config, options)
+
+    def bench(self, mode, config, options):
+        alias = 'bench_' + mode.replace(' ', '_')
+        # Its own alias keeps the pool apart from the ones of the configured databases
+        handler = ConnectionHandler({'default': {'ENGINE': 'django.db.backends.dummy'}, alias: config})
+
+        def worker():
+            # The handler keeps one connection per thread, like the request threads of a worker
+            connection = handler[alias]
+            latencies, connect_time, connects = [], 0.0, 0
+            try:
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    connection.close_if_unusable_or_obsolete()  # request_started
+                    if connection.connection is None:
+                        connects += 1
+                        connect_started = time.perf_counter()
+                        connection.ensure_connection()
+                        connect_time += time.perf_counter() - connect_started
+                    with connection.cursor() as cursor:
+                        cursor.execute(options['query'])
+                        cursor.fetchall()
+                    connection.close_if_unusable_or_obsolete()  # request_finished
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+            return latencies, connect_time, connects
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(options['threads']) as executor:
+                results = list(executor.map(lambda _: worker(), range(options['threads'])))
+        except Exception as error:
+            raise CommandError(f"{mode}: {error}")
+        finally:
+            if 'pool' in config['OPTIONS']:
+                handler[alias].close_pool()
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for result in results for latency in result[0])
+        connect_time = sum(result[1] for result in results)
+        connects = sum(result[2] for result in results)
+        self.stdout.write(
+            f"{mode:<12} {len(latencies) / elapsed:>8.0f} {statistics.mean(latencies) * 1e3:>8.3f} "
+            f"{latencies[int(len(latencies) * 0.95)] * 1e3:>8.3f} {connect_time / len(latencies) * 1e3:>11.3f} {connects:>9}"
+        )
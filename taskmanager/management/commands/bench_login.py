@@ -0,0 +1,69 @@
+import time
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from taskmanager.serializers import LoginSerializer
+from taskmanager.views import LoginAPIView
+
+
+class Command(BaseCommand):
+    help = (
+        "Logins per second on one core, split into serializer, authenticate() and token "
+        "issuance, for the configured PBKDF2 work factor and the ones given with --iterations. "
+        "The test user is created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20)
+        parser.add_argument('--iterations', type=int, nargs='*', default=[], help="Other PBKDF2 iteration counts to compare.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'iterations':>10} {'serializer':>11} {'authenticate':>13} {'token':>8} {'full view':>10} {'logins/s':>9}")
+        for iterations in [None] + options['iterations']:
+            with override_settings(PASSWORD_PBKDF2_ITERATIONS=iterations) if iterations else override_settings():
+                self.bench(options['logins'])
+
+    def bench(self, logins):
+        from django.conf import settings
+
+        payload = {'username': 'bench-login', 'password': 'correct horse battery staple'}
+        with transaction.atomic():
+            user = User.objects.create_user(email='bench@example.com', **payload)
+
+            timings = {'serializer': 0.0, 'authenticate': 0.0, 'token': 0.0}
+            for _ in range(logins):
+                started = time.perf_counter()
+                serializer = LoginSerializer(data=payload)
+                serializer.is_valid(raise_exception=True)
+                timings['serializer'] += time.perf_counter() - started
+
+                started = time.perf_counter()
+                user = authenticate(**serializer.validated_data)
+                timings['authenticate'] += time.perf_counter() - started
+
+                started = time.perf_counter()
+                str(AccessToken.for_user(user))
+                timings['token'] += time.perf_counter() - started
+
+            # The whole view, without throttling, as a client sees it
+            view = LoginAPIView.as_view(throttle_classes=[])
+            factory = APIRequestFactory()
+            started = time.perf_counter()
+            for _ in range(logins):
+                response = view(factory.post('/login/', payload, format='json'))
+                assert response.status_code == 200, response.data
+            full = (time.perf_counter() - started) / logins
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"{settings.PASSWORD_PBKDF2_ITERATIONS:>10} "
+            f"{timings['serializer'] / logins * 1e6:>9.0f}µs {timings['authenticate'] / logins * 1e3:>11.1f}ms "
+            f"{timings['token'] / logins * 1e6:>6.0f}µs {full * 1e3:>8.1f}ms {1 / full:>9.1f}"
+        )
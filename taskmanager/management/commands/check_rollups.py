@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from taskmanager import rollup, tenancy
+from taskmanager.management.commands.rebuild_rollups import workspaces
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the stored subtask rollups with ones computed from scratch and list the tasks "
+        "that differ. Fails when any does, so it can run in monitoring; fix them with rebuild_rollups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('workspaces', nargs='*', help="Workspace slugs (default: all).")
+        parser.add_argument('--limit', type=int, default=20, help="Mismatches to list per workspace.")
+
+    def handle(self, *args, **options):
+        total = 0
+        for workspace in workspaces(options['workspaces']):
+            with tenancy.activate(workspace):
+                wrong = rollup.mismatches()
+            total += len(wrong)
+            self.stdout.write(f"{workspace.slug}: {len(wrong)} mismatch(es).")
+            for task_id, stored, expected in wrong[:options['limit']]:
+                expected = expected or "unreachable (parent cycle)"
+                self.stdout.write(f"  task {task_id}: stored {stored}, expected {expected}")
+        if total:
+            raise CommandError(f"{total} task(s) with a wrong rollup.")
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# What a fresh process runs before it can answer: each stage includes the previous ones
+STAGES = (
+    ('setup', "import django; django.setup()"),
+    ('wsgi', "from django.core.wsgi import get_wsgi_application; get_wsgi_application()"),
+    # Django loads the URLconf (and with it every view) on the first request
+    ('first request', "from django.core.wsgi import get_wsgi_application; get_wsgi_application(); "
+                      "from django.urls import get_resolver; get_resolver().url_patterns"),
+)
+
+OWN_PACKAGES = ('taskmanager', 'task_managment')
+
+
+def parse_importtime(output):
+    """
+    `python -X importtime` lines as (module, self µs, cumulative µs, depth).
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        "Time how long a fresh worker process takes to boot (settings, apps, WSGI "
+        "application, URLconf) with `python -X importtime`, list the most expensive "
+        "imports and fail when it goes past TASK_STARTUP_BUDGET_MS, for use in CI."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help="Boots per stage, the fastest counts.")
+        parser.add_argument('--top', type=int, default=15, help="Imports to list.")
+        parser.add_argument('--budget-ms', type=float, default=getattr(settings, 'TASK_STARTUP_BUDGET_MS', None))
+
+    def boot(self, code):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'task_managment.settings'))
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        elapsed = time.perf_counter() - started
+        if result.returncode:
+            raise CommandError(f"Booting failed:\n{result.stderr[-2000:]}")
+        return elapsed, parse_importtime(result.stderr)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'stage':<14} {'wall ms':>8} {'imports ms':>10} {'own ms':>7}")
+        for stage, code in STAGES:
+            # The fastest run is the least disturbed by the rest of the machine
+            wall, modules = min((self.boot(code) for _ in range(options['runs'])), key=lambda run: run[0])
+            imports = sum(self_us for name, self_us, cumulative_us, depth in modules)
+            own = sum(self_us for name, self_us, cumulative_us, depth in modules if name.split('.')[0] in OWN_PACKAGES)
+            self.stdout.write(f"{stage:<14} {wall * 1e3:>8.0f} {imports / 1e3:>10.0f} {own / 1e3:>7.1f}")
+
+        self.stdout.write(f"\nMost expensive imports ({stage}, cumulative):")
+        top_level = sorted((module for module in modules if module[3] == 0), key=lambda module: -module[2])
+        for name, self_us, cumulative_us, depth in top_level[:options['top']]:
+            self.stdout.write(f"  {cumulative_us / 1e3:8.1f} ms  {name}")
+
+        budget = options['budget_ms']
+        if budget and wall * 1e3 > budget:
+            raise CommandError(f"Worker start-up took {wall * 1e3:.0f} ms, over the budget of {budget:.0f} ms.")
+        if budget:
+            self.stdout.write(f"\nWithin the budget of {budget:.0f} ms.")
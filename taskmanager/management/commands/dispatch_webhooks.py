@@ -0,0 +1,32 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from taskmanager.webhooks import Dispatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the queued webhook deliveries, concurrently, retrying failed ones with backoff. "
+        "Runs until stopped; run one per host, several dispatchers share the queue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Send one batch of due deliveries and exit.")
+        parser.add_argument('--interval', type=float, help="Seconds between polls (default: TASK_WEBHOOK_POLL_INTERVAL).")
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher()
+        if options['once']:
+            async def once():
+                try:
+                    return await dispatcher.run_once()
+                finally:
+                    dispatcher.pool.close()
+            sent = asyncio.run(once())
+            self.stdout.write(f"Attempted {sent} deliveries.")
+            return
+        try:
+            asyncio.run(dispatcher.run(options['interval']))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,29 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from taskmanager import recurrence
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the tasks (and subtask trees) of every recurring template occurrence "
+        "that is due, up to --days-ahead days from today. Safe to rerun, run it daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days-ahead', type=int, default=recurrence.LEAD_DAYS)
+        parser.add_argument('--until', help="Materialize up to this date (YYYY-MM-DD) instead of --days-ahead.")
+        parser.add_argument('--chunk-size', type=int, default=recurrence.CHUNK_SIZE, help="Root templates per transaction.")
+
+    def handle(self, *args, **options):
+        if options['until']:
+            try:
+                until = datetime.date.fromisoformat(options['until'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['until']}")
+        else:
+            until = datetime.date.today() + datetime.timedelta(days=options['days_ahead'])
+
+        created = recurrence.materialize(until, chunk_size=options['chunk_size'])
+        self.stdout.write(f"Created {created} task(s) up to {until}.")
@@ -0,0 +1,74 @@
+import io
+import os
+import pstats
+
+from django.core.management.base import BaseCommand, CommandError
+
+from taskmanager import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        "List the request profiles captured by ProfilingMiddleware, summarize them per "
+        "endpoint (--summary) or show one of them: its phases and hottest functions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help="Capture to show, as printed by the list.")
+        parser.add_argument('--summary', action='store_true', help="Aggregate the captures per method and path.")
+        parser.add_argument('--sort', default='cumulative', choices=['cumulative', 'tottime', 'ncalls'])
+        parser.add_argument('--limit', type=int, default=25, help="Functions to print for one capture.")
+        parser.add_argument('--dir', help="Capture directory (default: TASK_PROFILING_DIR).")
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or profiling.profile_dir()
+        found = profiling.captures(directory)
+        if options['name']:
+            self.show(directory, found, options)
+        elif options['summary']:
+            self.summary(found)
+        else:
+            self.list(found)
+
+    def list(self, found):
+        if not found:
+            self.stdout.write("No profiles captured.")
+            return
+        self.stdout.write(f"{'name':<41} {'status':>6} {'ms':>8} {'queries':>7} {'sql ms':>8}  {'reason':<9} request")
+        for meta in found:
+            self.stdout.write(
+                f"{meta['name']:<41} {meta['status']:>6} {meta['duration'] * 1e3:>8.1f} {meta['queries']:>7} "
+                f"{meta['sql_time'] * 1e3:>8.1f}  {meta['reason']:<9} {meta['method']} {meta['path']}"
+            )
+
+    def summary(self, found):
+        endpoints = {}
+        for meta in found:
+            endpoints.setdefault((meta['method'], meta['path'].split('?')[0]), []).append(meta)
+
+        self.stdout.write(f"{'count':>5} {'avg ms':>8} {'max ms':>8} {'queries':>7} {'sql %':>6}  request")
+        # Slowest endpoints (by total time captured) first
+        for (method, path), metas in sorted(endpoints.items(), key=lambda item: -sum(meta['duration'] for meta in item[1])):
+            total = sum(meta['duration'] for meta in metas)
+            sql = sum(meta['sql_time'] for meta in metas)
+            self.stdout.write(
+                f"{len(metas):>5} {total / len(metas) * 1e3:>8.1f} {max(meta['duration'] for meta in metas) * 1e3:>8.1f} "
+                f"{sum(meta['queries'] for meta in metas) / len(metas):>7.1f} {sql / total * 100 if total else 0:>6.1f}  {method} {path}"
+            )
+
+    def show(self, directory, found, options):
+        meta = next((meta for meta in found if meta['name'] == options['name']), None)
+        if meta is None:
+            raise CommandError(f"No profile named '{options['name']}'.")
+
+        # pstats writes partial lines, which OutputWrapper would end with newlines
+        output = io.StringIO()
+        stats = pstats.Stats(os.path.join(directory, meta['name'] + '.prof'), stream=output)
+        self.stdout.write(f"{meta['method']} {meta['path']} -> {meta['status']} ({meta['reason']}, user {meta['user']})")
+        self.stdout.write(f"  total        {meta['duration'] * 1e3:8.1f} ms")
+        for phase, seconds in profiling.phases(stats).items():
+            self.stdout.write(f"  {phase:<12} {seconds * 1e3:8.1f} ms")
+        self.stdout.write(f"  sql          {meta['sql_time'] * 1e3:8.1f} ms in {meta['queries']} queries")
+
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+        self.stdout.write(output.getvalue())
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from taskmanager import idempotency
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the Idempotency-Keys older than TASK_IDEMPOTENCY_TTL and the claims of requests "
+        "that never finished. Meant to run from cron, e.g. hourly."
+    )
+
+    def handle(self, *args, **options):
+        purged = idempotency.purge_expired()
+        self.stdout.write(f"Purged {purged} key(s).")
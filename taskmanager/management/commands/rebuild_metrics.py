@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from taskmanager import metrics
+from taskmanager.models import Workspace
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the per-developer metrics counters from the tasks' start and completion "
+        "times and the deadline extension requests, for every workspace or the given ones. "
+        "Needed once after upgrading and after restoring a backup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('workspaces', nargs='*', help="Workspace slugs (default: all).")
+        parser.add_argument('--days', type=int, help="Days to recompute (default: the longest window).")
+
+    def handle(self, *args, **options):
+        workspaces = Workspace.objects.order_by('pk')
+        if options['workspaces']:
+            workspaces = workspaces.filter(slug__in=options['workspaces'])
+            missing = set(options['workspaces']) - {workspace.slug for workspace in workspaces}
+            if missing:
+                raise CommandError(f"Unknown workspace(s): {', '.join(sorted(missing))}.")
+
+        for workspace in workspaces:
+            days = metrics.rebuild(workspace, options['days'])
+            self.stdout.write(f"{workspace.slug}: {days} developer day(s).")
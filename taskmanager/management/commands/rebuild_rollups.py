@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from taskmanager import rollup, tenancy
+from taskmanager.models import Workspace
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the subtask rollups (descendant counts, earliest descendant due date) of "
+        "every task from scratch and store the ones that differ, for every workspace or the "
+        "given ones. Needed once after upgrading."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('workspaces', nargs='*', help="Workspace slugs (default: all).")
+
+    def handle(self, *args, **options):
+        for workspace in workspaces(options['workspaces']):
+            with tenancy.activate(workspace):
+                fixed = rollup.rebuild()
+            self.stdout.write(f"{workspace.slug}: {fixed} task(s) updated.")
+
+
+def workspaces(slugs):
+    found = Workspace.objects.order_by('pk')
+    if slugs:
+        found = found.filter(slug__in=slugs)
+        missing = set(slugs) - {workspace.slug for workspace in found}
+        if missing:
+            raise CommandError(f"Unknown workspace(s): {', '.join(sorted(missing))}.")
+    return found
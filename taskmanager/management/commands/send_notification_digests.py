@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from taskmanager import notifications
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the digest email of every recipient whose oldest buffered notification is older "
+        "than TASK_NOTIFICATION_WINDOW. Meant to run from cron every minute."
+    )
+
+    def handle(self, *args, **options):
+        sent = notifications.send_due()
+        self.stdout.write(f"Sent {sent} digest(s).")
@@ -0,0 +1,96 @@
+import datetime
+import random
+import statistics
+
+from django.core.management.base import BaseCommand
+
+from taskmanager.assignment import LoadIndex, PRIORITY_WEIGHTS, task_load
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline simulation of the workload-aware assignment policy against round-robin "
+        "and random assignment. Uses synthetic tasks only, nothing touches the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--developers', type=int, default=20)
+        parser.add_argument('--days', type=int, default=60)
+        parser.add_argument('--tasks-per-day', type=int, default=40)
+        parser.add_argument('--capacity', type=int, default=6, help="Effort units a developer finishes per day.")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'policy':<12} {'done':>6} {'late':>6} {'open':>6} {'max queue':>10} {'load stdev':>11}")
+        for policy in ('load', 'round-robin', 'random'):
+            result = self.simulate(policy, options)
+            self.stdout.write(
+                f"{policy:<12} {result['done']:>6} {result['late']:>6} {result['open']:>6} "
+                f"{result['max_queue']:>10} {result['load_stdev']:>11.2f}"
+            )
+
+    def simulate(self, policy, options):
+        rng = random.Random(options['seed'])
+        developers = list(range(options['developers']))
+        priorities = list(PRIORITY_WEIGHTS)
+        start = datetime.date(2025, 1, 1)
+
+        queues = {developer: [] for developer in developers}
+        done = late = max_queue = 0
+        next_id = 0
+        load_stdevs = []
+
+        for day in range(options['days']):
+            today = start + datetime.timedelta(days=day)
+
+            # Urgency depends on the date, so the index is rebuilt daily like in production
+            index = LoadIndex(developers, built_on=today)
+            for developer, queue in queues.items():
+                for task in queue:
+                    index.set_task(task['id'], developer, task_load(task['priority'], task['due_date'], today))
+
+            arrivals = []
+            for _ in range(options['tasks_per_day']):
+                arrivals.append({
+                    'id': next_id,
+                    'priority': rng.choices(priorities, weights=[4, 3, 2, 1])[0],
+                    'due_date': today + datetime.timedelta(days=rng.randint(1, 21)),
+                    'effort': rng.randint(1, 5),
+                })
+                next_id += 1
+
+            if policy == 'load':
+                chosen = index.assign([task_load(task['priority'], task['due_date'], today) for task in arrivals])
+            elif policy == 'round-robin':
+                chosen = [task['id'] % len(developers) for task in arrivals]
+            else:
+                chosen = [rng.choice(developers) for _ in arrivals]
+
+            for task, developer in zip(arrivals, chosen):
+                queues[developer].append(task)
+
+            # Each developer works through the most urgent tasks first
+            for developer, queue in queues.items():
+                queue.sort(key=lambda task: (task['due_date'], -PRIORITY_WEIGHTS[task['priority']]))
+                capacity = options['capacity']
+                while queue and capacity > 0:
+                    task = queue[0]
+                    worked = min(capacity, task['effort'])
+                    task['effort'] -= worked
+                    capacity -= worked
+                    if task['effort'] == 0:
+                        queue.pop(0)
+                        done += 1
+                        late += today > task['due_date']
+                max_queue = max(max_queue, len(queue))
+
+            loads = [sum(task_load(task['priority'], task['due_date'], today) for task in queue) for queue in queues.values()]
+            load_stdevs.append(statistics.pstdev(loads))
+
+        return {
+            'done': done,
+            'late': late,
+            'open': sum(len(queue) for queue in queues.values()),
+            'max_queue': max_queue,
+            'load_stdev': statistics.mean(load_stdevs),
+        }
@@ -0,0 +1,220 @@
+"""
+Per-developer workload and SLA metrics: cycle time (first start to
+completion), on-time completion rate and deadline extension frequency.
+
+The metrics are never computed from the task table. Status changes (the
+`transitioned` signal) and new extension requests are folded into counters
+as they happen (see signals.py):
+
+- DeveloperDailyStats holds each developer's counters per day.
+- DeveloperMetrics holds each developer's running totals over every
+  rolling window in TASK_METRICS_WINDOWS (days), as of a date. An event
+  adds to the totals of the windows that are current.
+
+Reading a developer's metrics is a lookup of their summary row. On the
+first read of a new day, the stale rows are recomputed from the at most
+window-long run of daily rows. That is the only time days drop out of a
+window.
+
+Tasks are credited to their assignee at the time of the event. Reopening
+a task takes its completion back (the transition carries the cleared
+completion time), so a task counts once, on the day it was last completed,
+as in a rebuild. `manage.py rebuild_metrics` recomputes everything from the
+stored start/completion times and extension requests, e.g. after a restore.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.db.models import F, Sum
+from django.utils.timezone import localdate, now
+
+from . import tenancy
+from .models import DeadlineExtensionLog, DeveloperDailyStats, DeveloperMetrics, Task, default_workspace
+
+
+WINDOWS = (7, 30)
+COUNTERS = ('started', 'completed', 'completed_on_time', 'cycle_count', 'cycle_seconds', 'extensions_requested')
+
+
+def windows():
+    return tuple(getattr(settings, 'TASK_METRICS_WINDOWS', WINDOWS))
+
+
+def _merge(events):
+    merged = {}
+    for workspace_id, developer_id, day, counts in events:
+        totals = merged.setdefault((workspace_id, developer_id, day), dict.fromkeys(COUNTERS, 0))
+        for counter, value in counts.items():
+            totals[counter] += value
+    return merged
+
+
+def _completion(due_date, started_at, completed_at):
+    counts = {'completed': 1, 'completed_on_time': int(localdate(completed_at) <= due_date)}
+    if started_at is not None:
+        counts.update(cycle_count=1, cycle_seconds=(completed_at - started_at).total_seconds())
+    return counts
+
+
+def _add_day(workspace_id, developer_id, day, counts):
+    increments = {counter: F(counter) + value for counter, value in counts.items()}
+    keys = {'workspace_id': workspace_id, 'developer_id': developer_id, 'day': day}
+    if DeveloperDailyStats.objects.filter(**keys).update(**increments):
+        return True
+    if any(value < 0 for value in counts.values()):
+        return False  # Taking back a completion that was never counted (e.g. from before a rebuild)
+    try:
+        with transaction.atomic(using=router.db_for_write(DeveloperDailyStats)):
+            DeveloperDailyStats.objects.create(**keys, **counts)
+    except IntegrityError:
+        # Someone else created the day in between
+        DeveloperDailyStats.objects.filter(**keys).update(**increments)
+    return True
+
+
+def add(events, today=None):
+    """
+    Fold (workspace id, developer id, day, {counter: amount}) events into the
+    daily rows and the current window totals. Events of the same developer
+    and day are merged first, so a bulk change costs a few queries.
+    """
+    today = today or localdate()
+    for (workspace_id, developer_id, day), counts in _merge(events).items():
+        counts = {counter: value for counter, value in counts.items() if value}
+        if not counts:
+            continue
+        if not _add_day(workspace_id, developer_id, day, counts):
+            continue
+        # Windows whose summary is already as of today and reaches back to `day`;
+        # stale summaries pick the day up when they are recomputed
+        current = [window_days for window_days in windows() if (today - day).days < window_days]
+        DeveloperMetrics.objects.filter(
+            workspace_id=workspace_id, developer_id=developer_id, as_of=today, window_days__in=current,
+        ).update(**{counter: F(counter) + value for counter, value in counts.items()})
+
+
+def task_events(transitions):
+    """
+    Counter events for applied Task transitions, from the stored timestamps.
+    """
+    targets = {
+        transition.pk: transition for transition in transitions
+        if transition.target in ('In Progress', 'Completed') or transition.source == 'Completed'
+    }
+    if not targets:
+        return []
+
+    events = []
+    moment = now()
+    tasks = Task.objects.filter(pk__in=targets).values_list('pk', 'workspace_id', 'assigned_to_id', 'due_date', 'started_at', 'completed_at')
+    for pk, workspace_id, developer_id, due_date, started_at, completed_at in tasks:
+        transition = targets[pk]
+        reopened_at = (transition.previous or {}).get('completed_at')
+        if transition.source == 'Completed' and reopened_at is not None:
+            taken_back = _completion(due_date, started_at, reopened_at)
+            events.append((workspace_id, developer_id, localdate(reopened_at), {counter: -value for counter, value in taken_back.items()}))
+        if transition.target == 'In Progress' and transition.source == 'Pending':
+            events.append((workspace_id, developer_id, localdate(started_at or moment), {'started': 1}))
+        elif transition.target == 'Completed':
+            completed_at = completed_at or moment
+            events.append((workspace_id, developer_id, localdate(completed_at), _completion(due_date, started_at, completed_at)))
+    return events
+
+
+def record_transitions(transitions):
+    add(task_events(transitions))
+
+
+def extension_requested(extension):
+    add([(extension.workspace_id, extension.request_by_id, localdate(extension.created_at), {'extensions_requested': 1})])
+
+
+def refresh(developer_ids, window_days, today=None):
+    """
+    Recompute the `window_days` summaries of the developers from their daily
+    rows, for the active workspace (or the default one).
+    """
+    today = today or localdate()
+    workspace_id = default_workspace()
+    sums = {
+        row.pop('developer'): row
+        for row in DeveloperDailyStats.objects
+        .filter(workspace_id=workspace_id, developer__in=developer_ids, day__gt=today - datetime.timedelta(days=window_days), day__lte=today)
+        .values('developer')
+        .annotate(**{counter: Sum(counter) for counter in COUNTERS})
+        .order_by()
+    }
+    rows = [
+        DeveloperMetrics(
+            workspace_id=workspace_id, developer_id=developer_id, window_days=window_days, as_of=today,
+            **{counter: sums.get(developer_id, {}).get(counter) or 0 for counter in COUNTERS},
+        )
+        for developer_id in developer_ids
+    ]
+    DeveloperMetrics.objects.bulk_create(
+        rows, update_conflicts=True,
+        unique_fields=['workspace', 'developer', 'window_days'], update_fields=['as_of', *COUNTERS],
+    )
+    return rows
+
+
+def summaries(developer_ids, window_days, today=None):
+    """
+    {developer id: DeveloperMetrics} over the last `window_days` days, one
+    summary row per developer.
+    """
+    today = today or localdate()
+    rows = {
+        row.developer_id: row
+        for row in DeveloperMetrics.objects.filter(developer__in=developer_ids, window_days=window_days, as_of=today)
+    }
+    stale = [developer_id for developer_id in developer_ids if developer_id not in rows]
+    if stale:
+        rows.update((row.developer_id, row) for row in refresh(stale, window_days, today))
+    return rows
+
+
+def report(row):
+    return {
+        'developer': row.developer_id,
+        'window_days': row.window_days,
+        'as_of': row.as_of,
+        'started': row.started,
+        'completed': row.completed,
+        'on_time_rate': round(row.completed_on_time / row.completed, 3) if row.completed else None,
+        'avg_cycle_time_hours': round(row.cycle_seconds / row.cycle_count / 3600, 2) if row.cycle_count else None,
+        'extensions_requested': row.extensions_requested,
+        'extensions_per_completed_task': round(row.extensions_requested / row.completed, 3) if row.completed else None,
+    }
+
+
+def rebuild(workspace, days=None):
+    """
+    Replace the workspace's counters with ones recomputed from the tasks'
+    start/completion times and the extension requests of the last `days`
+    days (default: the longest window). Returns the number of daily rows.
+    """
+    days = days or max(windows())
+    since = now() - datetime.timedelta(days=days)
+    with tenancy.activate(workspace), tenancy.atomic():
+        DeveloperDailyStats.objects.all().delete()
+        DeveloperMetrics.objects.all().delete()
+
+        events = []
+        for developer_id, due_date, started_at, completed_at in (
+            Task.objects.filter(completed_at__gte=since).values_list('assigned_to_id', 'due_date', 'started_at', 'completed_at')
+        ):
+            events.append((workspace.pk, developer_id, localdate(completed_at), _completion(due_date, started_at, completed_at)))
+        # Only the first start of each task is stored
+        for developer_id, started_at in Task.objects.filter(started_at__gte=since).values_list('assigned_to_id', 'started_at'):
+            events.append((workspace.pk, developer_id, localdate(started_at), {'started': 1}))
+        for developer_id, created_at in DeadlineExtensionLog.objects.filter(created_at__gte=since).values_list('request_by_id', 'created_at'):
+            events.append((workspace.pk, developer_id, localdate(created_at), {'extensions_requested': 1}))
+
+        merged = _merge(events)
+        DeveloperDailyStats.objects.bulk_create([
+            DeveloperDailyStats(workspace_id=workspace_id, developer_id=developer_id, day=day, **counts)
+            for (workspace_id, developer_id, day), counts in merged.items()
+        ], batch_size=1000)
+    return len(merged)
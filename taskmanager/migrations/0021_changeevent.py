@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:35
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0020_taskevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=30)),
+                ('object_id', models.BigIntegerField()),
+                ('operation', models.CharField(choices=[('upsert', 'Created or updated'), ('delete', 'Deleted')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('owner_id', models.IntegerField(blank=True, null=True)),
+                ('assignee_id', models.IntegerField(blank=True, null=True)),
+                ('requester_id', models.IntegerField(blank=True, null=True)),
+            ],
+        ),
+    ]
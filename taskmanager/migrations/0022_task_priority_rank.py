@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+PRIORITY_RANKS = {
+    'When Free': 0,
+    'Next Week': 1,
+    'ASAP': 2,
+    'URGENT': 3,
+}
+
+
+def backfill_priority_rank(apps, schema_editor):
+    Task = apps.get_model('taskmanager', 'Task')
+    # One UPDATE per priority value instead of touching rows one by one
+    for priority, rank in PRIORITY_RANKS.items():
+        Task.objects.filter(priority=priority).update(priority_rank=rank)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0021_changeevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='priority_rank',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_priority_rank, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned_to', 'status', '-priority_rank', 'due_date'], name='task_work_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:20
+
+import datetime
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0022_task_priority_rank'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='occurrence_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='TaskTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('description', models.TextField()),
+                ('priority', models.CharField(choices=[('When Free', 'When Free'), ('Next Week', 'Next Week'), ('ASAP', 'ASAP'), ('URGENT', 'URGENT')], default='When Free', max_length=20)),
+                ('schedule', models.CharField(blank=True, max_length=100)),
+                ('due_in_days', models.PositiveIntegerField(default=0)),
+                ('starts_on', models.DateField(default=datetime.date.today)),
+                ('is_active', models.BooleanField(default=True)),
+                ('materialized_until', models.DateField(blank=True, editable=False, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('assigned_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_templates', to=settings.AUTH_USER_MODEL)),
+                ('assigned_to', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_templates_assigned', to=settings.AUTH_USER_MODEL)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='taskmanager.tasktemplate')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='template',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='taskmanager.tasktemplate'),
+        ),
+        migrations.AddIndex(
+            model_name='tasktemplate',
+            index=models.Index(fields=['parent', 'is_active', 'id'], name='tasktemplate_roots_idx'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:45
+
+import django.db.models.deletion
+import taskmanager.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_into_default_workspace(apps, schema_editor):
+    # Everything that exists so far belongs to one organization
+    Workspace = apps.get_model('taskmanager', 'Workspace')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    workspace, _ = Workspace.objects.get_or_create(slug='default', defaults={'name': 'Default'})
+    workspace.members.add(*User.objects.values_list('pk', flat=True))
+    for model in ('Task', 'DeadlineExtensionLog', 'TaskTemplate'):
+        apps.get_model('taskmanager', model).objects.filter(workspace__isnull=True).update(workspace=workspace)
+    for model in ('TaskEvent', 'ChangeEvent'):
+        apps.get_model('taskmanager', model).objects.filter(workspace_id__isnull=True).update(workspace_id=workspace.pk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0023_tasktemplate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Workspace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('slug', models.SlugField(unique=True)),
+                ('database', models.CharField(default='default', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='changeevent',
+            name='workspace_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='taskevent',
+            name='workspace_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(fields=['workspace_id', 'id'], name='changeevent_ws_seq_idx'),
+        ),
+        migrations.AddField(
+            model_name='workspace',
+            name='members',
+            field=models.ManyToManyField(blank=True, related_name='workspaces', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='deadlineextensionlog',
+            name='workspace',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='deadline_extension_logs', to='taskmanager.workspace'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='workspace',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='tasks', to='taskmanager.workspace'),
+        ),
+        migrations.AddField(
+            model_name='tasktemplate',
+            name='workspace',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='task_templates', to='taskmanager.workspace'),
+        ),
+        migrations.RunPython(move_into_default_workspace, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='deadlineextensionlog',
+            name='workspace',
+            field=models.ForeignKey(default=taskmanager.models.default_workspace, on_delete=django.db.models.deletion.PROTECT, related_name='deadline_extension_logs', to='taskmanager.workspace'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='workspace',
+            field=models.ForeignKey(default=taskmanager.models.default_workspace, on_delete=django.db.models.deletion.PROTECT, related_name='tasks', to='taskmanager.workspace'),
+        ),
+        migrations.AlterField(
+            model_name='tasktemplate',
+            name='workspace',
+            field=models.ForeignKey(default=taskmanager.models.default_workspace, on_delete=django.db.models.deletion.PROTECT, related_name='task_templates', to='taskmanager.workspace'),
+        ),
+        migrations.AddIndex(
+            model_name='deadlineextensionlog',
+            index=models.Index(fields=['workspace', 'status', 'new_deadline'], name='extlog_ws_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['workspace', 'status', 'due_date'], name='task_ws_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['workspace', 'assigned_by', 'status'], name='task_ws_owner_idx'),
+        ),
+    ]
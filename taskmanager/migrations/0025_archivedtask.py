@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-19 20:30
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0024_workspace'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTask',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('root_id', models.BigIntegerField()),
+                ('parent_task_id', models.BigIntegerField(blank=True, null=True)),
+                ('depth', models.PositiveSmallIntegerField(default=0)),
+                ('name', models.CharField(max_length=200)),
+                ('priority', models.CharField(choices=[('When Free', 'When Free'), ('Next Week', 'Next Week'), ('ASAP', 'ASAP'), ('URGENT', 'URGENT')], max_length=20)),
+                ('due_date', models.DateField()),
+                ('assigned_to_id', models.IntegerField()),
+                ('assigned_by_id', models.IntegerField()),
+                ('completed_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_tasks', to='taskmanager.workspace')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['workspace', 'root_id'], name='archivedtask_ws_root_idx'), models.Index(fields=['workspace', 'completed_at'], name='archivedtask_ws_completed_idx'), models.Index(fields=['workspace', 'assigned_to_id', 'completed_at'], name='archivedtask_ws_assignee_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-19 21:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0026_notification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['workspace', 'due_date', 'status', 'created_at', 'parent_task', 'id'], name='task_ws_timeline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['workspace', 'assigned_to', 'due_date', 'status', 'created_at', 'parent_task', 'id'], name='task_ws_assignee_timeline_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:18
+
+import django.db.models.deletion
+import taskmanager.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_completed_at(apps, schema_editor):
+    Task = apps.get_model('taskmanager', 'Task')
+    # The last update of a completed task is the best guess there is
+    Task.objects.filter(status='Completed').update(completed_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0027_task_timeline_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='started_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='DeveloperDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('completed_on_time', models.PositiveIntegerField(default=0)),
+                ('cycle_count', models.PositiveIntegerField(default=0)),
+                ('cycle_seconds', models.FloatField(default=0)),
+                ('extensions_requested', models.PositiveIntegerField(default=0)),
+                ('day', models.DateField()),
+                ('developer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('workspace', models.ForeignKey(default=taskmanager.models.default_workspace, on_delete=django.db.models.deletion.CASCADE, to='taskmanager.workspace')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('workspace', 'developer', 'day'), name='developerdailystats_unique_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeveloperMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('completed_on_time', models.PositiveIntegerField(default=0)),
+                ('cycle_count', models.PositiveIntegerField(default=0)),
+                ('cycle_seconds', models.FloatField(default=0)),
+                ('extensions_requested', models.PositiveIntegerField(default=0)),
+                ('window_days', models.PositiveSmallIntegerField()),
+                ('as_of', models.DateField()),
+                ('developer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('workspace', models.ForeignKey(default=taskmanager.models.default_workspace, on_delete=django.db.models.deletion.CASCADE, to='taskmanager.workspace')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('workspace', 'developer', 'window_days'), name='developermetrics_unique_window')],
+            },
+        ),
+    ]
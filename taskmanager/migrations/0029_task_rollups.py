@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0028_developer_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='completed_descendant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='descendant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='earliest_descendant_due',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+    ]
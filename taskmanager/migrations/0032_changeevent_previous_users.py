@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-19 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0031_webhooks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changeevent',
+            name='previous_assignee_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='changeevent',
+            name='previous_owner_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
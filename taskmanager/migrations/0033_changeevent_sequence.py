@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-19 21:40
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_events(apps, schema_editor):
+    ChangeEvent = apps.get_model('taskmanager', 'ChangeEvent')
+    ChangeSequence = apps.get_model('taskmanager', 'ChangeSequence')
+    # Existing events keep their id as sequence number, so the cursors clients hold stay valid
+    ChangeEvent.objects.update(sequence=F('id'))
+    ChangeSequence.objects.create(value=ChangeEvent.objects.aggregate(Max('id'))['id__max'] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0032_changeevent_previous_users'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='changeevent',
+            name='changeevent_ws_seq_idx',
+        ),
+        migrations.AddField(
+            model_name='changeevent',
+            name='sequence',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.RunPython(number_existing_events, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(fields=['workspace_id', 'sequence'], name='changeevent_ws_sequence_idx'),
+        ),
+    ]
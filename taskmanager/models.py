@@ -1,8 +1,13 @@
-from django.db import models
-from django.core.exceptions import ValidationError
+import datetime
+
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
-from django.conf import settings
-from django.core.mail import send_mail
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.timezone import now
+from .tenancy import active_workspace
 # from django.contrib.auth.models import AbstractUser
 
 
@@ -10,6 +15,48 @@ from django.core.mail import send_mail
 #     is_manager = models.BooleanField(default=False)  # Add a flag for managerial users
 
 
+class StaleVersionError(Exception):
+    """
+    The row was changed by someone else since it was read.
+    """
+
+
+class Workspace(models.Model):
+    """
+    A customer organization. Its members only see its tasks (see tenancy.py).
+    """
+    name = models.CharField(max_length=200)
+    slug = models.SlugField(unique=True)
+    members = models.ManyToManyField(User, blank=True, related_name='workspaces')
+    database = models.CharField(max_length=100, default='default')  # Alias in settings.DATABASES holding its tasks
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+def default_workspace():
+    """
+    The active workspace, or the built-in one outside of a workspace (admin, shell, commands).
+    """
+    workspace = active_workspace()
+    if workspace is not None:
+        return workspace.pk
+    return Workspace.objects.get_or_create(slug='default', defaults={'name': 'Default'})[0].pk
+
+
+class WorkspaceManager(models.Manager):
+    """
+    Only returns the active workspace's rows, when one is active.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        workspace = active_workspace()
+        if workspace is not None:
+            queryset = queryset.filter(workspace_id=workspace.pk)
+        return queryset
+
+
 class Task(models.Model):
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
@@ -23,11 +70,21 @@ class Task(models.Model):
         ('ASAP', 'ASAP'),
         ('URGENT', 'URGENT'),  # highest priority
     ]
+
+    # Numeric sort key for priority, higher is more urgent
+    PRIORITY_RANKS = {
+        'When Free': 0,
+        'Next Week': 1,
+        'ASAP': 2,
+        'URGENT': 3,
+    }
     
+    workspace = models.ForeignKey(Workspace, on_delete=models.PROTECT, default=default_workspace, related_name='tasks')
     name = models.CharField(max_length=200)
     description = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default='When Free')
+    priority_rank = models.PositiveSmallIntegerField(default=0, editable=False)  # Kept in sync with priority by save()
     due_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -35,10 +92,97 @@ class Task(models.Model):
     deadline_extension_logs = models.ManyToManyField('DeadlineExtensionLog', blank=True, related_name='tasks_with_extension')
     assigned_to = models.ForeignKey(User, on_delete=models.CASCADE, null=False, blank=False, related_name='tasks_assigned')
     assigned_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="assigned_tasks")
+    version = models.PositiveIntegerField(default=1)  # Bumped on every update, used for optimistic locking
+    template = models.ForeignKey('TaskTemplate', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='occurrences')
+    occurrence_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)  # "<template id>:<date>", makes materializing idempotent
+    started_at = models.DateTimeField(null=True, blank=True, editable=False)  # First move to In Progress
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False)  # Last move to Completed, cleared when reopened
+    # Subtask progress over the whole tree below the task, kept on write by rollup.py
+    descendant_count = models.PositiveIntegerField(default=0, editable=False)
+    completed_descendant_count = models.PositiveIntegerField(default=0, editable=False)
+    earliest_descendant_due = models.DateField(null=True, blank=True, editable=False)
+
+    objects = WorkspaceManager()
+
+    class Meta:
+        indexes = [
+            # "What should I do next": one range scan per assignee and status, already in priority order
+            models.Index(fields=['assigned_to', 'status', '-priority_rank', 'due_date'], name='task_work_queue_idx'),
+            # Tenant-leading, so a workspace's lists never scan other workspaces' rows
+            models.Index(fields=['workspace', 'status', 'due_date'], name='task_ws_status_due_idx'),
+            models.Index(fields=['workspace', 'assigned_by', 'status'], name='task_ws_owner_idx'),
+            # Covering indexes for the timeline (timeline.py): every column it reads is in the index
+            models.Index(fields=['workspace', 'due_date', 'status', 'created_at', 'parent_task', 'id'], name='task_ws_timeline_idx'),
+            models.Index(fields=['workspace', 'assigned_to', 'due_date', 'status', 'created_at', 'parent_task', 'id'], name='task_ws_assignee_timeline_idx'),
+        ]
 
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        self.priority_rank = self.PRIORITY_RANKS.get(self.priority, 0)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'priority' in update_fields:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'priority_rank'}
+        if (update_fields is None or 'status' in update_fields) and 'status' not in self.get_deferred_fields():
+            if self.stamp_status() and update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'started_at', 'completed_at'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def status_stamps(cls, status, moment):
+        """
+        started_at / completed_at values for a task moving to `status`, as
+        expressions so bulk UPDATEs can use them too.
+        """
+        stamps = {'completed_at': moment if status == 'Completed' else None}
+        if status == 'In Progress':
+            stamps['started_at'] = Coalesce(F('started_at'), Value(moment))
+        return stamps
+
+    def stamp_status(self):
+        """
+        Set started_at / completed_at when the status differs from the loaded
+        one. Returns whether the status changed.
+        """
+        loaded = getattr(self, '_loaded_values', None) or {}
+        if self.status == loaded.get('status'):
+            return False
+        moment = now()
+        if self.status == 'In Progress' and self.started_at is None:
+            self.started_at = moment
+        self.completed_at = moment if self.status == 'Completed' else None
+        return True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep what was loaded so post_save can record only the fields that changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save_versioned(self, expected_version=None, update_fields=None):
+        """
+        Save the task only if its stored version still equals `expected_version`
+        (defaults to the version this instance was loaded with).
+
+        The conditional UPDATE ... WHERE version = expected claims the row first,
+        so of two concurrent writers exactly one wins and the other gets a
+        StaleVersionError instead of silently overwriting the first one.
+        """
+        if expected_version is None:
+            expected_version = self.version
+
+        with transaction.atomic(using=self._state.db):
+            claimed = Task.objects.using(self._state.db).filter(pk=self.pk, version=expected_version).update(version=F('version') + 1)
+            if not claimed:
+                raise StaleVersionError(f"Task {self.pk} is no longer at version {expected_version}.")
+
+            self.version = expected_version + 1
+            if update_fields is not None:
+                update_fields = set(update_fields) | {'version', 'updated_at'}
+            self.save(update_fields=update_fields)
     
     
 
@@ -46,6 +190,38 @@ class Task(models.Model):
 
 
 
+class TaskTemplate(models.Model):
+    """
+    A recurring task. Root templates carry the schedule, child templates (via
+    `parent`) describe the subtask tree created with every occurrence.
+    See recurrence.py for the schedule syntax and the materializer.
+    """
+    workspace = models.ForeignKey(Workspace, on_delete=models.PROTECT, default=default_workspace, related_name='task_templates')
+    name = models.CharField(max_length=200)
+    description = models.TextField()
+    priority = models.CharField(max_length=20, choices=Task.PRIORITY_CHOICES, default='When Free')
+    schedule = models.CharField(max_length=100, blank=True)  # "day-of-month month day-of-week", roots only
+    due_in_days = models.PositiveIntegerField(default=0)  # Due date of the task, counted from the occurrence date
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
+    assigned_to = models.ForeignKey(User, on_delete=models.CASCADE, related_name='task_templates_assigned')
+    assigned_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='task_templates')
+    starts_on = models.DateField(default=datetime.date.today)
+    is_active = models.BooleanField(default=True)
+    materialized_until = models.DateField(null=True, blank=True, editable=False)  # Last date already expanded into tasks
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = WorkspaceManager()
+
+    class Meta:
+        indexes = [
+            # The materializer walks active root templates in primary key order
+            models.Index(fields=['parent', 'is_active', 'id'], name='tasktemplate_roots_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
 class DeadlineExtensionLog(models.Model):
 
     STATUS_CHOICES = [
@@ -54,6 +230,7 @@ class DeadlineExtensionLog(models.Model):
         ('REJECTED', 'Rejected'),
     ]
 
+    workspace = models.ForeignKey(Workspace, on_delete=models.PROTECT, default=default_workspace, related_name='deadline_extension_logs')
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='extension_logs')
     reason = models.TextField()  # Reason for the extension
     new_deadline = models.DateField()
@@ -62,8 +239,317 @@ class DeadlineExtensionLog(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     approved_by= models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='approvals')
     approved_at = models.DateTimeField(null=True, blank=True)
+
+    objects = WorkspaceManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['workspace', 'status', 'new_deadline'], name='extlog_ws_status_idx'),
+        ]
     
     def __str__(self):
         return f"Deadline extension request by {self.request_by.username} for {self.task.name} - {self.status}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            # A request always lives in its task's workspace
+            self.workspace_id = self.task.workspace_id
+        super().save(*args, **kwargs)
+
+
+class ArchivedTask(models.Model):
+    """
+    A task moved out of the hot Task table by the archiver (see archive.py).
+    The columns are the ones the archive is searched by, `data` holds the
+    rest of the task and its extension logs.
+    """
+    id = models.BigIntegerField(primary_key=True)  # The task's own id, kept when it is restored
+    workspace = models.ForeignKey(Workspace, on_delete=models.PROTECT, related_name='archived_tasks')
+    root_id = models.BigIntegerField()  # Trees are archived and restored as a whole
+    parent_task_id = models.BigIntegerField(null=True, blank=True)
+    depth = models.PositiveSmallIntegerField(default=0)
+    name = models.CharField(max_length=200)
+    priority = models.CharField(max_length=20, choices=Task.PRIORITY_CHOICES)
+    due_date = models.DateField()
+    assigned_to_id = models.IntegerField()
+    assigned_by_id = models.IntegerField()
+    completed_at = models.DateTimeField()  # Last update of the task before it was archived
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+
+    objects = WorkspaceManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['workspace', 'root_id'], name='archivedtask_ws_root_idx'),
+            models.Index(fields=['workspace', 'completed_at'], name='archivedtask_ws_completed_idx'),
+            models.Index(fields=['workspace', 'assigned_to_id', 'completed_at'], name='archivedtask_ws_assignee_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class TaskEventQuerySet(models.QuerySet):
+
+    def for_task(self, task_id, until=None):
+        events = self.filter(task_id=task_id)
+        if until is not None:
+            events = events.filter(created_at__lte=until)
+        return events.order_by('created_at', 'id')
+
+    def state_at(self, task_id, moment):
+        """
+        Rebuild the audited fields of a task as they were at `moment` by replaying
+        its diffs in order. Returns None if the task did not exist (yet or anymore).
+        """
+        state = {}
+        for changes in self.for_task(task_id, until=moment).values_list('changes', flat=True):
+            state.update(changes)
+
+        if not state or state.get('deleted'):
+            return None
+        return state
+
+
+class TaskEvent(models.Model):
+    """
+    Append-only history of task changes. Each row holds only the fields that
+    changed (the first row of a task holds its initial values).
+    """
+    # No FK constraint and no cascade: the history has to outlive the task
+    task = models.ForeignKey(Task, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='events')
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='task_events')
+    created_at = models.DateTimeField()
+    changes = models.JSONField(encoder=DjangoJSONEncoder)
+    workspace_id = models.IntegerField(null=True, blank=True)  # No FK, like task
+
+    objects = WorkspaceManager.from_queryset(TaskEventQuerySet)()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['task', 'created_at'], name='taskevent_task_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Task {self.task_id} changed at {self.created_at}: {', '.join(self.changes)}"
 
+
+class ChangeEvent(models.Model):
+    """
+    Sequence-numbered change data capture of Task and DeadlineExtensionLog rows.
+    `sequence` is the number clients resume from. It is given once the event's
+    transaction has committed (see feed.py), so unlike the primary key it
+    follows the commit order. The user columns say who may see the event
+    without joining back to the (possibly deleted) row.
+    """
+    OPERATION_CHOICES = [
+        ('upsert', 'Created or updated'),
+        ('delete', 'Deleted'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    sequence = models.BigIntegerField(null=True, blank=True, unique=True)  # None until numbered after the commit
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    owner_id = models.IntegerField(null=True, blank=True)  # task.assigned_by
+    assignee_id = models.IntegerField(null=True, blank=True)  # task.assigned_to
+    requester_id = models.IntegerField(null=True, blank=True)  # extension request_by
+    # The task's owner and assignee before this change, when it changed them: they get the event (a tombstone) too
+    previous_owner_id = models.IntegerField(null=True, blank=True)
+    previous_assignee_id = models.IntegerField(null=True, blank=True)
+    workspace_id = models.IntegerField(null=True, blank=True)
+
+    objects = WorkspaceManager()
+
+    class Meta:
+        indexes = [
+            # A workspace's sync reads only its own part of the log
+            models.Index(fields=['workspace_id', 'sequence'], name='changeevent_ws_sequence_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.sequence} {self.operation} {self.model} {self.object_id}"
+
+    def is_visible_to(self, user):
+        return user.is_superuser or user.pk in (
+            self.owner_id, self.assignee_id, self.requester_id, self.previous_owner_id, self.previous_assignee_id,
+        )
+
+
+class ChangeSequence(models.Model):
+    """
+    The last sequence number given to a ChangeEvent, in a single row that the
+    numbering locks (see feed.number_events).
+    """
+    value = models.BigIntegerField(default=0)
+
+
+class Notification(models.Model):
+    """
+    A notification waiting to go out in its recipient's next digest email
+    (see notifications.py). Rows are deleted once sent.
+    """
+    KIND_CHOICES = [
+        ('task_assigned', 'Task assigned'),
+        ('extension_requested', 'Deadline extension requested'),
+        ('extension_decided', 'Deadline extension decided'),
+    ]
+
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pending_notifications')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='notification_created_idx'),
+            models.Index(fields=['recipient', 'created_at'], name='notification_recipient_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.recipient}"
+
+
+class DeveloperMetricCounters(models.Model):
+    """
+    The counters kept per developer by metrics.py.
+    """
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, default=default_workspace)
+    developer = models.ForeignKey(User, on_delete=models.CASCADE)
+    started = models.PositiveIntegerField(default=0)  # Moves from Pending to In Progress
+    completed = models.PositiveIntegerField(default=0)
+    completed_on_time = models.PositiveIntegerField(default=0)  # Completed on or before the due date
+    cycle_count = models.PositiveIntegerField(default=0)  # Completed tasks with a start time
+    cycle_seconds = models.FloatField(default=0)  # Sum of their start to completion times
+    extensions_requested = models.PositiveIntegerField(default=0)
+
+    objects = WorkspaceManager()
+
+    class Meta:
+        abstract = True
+
+
+class DeveloperDailyStats(DeveloperMetricCounters):
+    """
+    One developer's counters for one day, the buckets the rolling windows are summed from.
+    """
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            # Also the index a window's days are summed with
+            models.UniqueConstraint(fields=['workspace', 'developer', 'day'], name='developerdailystats_unique_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.developer_id} on {self.day}"
+
+
+class DeveloperMetrics(DeveloperMetricCounters):
+    """
+    One developer's counters over the last `window_days` days up to `as_of`.
+    """
+    window_days = models.PositiveSmallIntegerField()
+    as_of = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['workspace', 'developer', 'window_days'], name='developermetrics_unique_window'),
+        ]
+
+    def __str__(self):
+        return f"{self.developer_id}, {self.window_days} days to {self.as_of}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client's Idempotency-Key and the response of the request it was first
+    sent with (see idempotency.py). Deleted once `expires_at` has passed.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # SHA-256 of the method, path, workspace and body
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # None while the request runs
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotencykey_unique_user_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotencykey_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id})"
+
+
+class WebhookEndpoint(models.Model):
+    """
+    An integration's URL and the events it subscribes to (see webhooks.py).
+    """
+    EVENT_CHOICES = [
+        ('task.assigned', 'Task assigned'),
+        ('task.status_changed', 'Task status changed'),
+        ('extension.decided', 'Deadline extension decided'),
+    ]
+
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, default=default_workspace, related_name='webhook_endpoints')
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=100)  # Signs every delivery (HMAC-SHA256)
+    events = models.JSONField(default=list, blank=True)  # Subscribed event names, empty for all
+    is_active = models.BooleanField(default=True)
+    max_concurrency = models.PositiveSmallIntegerField(default=4)  # Deliveries in flight at once
+    failure_count = models.PositiveIntegerField(default=0, editable=False)  # Consecutive failed deliveries
+    circuit_open_until = models.DateTimeField(null=True, blank=True, editable=False)  # No deliveries before, see the circuit breaker
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = WorkspaceManager()
+
+    def __str__(self):
+        return self.url
+
+    def subscribes_to(self, event):
+        return not self.events or event in self.events
+
+    def clean(self):
+        known = {event for event, label in self.EVENT_CHOICES}
+        if not isinstance(self.events, list) or not set(self.events) <= known:
+            raise ValidationError({'events': f"Must be a list of: {', '.join(sorted(known))}."})
+
+
+class WebhookDelivery(models.Model):
+    """
+    One event queued for one endpoint, sent and retried by the dispatcher.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('delivered', 'Delivered'),
+        ('failed', 'Failed'),  # Gave up after TASK_WEBHOOK_MAX_ATTEMPTS
+    ]
+
+    endpoint = models.ForeignKey(WebhookEndpoint, on_delete=models.CASCADE, related_name='deliveries')
+    event = models.CharField(max_length=50)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    last_error = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The dispatcher's poll: due pending deliveries, oldest first
+            models.Index(fields=['status', 'next_attempt_at'], name='webhookdelivery_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event} to {self.endpoint_id} ({self.status})"
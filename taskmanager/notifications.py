@@ -0,0 +1,135 @@
+"""
+Digest emails.
+
+Instead of one email per event, notifications are buffered per recipient
+in the Notification table and go out as one combined email. A recipient's
+digest is sent once their oldest buffered notification is
+TASK_NOTIFICATION_WINDOW seconds old, so a burst of events (forty tasks
+created in a planning session) becomes a single email and nobody waits
+longer than the window for news. With a window of 0 every notification is
+due on the next run, still one email per recipient.
+
+Due digests are sent by the send_notification_digests command, which
+should run every minute (cron), never from the request: a slow or failing
+email backend cannot delay or fail the change that caused the
+notification. All the digests of one run share a connection of the
+configured email backend.
+
+The buffer lives in the default database: for a workspace with its own
+database, a notification is kept even if the task change that caused it
+is rolled back.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import router, transaction
+from django.utils.timezone import now
+
+from .models import Notification
+
+
+WINDOW = 600  # seconds, when TASK_NOTIFICATION_WINDOW is not set
+
+HEADINGS = {
+    'task_assigned': "Tasks assigned to you",
+    'extension_requested': "Deadline extension requests on your tasks",
+    'extension_decided': "Decisions on your deadline extension requests",
+}
+
+
+def window():
+    return getattr(settings, 'TASK_NOTIFICATION_WINDOW', WINDOW)
+
+
+def notify_many(notifications):
+    """
+    Buffer (recipient, kind, message) notifications. Recipients without an
+    email address are skipped.
+    """
+    rows = [
+        Notification(recipient=recipient, kind=kind, message=message)
+        for recipient, kind, message in notifications
+        if recipient is not None and recipient.email
+    ]
+    if rows:
+        Notification.objects.bulk_create(rows)
+
+
+def notify(recipient, kind, message):
+    notify_many([(recipient, kind, message)])
+
+
+def task_assigned(task):
+    notify(task.assigned_to, 'task_assigned', f"'{task.name}', due {task.due_date}, priority {task.priority}")
+
+
+def extension_requested(extension):
+    # The task's owner decides on the request
+    task = extension.task
+    notify(
+        task.assigned_by, 'extension_requested',
+        f"'{task.name}': {extension.request_by.username} asks for a new deadline of {extension.new_deadline}. "
+        f"Reason: {extension.reason}",
+    )
+
+
+def extensions_decided(extensions):
+    notifications = []
+    for extension in extensions:
+        if extension.status == 'APPROVED':
+            message = f"'{extension.task.name}': approved, new deadline {extension.new_deadline}"
+        else:
+            message = f"'{extension.task.name}': rejected"
+        notifications.append((extension.request_by, 'extension_decided', message))
+    notify_many(notifications)
+
+
+def render(recipient, notifications):
+    """
+    One email for all of a recipient's notifications, grouped by kind.
+    """
+    sections = []
+    for kind, heading in HEADINGS.items():
+        lines = [f"- {notification.message}" for notification in notifications if notification.kind == kind]
+        if lines:
+            sections.append(f"{heading}:\n" + "\n".join(lines))
+
+    subject = f"Task Manager: {len(notifications)} update(s)"
+    body = (
+        f"Hello {recipient.username},\n\n"
+        + "\n\n".join(sections)
+        + "\n\nPlease log in to the task manager app to view more details.\n\n"
+        "Best regards,\nTask Manager Team\n"
+    )
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [recipient.email])
+
+
+def send_due(moment=None):
+    """
+    Send the digest of every recipient whose oldest notification has waited
+    out the window. Returns the number of emails sent.
+    """
+    cutoff = (moment or now()) - datetime.timedelta(seconds=window())
+    using = router.db_for_write(Notification)
+    with transaction.atomic(using=using):
+        due_recipients = Notification.objects.using(using).filter(created_at__lte=cutoff).values('recipient')
+        # Rows another run is already sending are skipped, not waited for
+        pending = list(
+            Notification.objects.using(using).select_for_update(skip_locked=True, of=('self',))
+            .filter(recipient__in=due_recipients)
+            .select_related('recipient')
+            .order_by('recipient', 'created_at', 'pk')
+        )
+        if not pending:
+            return 0
+
+        by_recipient = {}
+        for notification in pending:
+            by_recipient.setdefault(notification.recipient, []).append(notification)
+        messages = [render(recipient, notifications) for recipient, notifications in by_recipient.items()]
+
+        # A failed send rolls back the delete, the digests are retried on the next run
+        get_connection().send_messages(messages)
+        Notification.objects.using(using).filter(pk__in=[notification.pk for notification in pending]).delete()
+    return len(messages)
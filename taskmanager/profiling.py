@@ -0,0 +1,222 @@
+"""
+On-demand request profiling.
+
+With TASK_PROFILING_ENABLED, ProfilingMiddleware runs cProfile around a
+request when a staff user asks for it (the X-Profile: 1 header or the
+?_profile=1 query parameter) and, with TASK_PROFILING_SAMPLE_RATE = N, for
+one request in every N. Each capture is a pstats file plus a small JSON
+file with the request, its duration and the time spent in SQL, written to
+TASK_PROFILING_DIR. Only the newest TASK_PROFILING_KEEP captures are kept.
+
+A requested profile is only taken after the request's credentials (the
+session, or a JWT or token the API accepts) are checked to belong to a
+staff user, so other clients cannot make the server pay for profiling by
+sending the header. API credentials are then checked a second time by the
+view, which only staff requests that ask for a profile pay for. One request
+is profiled at a time per process; while one is, the others run
+unprofiled.
+
+Disabled (the default), the middleware removes itself at startup with
+MiddlewareNotUsed and costs nothing. `manage.py profiles` lists and
+summarizes the captures.
+"""
+import cProfile
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PARAM = '_profile'
+
+DEFAULT_KEEP = 50
+
+# Where each phase is entered: (module path, function names or None for any,
+# paths of callers that are already inside the phase)
+PHASES = {
+    'view': ('rest_framework/views.py', {'dispatch'}, ('rest_framework/views.py',)),
+    'serializers': (
+        'rest_framework/serializers.py', {'data', 'is_valid', 'save'},
+        ('rest_framework/serializers.py', 'rest_framework/fields.py', 'rest_framework/relations.py', 'taskmanager/serializers.py'),
+    ),
+    'orm': ('django/db/', None, ('django/',)),
+}
+
+
+def profile_dir():
+    return getattr(settings, 'TASK_PROFILING_DIR', None) or os.path.join(settings.BASE_DIR, 'profiles')
+
+
+class QueryTimer:
+    """
+    Database execute wrapper adding up the number and wall time of the queries.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def phases(stats):
+    """
+    Seconds spent below the calls entering each phase, from a pstats.Stats.
+    Phases nest (the serializers run inside the view and run queries), so
+    they do not add up to the total.
+    """
+    totals = dict.fromkeys(PHASES, 0.0)
+    for (filename, line, function), (cc, nc, tt, ct, callers) in stats.stats.items():
+        for phase, (module, functions, inside) in PHASES.items():
+            if module not in filename or (functions is not None and function not in functions):
+                continue
+            for caller, (caller_cc, caller_nc, caller_tt, caller_ct) in callers.items():
+                if not any(path in caller[0] for path in inside):
+                    totals[phase] += caller_ct
+    return totals
+
+
+def captures(directory=None):
+    """
+    The metadata of the stored captures, oldest first.
+    """
+    directory = directory or profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name)) as file:
+                found.append(json.load(file))
+    return found
+
+
+def _trim(directory, keep):
+    names = sorted(name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json'))
+    for name in names[:max(0, len(names) - keep)]:
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+def store(profiler, meta, directory=None, keep=None):
+    """
+    Write a capture into the ring buffer and drop the oldest ones past `keep`.
+    """
+    directory = directory or profile_dir()
+    keep = keep or getattr(settings, 'TASK_PROFILING_KEEP', DEFAULT_KEEP)
+    os.makedirs(directory, exist_ok=True)
+
+    # Names sort by capture time, which is what the trimming relies on
+    captured_ns = time.time_ns()
+    name = f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime(captured_ns // 10**9))}-{captured_ns % 10**9:09d}-{uuid.uuid4().hex[:6]}"
+    meta = dict(meta, name=name)
+    profiler.dump_stats(os.path.join(directory, name + '.prof'))
+    with open(os.path.join(directory, name + '.json'), 'w') as file:
+        json.dump(meta, file)
+    _trim(directory, keep)
+    return meta
+
+
+def staff_user(request):
+    """
+    The staff user the request authenticates as, or None.
+    """
+    user = getattr(request, 'user', None)  # Session, from AuthenticationMiddleware
+    if user is None or not user.is_authenticated:
+        user = None
+        for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+            try:
+                authenticated = authentication_class().authenticate(request)
+            except APIException:
+                return None
+            if authenticated is not None:
+                user = authenticated[0]
+                break
+    return user if user is not None and user.is_staff else None
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests staff users ask for and one in every
+    TASK_PROFILING_SAMPLE_RATE others. Removed at startup when disabled.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TASK_PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'TASK_PROFILING_SAMPLE_RATE', 0)
+        self.counter = itertools.count(1)
+        # cProfile allows a single active profiler per process on recent Pythons
+        self.lock = threading.Lock()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            # Coroutines (the change feed) are not profiled
+            return self.get_response(request)
+
+        sampled = bool(self.sample_rate) and next(self.counter) % self.sample_rate == 0
+        requested = (
+            (request.headers.get(PROFILE_HEADER) == '1' or request.GET.get(PROFILE_PARAM) == '1')
+            and staff_user(request) is not None
+        )
+        if not (requested or sampled) or not self.lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        try:
+            return self._profile(request, 'requested' if requested else 'sampled')
+        finally:
+            self.lock.release()
+
+    def _profile(self, request, reason):
+        timer = QueryTimer()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+
+        user = getattr(request, 'user', None)
+        store(profiler, {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'user': user.get_username() if user is not None and user.is_authenticated else None,
+            'reason': reason,
+            'captured_at': time.time(),
+            'duration': duration,
+            'queries': timer.count,
+            'sql_time': timer.seconds,
+        })
+        return response
+
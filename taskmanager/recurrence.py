@@ -0,0 +1,223 @@
+"""
+Recurring task templates.
+
+A schedule is the date part of a cron expression: "day-of-month month
+day-of-week", each field being `*`, a number, a range `a-b`, a list `a,b`
+or a step `*/n` / `a-b/n`. Day-of-week runs from 0 (Sunday) to 6, 7 is
+Sunday too. As in cron, when both day-of-month and day-of-week are
+restricted a date matches if either does. Examples: "* * 1" every Monday,
+"1 * *" the first of every month, "*/14 * *" every 14th day of the month.
+
+`materialize()` expands every due occurrence of every active template into
+tasks. Templates are processed in primary key chunks, each in its own
+transaction, and every level of a subtask tree is written with one
+bulk_create, so the number of queries follows the number of chunks and
+tree levels rather than the number of tasks. Workspaces with their own
+database are handled one database at a time. Each task gets an
+`occurrence_key`, unique per template and date, so a rerun (or two
+concurrent runs) never creates the same occurrence twice.
+"""
+import datetime
+
+from django.db import transaction
+
+from . import audit, tenancy
+from .models import Task, TaskTemplate
+from .transitions import tasks_bulk_created
+
+
+LEAD_DAYS = 7  # How far ahead occurrences are created by default
+CHUNK_SIZE = 500  # Root templates per transaction
+MAX_OCCURRENCES = 366  # Per template and run, the rest is picked up by the next run
+
+FIELDS = (
+    ('day of month', 1, 31),
+    ('month', 1, 12),
+    ('day of week', 0, 7),
+)
+
+
+class InvalidSchedule(ValueError):
+    pass
+
+
+def _parse_field(value, name, low, high):
+    values = set()
+    for part in value.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/', 1)
+            if not step.isdigit() or int(step) == 0:
+                raise InvalidSchedule(f"Invalid step in {name}: '{step}'.")
+            step = int(step)
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = part.split('-', 1)
+            if not start.isdigit() or not end.isdigit():
+                raise InvalidSchedule(f"Invalid range in {name}: '{part}'.")
+            start, end = int(start), int(end)
+        elif part.isdigit():
+            start = end = int(part)
+        else:
+            raise InvalidSchedule(f"Invalid {name}: '{part}'.")
+
+        if not low <= start <= end <= high:
+            raise InvalidSchedule(f"{name.capitalize()} must be between {low} and {high}.")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class Schedule:
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != len(FIELDS):
+            raise InvalidSchedule("A schedule has three fields: day-of-month month day-of-week.")
+
+        self.expression = expression
+        self.days, self.months, weekdays = (
+            _parse_field(part, *field) for part, field in zip(parts, FIELDS)
+        )
+        self.weekdays = frozenset(weekday % 7 for weekday in weekdays)
+        self.any_day = parts[0] == '*'
+        self.any_weekday = parts[2] == '*'
+
+    def matches(self, date):
+        if date.month not in self.months:
+            return False
+        day_matches = date.day in self.days
+        weekday_matches = date.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_matches and weekday_matches
+        return day_matches or weekday_matches
+
+    def between(self, start, end, limit=None):
+        """
+        Dates from `start` to `end` (both included) that match, at most `limit` of them.
+        """
+        dates = []
+        day = start
+        while day <= end and (limit is None or len(dates) < limit):
+            if self.matches(day):
+                dates.append(day)
+            day += datetime.timedelta(days=1)
+        return dates
+
+
+def occurrence_key(template_id, date):
+    return f'{template_id}:{date.isoformat()}'
+
+
+def _descendant_levels(roots, using):
+    """
+    Child templates of `roots`, one list per tree level, one query per level.
+    """
+    levels = []
+    parents = [template.pk for template in roots]
+    while parents:
+        children = list(TaskTemplate.objects.using(using).filter(parent__in=parents).order_by('pk'))
+        if not children:
+            break
+        levels.append(children)
+        parents = [template.pk for template in children]
+    return levels
+
+
+def _build_task(template, date, parent_task_id):
+    return Task(
+        workspace_id=template.workspace_id,
+        name=template.name,
+        description=template.description,
+        priority=template.priority,
+        priority_rank=Task.PRIORITY_RANKS.get(template.priority, 0),  # bulk_create skips save()
+        due_date=date + datetime.timedelta(days=template.due_in_days),
+        assigned_to_id=template.assigned_to_id,
+        assigned_by_id=template.assigned_by_id,
+        parent_task_id=parent_task_id,
+        template=template,
+        occurrence_key=occurrence_key(template.pk, date),
+    )
+
+
+def _create_level(tasks, using):
+    """
+    Insert the tasks whose occurrence does not exist yet. Returns the ids of
+    every key (existing or new) and the newly created tasks.
+    """
+    keys = [task.occurrence_key for task in tasks]
+    ids = dict(Task.objects.using(using).filter(occurrence_key__in=keys).values_list('occurrence_key', 'id'))
+    new = [task for task in tasks if task.occurrence_key not in ids]
+    Task.objects.using(using).bulk_create(new, batch_size=1000)
+    ids.update((task.occurrence_key, task.pk) for task in new)
+    return ids, new
+
+
+def _materialize_chunk(template_ids, until, using):
+    with transaction.atomic(using=using), audit.batch():
+        # Lock the templates so a concurrent run waits instead of doing the same work
+        roots = list(TaskTemplate.objects.using(using).select_for_update().filter(pk__in=template_ids).order_by('pk'))
+
+        dates = {}
+        for template in roots:
+            start = template.starts_on
+            if template.materialized_until is not None:
+                start = max(start, template.materialized_until + datetime.timedelta(days=1))
+            try:
+                dates[template.pk] = Schedule(template.schedule).between(start, until, limit=MAX_OCCURRENCES)
+            except InvalidSchedule:
+                dates[template.pk] = []
+
+        created = []
+        ids, new = _create_level([_build_task(template, date, None) for template in roots for date in dates[template.pk]], using)
+        created += new
+
+        # A child occurs on the dates of its root, under its parent's task of the same date
+        root_of = {template.pk: template.pk for template in roots}
+        for level in _descendant_levels(roots, using):
+            tasks = []
+            for template in level:
+                root_of[template.pk] = root_of[template.parent_id]
+                for date in dates[root_of[template.pk]]:
+                    tasks.append(_build_task(template, date, ids[occurrence_key(template.parent_id, date)]))
+            ids, new = _create_level(tasks, using)
+            created += new
+
+        for template in roots:
+            occurrences = dates[template.pk]
+            # With the occurrence cap the next run continues after the last date created
+            reached = occurrences[-1] if len(occurrences) == MAX_OCCURRENCES else until
+            template.materialized_until = max(reached, template.materialized_until or reached)
+        TaskTemplate.objects.using(using).bulk_update(roots, ['materialized_until'])
+
+        if created:
+            tasks_bulk_created.send(sender=Task, tasks=created, user=None)
+    return len(created)
+
+
+def materialize(until=None, chunk_size=CHUNK_SIZE):
+    """
+    Create the tasks of every occurrence up to `until` (default: LEAD_DAYS from
+    today) that was not created yet. Returns the number of tasks created.
+    """
+    until = until or datetime.date.today() + datetime.timedelta(days=LEAD_DAYS)
+    created = 0
+    for using in tenancy.databases():
+        due = (
+            TaskTemplate.objects.using(using)
+            .filter(parent__isnull=True, is_active=True, starts_on__lte=until)
+            .exclude(schedule='')
+            .exclude(materialized_until__gte=until)
+            .order_by('pk')
+        )
+
+        last_pk = 0
+        while True:
+            # Keyset pagination keeps every chunk query cheap however far in we are
+            template_ids = list(due.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+            if not template_ids:
+                break
+            created += _materialize_chunk(template_ids, until, using)
+            last_pk = template_ids[-1]
+    return created
@@ -0,0 +1,22 @@
+DEVELOPER = 'Developer'
+TASK_PROVIDER = 'Task Providers'
+SHARED_POOL = 'Shared Pools'  # Accounts holding a shared queue, see work_queue.may_claim_from
+
+
+def group_names(user):
+    """
+    Names of the user's groups. Loaded with one query and cached on the user
+    object, which lives as long as the request, so repeated role checks are free.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    names = getattr(user, '_group_names', None)
+    if names is None:
+        names = frozenset(user.groups.values_list('name', flat=True))
+        user._group_names = names
+    return names
+
+
+def has_role(user, role):
+    return role in group_names(user)
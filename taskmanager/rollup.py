@@ -0,0 +1,201 @@
+"""
+Subtask progress rolled up onto every task.
+
+Each task stores, over all the tasks below it:
+
+- descendant_count: how many there are
+- completed_descendant_count: how many of them are Completed
+- earliest_descendant_due: their earliest due date
+
+A progress bar reads these three columns instead of the subtask tree.
+
+The fields are kept on write (see signals.py). When a task is created,
+deleted, moved to another parent or changes status or due date, its old
+and new parents are refreshed. A refresh recomputes the parent from its
+direct children with one aggregate query, then carries the difference to
+the ancestors: counts with a single F() UPDATE over the ancestor chain, an
+earlier due date with a single conditional UPDATE. A later due date is
+recomputed ancestor by ancestor and stops at the first one it does not
+change.
+
+Every rollup UPDATE also bumps the task's version and updated_at, the
+rollup is part of the task's representation (ETag, Last-Modified).
+
+`manage.py rebuild_rollups` recomputes every task from scratch.
+`manage.py check_rollups` reports the tasks whose stored values differ.
+"""
+from django.db.models import Count, F, Min, Q, Sum
+from django.utils.timezone import now
+
+from . import tenancy
+from .models import Task
+
+
+ROLLUP_FIELDS = ('descendant_count', 'completed_descendant_count', 'earliest_descendant_due')
+
+# Changes of these fields change the parent's rollup
+TRACKED_FIELDS = ('parent_task_id', 'status', 'due_date')
+
+
+def _changed(**fields):
+    # Clients holding the old representation must see a new version
+    return dict(fields, version=F('version') + 1, updated_at=now())
+
+
+def _earliest(*dates):
+    dates = [date for date in dates if date is not None]
+    return min(dates) if dates else None
+
+
+def ancestor_ids(task_id):
+    """
+    Ids from `task_id` up to its root, nearest first. One query per level.
+    Stops at a task seen before, should the parents form a cycle.
+    """
+    ids = []
+    while task_id is not None and task_id not in ids:
+        ids.append(task_id)
+        task_id = Task.objects.filter(pk=task_id).values_list('parent_task_id', flat=True).first()
+    return ids
+
+
+def from_children(task_id):
+    """
+    The rollup of `task_id` computed from its direct children's own rollups.
+    """
+    totals = Task.objects.filter(parent_task=task_id).aggregate(
+        children=Count('pk'),
+        completed_children=Count('pk', filter=Q(status='Completed')),
+        nested=Sum('descendant_count'),
+        nested_completed=Sum('completed_descendant_count'),
+        earliest_due=Min('due_date'),
+        earliest_nested=Min('earliest_descendant_due'),
+    )
+    return {
+        'descendant_count': totals['children'] + (totals['nested'] or 0),
+        'completed_descendant_count': totals['completed_children'] + (totals['nested_completed'] or 0),
+        'earliest_descendant_due': _earliest(totals['earliest_due'], totals['earliest_nested']),
+    }
+
+
+def _carry_earliest(ancestors, old, new):
+    if new is not None and (old is None or new < old):
+        Task.objects.filter(pk__in=ancestors).filter(
+            Q(earliest_descendant_due__isnull=True) | Q(earliest_descendant_due__gt=new)
+        ).update(**_changed(earliest_descendant_due=new))
+        return
+    # Only ancestors whose earliest date was the removed one can get a later date
+    for ancestor_id in ancestors:
+        stored = Task.objects.filter(pk=ancestor_id).values_list('earliest_descendant_due', flat=True).first()
+        if stored != old:
+            return
+        earliest = from_children(ancestor_id)['earliest_descendant_due']
+        if earliest == stored:
+            return
+        Task.objects.filter(pk=ancestor_id).update(**_changed(earliest_descendant_due=earliest))
+
+
+def refresh(task_id):
+    """
+    Recompute the rollup of `task_id` from its children and carry the change
+    up to its ancestors. Missing tasks (deleted with their parent) are skipped.
+    """
+    with tenancy.atomic():
+        row = Task.objects.select_for_update().filter(pk=task_id).values('parent_task_id', *ROLLUP_FIELDS).first()
+        if row is None:
+            return
+        rollup = from_children(task_id)
+        if all(row[field] == rollup[field] for field in ROLLUP_FIELDS):
+            return
+        Task.objects.filter(pk=task_id).update(**_changed(**rollup))
+
+        ancestors = ancestor_ids(row['parent_task_id'])
+        if not ancestors:
+            return
+        counts = {
+            field: F(field) + (rollup[field] - row[field])
+            for field in ('descendant_count', 'completed_descendant_count')
+            if rollup[field] != row[field]
+        }
+        if counts:
+            Task.objects.filter(pk__in=ancestors).update(**_changed(**counts))
+        if rollup['earliest_descendant_due'] != row['earliest_descendant_due']:
+            _carry_earliest(ancestors, row['earliest_descendant_due'], rollup['earliest_descendant_due'])
+
+
+def refresh_many(task_ids):
+    # Each refresh carries its change upwards, so the order does not matter
+    for task_id in sorted(set(task_ids) - {None}):
+        refresh(task_id)
+
+
+def changed_parents(task):
+    """
+    The parents whose rollup a save of `task` changes: none if the tracked
+    fields kept their loaded values, the old and the new parent otherwise.
+    """
+    loaded = getattr(task, '_loaded_values', None)
+    if loaded is None or task.pk is None:
+        return {task.parent_task_id}
+    deferred = task.get_deferred_fields()
+    fields = [field for field in TRACKED_FIELDS if field not in deferred]
+    if all(loaded.get(field) == getattr(task, field) for field in fields):
+        return set()
+    return {loaded.get('parent_task_id'), task.parent_task_id}
+
+
+def compute(tasks):
+    """
+    Rollups of `tasks` ((id, parent id, status, due date) rows) computed from
+    scratch, children before parents. Returns {id: (count, completed, earliest)}.
+    """
+    children = {}
+    for task_id, parent_id, task_status, due_date in tasks:
+        children.setdefault(parent_id, []).append((task_id, task_status == 'Completed', due_date))
+
+    rollups = {}
+    # Iterative post-order walk from the roots, deep trees do not hit the recursion limit
+    stack = [(task_id, False) for task_id, completed, due_date in children.get(None, [])]
+    while stack:
+        task_id, expanded = stack.pop()
+        if not expanded:
+            stack.append((task_id, True))
+            stack.extend((child_id, False) for child_id, completed, due_date in children.get(task_id, []))
+            continue
+        count, completed_count, earliest = 0, 0, None
+        for child_id, completed, due_date in children.get(task_id, []):
+            child_count, child_completed, child_earliest = rollups[child_id]
+            count += 1 + child_count
+            completed_count += completed + child_completed
+            earliest = _earliest(earliest, due_date, child_earliest)
+        rollups[task_id] = (count, completed_count, earliest)
+    return rollups
+
+
+def mismatches():
+    """
+    [(task id, stored, expected)] for every task whose stored rollup is wrong,
+    in the active workspace.
+    """
+    rows = list(Task.objects.values_list('pk', 'parent_task_id', 'status', 'due_date', *ROLLUP_FIELDS))
+    expected = compute(row[:4] for row in rows)
+    return [
+        (row[0], tuple(row[4:]), expected.get(row[0]))
+        for row in rows
+        if tuple(row[4:]) != expected.get(row[0])
+    ]
+
+
+def rebuild():
+    """
+    Store the from-scratch rollup of every task of the active workspace whose
+    rollup is wrong. Returns the number of tasks fixed.
+    """
+    with tenancy.atomic():
+        # Tasks in a parent cycle have no expected rollup, they are only reported
+        tasks = [
+            Task(pk=task_id, **_changed(**dict(zip(ROLLUP_FIELDS, expected))))
+            for task_id, stored, expected in mismatches() if expected is not None
+        ]
+        Task.objects.bulk_update(tasks, [*ROLLUP_FIELDS, 'version', 'updated_at'], batch_size=1000)
+    return len(tasks)
@@ -1,8 +1,90 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import Task, DeadlineExtensionLog, User
+from rest_framework.permissions import SAFE_METHODS
+from .models import Task, DeadlineExtensionLog, TaskEvent, TaskTemplate, ArchivedTask, User, StaleVersionError
+from .concurrency import PreconditionFailed, parse_if_match
+from . import assignment, notifications, recurrence, tenancy
+from .transitions import TASK_STATUS, EXTENSION_STATUS, TransitionError, tasks_bulk_updated
+from .rollup import ROLLUP_FIELDS, ancestor_ids
 from django.utils.timezone import now
-from django.core.mail import send_mail
-from django.conf import settings
+
+
+SUBTASK_PREFETCH_DEPTH = 3  # Subtask levels loaded up front, deeper ones are fetched per task
+
+
+def _split(value):
+    return {name.strip() for name in value.split(',') if name.strip()} if value else set()
+
+
+class SparseFieldsetMixin:
+    """
+    Sparse fieldsets for GET responses: `?fields=a,b` returns only the listed
+    fields, `?exclude=a,b` all but those. Fields in Meta.expandable_fields
+    (nested relations that cost extra queries) are left out of a `?fields=`
+    response unless listed or asked for with `?expand=`. Without any of these
+    parameters every field is returned.
+
+    `project()` applies the same choice to a queryset: only() the columns that
+    are rendered, select_related() the nested objects of Meta.nested_fields
+    (with just their rendered columns) and prefetches only what is expanded.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self.selected_fields(self.context.get('request'), self.context.get('expand_by_default', True))
+        if selected is not None:
+            for name in set(self.fields) - selected:
+                self.fields.pop(name)
+
+    @classmethod
+    def selected_fields(cls, request, expand_by_default=True):
+        """
+        Names of the fields the request asks for, None for all of them. With
+        `expand_by_default` off, expandable fields need `?expand=` even
+        without `?fields=`.
+        """
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        params = getattr(request, 'query_params', request.GET)
+        fields, exclude, expand = _split(params.get('fields')), _split(params.get('exclude')), _split(params.get('expand'))
+        expandable = set(getattr(cls.Meta, 'expandable_fields', ()))
+
+        if fields:
+            selected = fields | (expandable & expand)
+        elif exclude or not expand_by_default:
+            selected = set(cls.Meta.fields)
+            if not expand_by_default:
+                selected -= expandable - expand
+        else:
+            return None
+        return (selected - exclude) & set(cls.Meta.fields)
+
+    @classmethod
+    def project(cls, queryset, fields=None):
+        fields = set(cls.Meta.fields) if fields is None else fields
+        nested = getattr(cls.Meta, 'nested_fields', {})
+        columns = {field.name for field in cls.Meta.model._meta.concrete_fields}
+
+        load = [cls.Meta.model._meta.pk.name]
+        related = []
+        for name in fields:
+            if name in nested:
+                related.append(name)
+                load += [f'{name}__{column}' for column in nested[name]]
+            elif name in columns:
+                load.append(name)
+
+        queryset = queryset.only(*load)
+        if related:
+            queryset = queryset.select_related(*related)
+        prefetches = cls.prefetches(fields)
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset
+
+    @classmethod
+    def prefetches(cls, fields):
+        return []
 
 
 class UserDropDownSerializer(serializers.ModelSerializer):
@@ -24,12 +106,26 @@ class SubtaskSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Task
-        fields = ['id', 'name', 'status', 'due_date', 'assigned_to', 'parent_task', 'subtasks']
+        fields = ['id', 'name', 'status', 'due_date', 'assigned_to', 'parent_task', 'subtasks',
+                  'descendant_count', 'completed_descendant_count', 'earliest_descendant_due']
 
     def get_subtasks(self, obj):
-        # Recursively fetch subtasks of the current subtask
-        subtasks = Task.objects.filter(parent_task=obj)
-        return SubtaskSerializer(subtasks, many=True).data
+        # Recursively fetch subtasks of the current subtask (prefetched for the first levels)
+        return SubtaskSerializer(obj.subtasks.all(), many=True).data
+
+    @classmethod
+    def tree_prefetches(cls, prefix='subtasks', depth=SUBTASK_PREFETCH_DEPTH):
+        """
+        One query per subtask level, each loading only what is rendered.
+        """
+        levels = []
+        for level in range(1, depth + 1):
+            subtasks = (
+                Task.objects.select_related('assigned_to')
+                .only('id', 'name', 'status', 'due_date', 'parent_task', *ROLLUP_FIELDS, 'assigned_to__id', 'assigned_to__username', 'assigned_to__email')
+            )
+            levels.append(Prefetch('__'.join([prefix] * level), queryset=subtasks))
+        return levels
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -37,60 +133,259 @@ class SubtaskSerializer(serializers.ModelSerializer):
         return representation
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     subtasks = SubtaskSerializer(many=True, read_only=True)  # Subtasks will be nested and read-only for GET requests
+    auto_assign = serializers.BooleanField(write_only=True, required=False, default=False)  # Let the workload scheduler pick assigned_to
 
     class Meta:
         model = Task
         fields = ['id', 'name', 'description', 'priority', 'status', 'due_date', 'assigned_to', 'assigned_by', 
-                  'created_at', 'updated_at', 'parent_task', 'subtasks']
-        read_only_fields = ['created_at', 'assigned_by', 'updated_at']
+                  'created_at', 'updated_at', 'parent_task', 'subtasks', 'version', 'priority_rank', 'auto_assign',
+                  'descendant_count', 'completed_descendant_count', 'earliest_descendant_due']
+        read_only_fields = ['created_at', 'assigned_by', 'updated_at', 'version', 'priority_rank', *ROLLUP_FIELDS]
+        extra_kwargs = {'assigned_to': {'required': False}}
+        expandable_fields = ['subtasks']
+        nested_fields = {'assigned_to': ('id', 'username', 'email'), 'assigned_by': ('id', 'username', 'email')}
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['assigned_to'] = UserDropDownSerializer(instance.assigned_to).data
-        representation['assigned_by'] = UserDropDownSerializer(instance.assigned_by).data
+        for name in ('assigned_to', 'assigned_by'):
+            if name in representation:
+                representation[name] = UserDropDownSerializer(getattr(instance, name)).data
         return representation
 
+    @classmethod
+    def prefetches(cls, fields):
+        return SubtaskSerializer.tree_prefetches() if 'subtasks' in fields else []
+
+    def validate_assigned_to(self, assigned_to):
+        if not tenancy.is_member(assigned_to):
+            raise serializers.ValidationError("This user is not a member of the workspace.")
+        return assigned_to
+
     def validate(self, data):
         # Rule 2: A task's due_date cannot be earlier than its dependency's due_date
         if data.get('parent_task'):
             parent_task = data['parent_task']
-            if data['due_date'] > parent_task.due_date:
+            # A partial update may change the parent without sending the due date
+            due_date = data.get('due_date', self.instance.due_date if self.instance else None)
+            # A task cannot end up below itself, the parent chain would loop
+            if self.instance is not None and self.instance.pk in ancestor_ids(parent_task.pk):
+                raise serializers.ValidationError({'parent_task': "A task cannot be its own parent or a subtask of its subtasks."})
+            if due_date and due_date > parent_task.due_date:
                 raise serializers.ValidationError(f"Due date cannot be earlier than the due date of the parent task: {parent_task.due_date}")
 
+        if self.instance is None and not data.get('assigned_to') and not data.get('auto_assign'):
+            raise serializers.ValidationError({'assigned_to': "This field is required unless auto_assign is set."})
+
         return data
+
+    def create(self, validated_data):
+        if validated_data.pop('auto_assign', False) and not validated_data.get('assigned_to'):
+            try:
+                validated_data['assigned_to'] = assignment.pick_developer()
+            except assignment.NoDevelopersAvailable as e:
+                raise serializers.ValidationError({'assigned_to': str(e)})
+        return super().create(validated_data)
     
     def update(self, instance, validated_data):
+        validated_data.pop('auto_assign', None)
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
         status = validated_data.get('status', instance.status)
+        previous_status = instance.status
+        previous = {'completed_at': instance.completed_at}
 
-        # Validation rule: A task's status cannot be changed from Pending to Completed without being In Progress
-        if status == 'Completed' and instance.status != 'In Progress':
-            raise serializers.ValidationError("A task must be In Progress before it can be marked as Completed.")
-        
-        # Rule 1: A task can only be marked Completed if all its dependencies are completed
-        if status == 'Completed':
-            parent_task = instance.parent_task
-            if parent_task and parent_task.status != 'Completed':
-                raise serializers.ValidationError(f"A task can only be marked as Completed if all its dependencies are completed. Parent task '{parent_task.name}' is not completed yet.")
+        # Status rules (Pending -> In Progress -> Completed, parent must be completed) live in the state machine
+        try:
+            TASK_STATUS.check(instance, status, user)
+        except TransitionError as e:
+            raise serializers.ValidationError(str(e))
+
+        # The version the client read (If-Match) must still be the stored one,
+        # otherwise someone else changed the task in between and we would overwrite it
+        expected_version = parse_if_match(request)
 
         # Proceed with the regular update process
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+
+        try:
+            instance.save_versioned(expected_version)
+        except StaleVersionError:
+            raise PreconditionFailed()
+
+        TASK_STATUS.announce([(instance, previous_status, previous)], status, user)
 
         return instance
 
 
-class DeadlineExtensionRequestSerializer(serializers.ModelSerializer):
+class TaskQueueSerializer(serializers.ModelSerializer):
+    """
+    Compact rows for the work queue, no description or nested objects.
+    """
+    class Meta:
+        model = Task
+        fields = ['id', 'name', 'priority', 'priority_rank', 'status', 'due_date', 'parent_task', 'assigned_to', 'version']
+        read_only_fields = fields
+
+
+class TaskClaimSerializer(serializers.Serializer):
+    pool = serializers.IntegerField(required=False, allow_null=True)  # User id of the queue to claim from
+
+
+class TaskBulkAutoAssignSerializer(serializers.Serializer):
+    """
+    Re-assign many pending tasks to the developers with the most spare capacity.
+    """
+    tasks = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=5000)
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        with tenancy.atomic():
+            tasks = list(Task.objects.select_for_update().filter(pk__in=validated_data['tasks'], assigned_by=user, status='Pending'))
+            missing = set(validated_data['tasks']) - {task.pk for task in tasks}
+            if missing:
+                raise serializers.ValidationError({'tasks': f"Not found, not pending or not assigned by you: {sorted(missing)}"})
+
+            try:
+                assignment.assign_batch(tasks)
+            except assignment.NoDevelopersAvailable as e:
+                raise serializers.ValidationError({'tasks': str(e)})
+
+            updated_at = now()
+            for task in tasks:
+                task.version += 1
+                task.updated_at = updated_at
+            Task.objects.bulk_update(tasks, ['assigned_to', 'version', 'updated_at'], batch_size=1000)
+            tasks_bulk_updated.send(sender=Task, tasks=tasks, fields=['assigned_to'], user=user)
+
+        return tasks
+
+
+class TaskTemplateNodeSerializer(serializers.ModelSerializer):
+    """
+    One template of a subtask tree. `subtasks` nests further templates and can
+    only be given when the tree is created.
+    """
+    subtasks = serializers.ListField(child=serializers.DictField(), write_only=True, required=False)
+
+    class Meta:
+        model = TaskTemplate
+        fields = ['id', 'name', 'description', 'priority', 'due_in_days', 'assigned_to', 'subtasks']
+        extra_kwargs = {'assigned_to': {'required': False}}  # Defaults to the parent's assignee
+
+    def validate_assigned_to(self, assigned_to):
+        if not tenancy.is_member(assigned_to):
+            raise serializers.ValidationError("This user is not a member of the workspace.")
+        return assigned_to
+
+    def validate_subtasks(self, subtasks):
+        if self.instance is not None:
+            raise serializers.ValidationError("Subtasks can only be set when the template is created.")
+
+        nodes = []
+        for subtask in subtasks:
+            node = TaskTemplateNodeSerializer(data=subtask, context=self.context)
+            node.is_valid(raise_exception=True)
+            nodes.append(node.validated_data)
+        return nodes
+
+    def validate(self, data):
+        # Rule 2 for the tasks the tree materializes (bulk-created, so TaskSerializer does not check them):
+        # a subtask cannot be due after its parent
+        default = TaskTemplate._meta.get_field('due_in_days').get_default()
+        due_in_days = data.get('due_in_days', self.instance.due_in_days if self.instance else default)
+        later = [subtask['name'] for subtask in data.get('subtasks', []) if subtask.get('due_in_days', default) > due_in_days]
+        if self.instance is not None:
+            later += self.instance.children.filter(due_in_days__gt=due_in_days).values_list('name', flat=True)
+            parent = self.instance.parent
+            if parent is not None and due_in_days > parent.due_in_days:
+                raise serializers.ValidationError({'due_in_days': f"A subtask cannot be due after its parent ({parent.due_in_days} days)."})
+        if later:
+            raise serializers.ValidationError({'subtasks': f"A subtask cannot be due after its parent ({due_in_days} days): {', '.join(later)}"})
+        return data
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        representation['subtasks'] = TaskTemplateNodeSerializer(instance.children.all(), many=True, context=self.context).data
+        return representation
+
+
+class TaskTemplateSerializer(TaskTemplateNodeSerializer):
+
+    class Meta:
+        model = TaskTemplate
+        fields = ['id', 'name', 'description', 'priority', 'schedule', 'due_in_days', 'starts_on', 'is_active',
+                  'assigned_to', 'assigned_by', 'materialized_until', 'created_at', 'subtasks']
+        read_only_fields = ['assigned_by', 'materialized_until', 'created_at']
+        extra_kwargs = {'schedule': {'required': True, 'allow_blank': False}}
+
+    def validate_schedule(self, schedule):
+        try:
+            recurrence.Schedule(schedule)
+        except recurrence.InvalidSchedule as e:
+            raise serializers.ValidationError(str(e))
+        return schedule
+
+    def create(self, validated_data):
+        with tenancy.atomic():
+            return self._create_tree(validated_data, None, validated_data.pop('assigned_by'))
+
+    def _create_tree(self, data, parent, assigned_by):
+        subtasks = data.pop('subtasks', [])
+        if parent is not None:
+            data.setdefault('assigned_to', parent.assigned_to)
+        template = TaskTemplate.objects.create(parent=parent, assigned_by=assigned_by, **data)
+        for subtask in subtasks:
+            self._create_tree(subtask, template, assigned_by)
+        return template
+
+
+class ArchivedTaskSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedTask
+        fields = ['id', 'root_id', 'parent_task_id', 'depth', 'name', 'priority', 'due_date', 'assigned_to_id',
+                  'assigned_by_id', 'completed_at', 'archived_at', 'data']
+        read_only_fields = fields
+
+
+class TaskEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TaskEvent
+        fields = ['id', 'task', 'actor', 'created_at', 'changes']
+        read_only_fields = fields
+
+
+class TaskSyncSerializer(serializers.ModelSerializer):
+    """
+    Flat task rows for delta sync: related objects are sent as ids only.
+    """
+    class Meta:
+        model = Task
+        fields = ['id', 'name', 'description', 'priority', 'status', 'due_date', 'assigned_to', 'assigned_by',
+                  'created_at', 'updated_at', 'parent_task', 'version']
+        read_only_fields = fields
+
+
+class DeadlineExtensionSyncSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeadlineExtensionLog
+        fields = ['id', 'task', 'request_by', 'new_deadline', 'reason', 'status', 'created_at', 'approved_by', 'approved_at']
+        read_only_fields = fields
+
+
+class DeadlineExtensionRequestSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = DeadlineExtensionLog
         fields = ['id', 'task', 'request_by', 'new_deadline', 'reason', 'status', 'created_at', 'approved_by', 'approved_at']
         read_only_fields = ['status', 'request_by', 'approved_by', 'approved_at']
+        nested_fields = {'task': ('id', 'name')}
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['task'] = TaskDropDownSerializer(instance.task).data
+        if 'task' in representation:
+            representation['task'] = TaskDropDownSerializer(instance.task).data
         return representation
 
     def validate(self, data):
@@ -108,23 +403,29 @@ class DeadlineExtensionRequestSerializer(serializers.ModelSerializer):
         return data
 
 
-class DeadlineExtensionApprovalSerializer(serializers.ModelSerializer):
+class DeadlineExtensionApprovalSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = DeadlineExtensionLog
         fields = ['id', 'task', 'new_deadline', 'status', 'approved_at']
         read_only_fields = ['task', 'new_deadline', 'approved_at']
+        nested_fields = {'task': ('id', 'name')}
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['task'] = TaskDropDownSerializer(instance.task).data
+        if 'task' in representation:
+            representation['task'] = TaskDropDownSerializer(instance.task).data
         return representation
 
     def update(self, instance, validated_data):
         status = validated_data.get('status', instance.status)
-
-        # Rule 5: An extension request can only be approved or rejected by the task's assigned_to user
-        if status in ['APPROVED', 'REJECTED'] and self.context['request'].user != instance.task.assigned_by:
-            raise serializers.ValidationError("Only the assigned user can approve or reject a deadline extension request.")
+        previous_status = instance.status
+        user = self.context['request'].user
+
+        # PENDING -> APPROVED/REJECTED, decided only by the task owner (Rule 5)
+        try:
+            EXTENSION_STATUS.check(instance, status, user)
+        except TransitionError as e:
+            raise serializers.ValidationError(str(e))
         
         # Update fields 
         for attr, value in validated_data.items():
@@ -132,43 +433,94 @@ class DeadlineExtensionApprovalSerializer(serializers.ModelSerializer):
 
         if status == "APPROVED":
             instance.approved_at = now()
-            task = instance.task
+            # Lock the task too so a concurrent task update can't overwrite the new deadline
+            task = Task.objects.select_for_update().get(pk=instance.task_id)
             task.due_date = instance.new_deadline  # Update the task's deadline
-            task.save()
+            task.save_versioned(update_fields=['due_date'])
+            instance.task = task
 
         instance.save()
 
-        self._send_email(instance, status)
+        if EXTENSION_STATUS.announce([(instance, previous_status)], status, user):
+            notifications.extensions_decided([instance])
         
         return instance
 
-    def _send_email(self, extension_request, action):
-        """
-        Send an email notification about the approval or rejection.
-        """
-        task = extension_request.task
-        developer_email = extension_request.request_by.email
-
-        subject = f"Deadline Extension {action.capitalize()} for Task: {task.name}"
-        if action == "APPROVED":
-            message = (
-                f"The deadline extension for task '{task.name}' has been approved.\n\n"
-                f"New Deadline: {extension_request.new_deadline}"
-            )
-        else:
-            message = f"The deadline extension for task '{task.name}' has been rejected."
-
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [developer_email])
-
-
-
 
-
-
-class LoginSerializer(serializers.ModelSerializer):
-    username = serializers.CharField()
+class ExtensionDecisionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=['APPROVED', 'REJECTED'])
+
+
+class DeadlineExtensionBulkDecisionSerializer(serializers.Serializer):
+    """
+    Approve or reject many extension requests at once. Either every decision is
+    applied or none is.
+    """
+    decisions = ExtensionDecisionSerializer(many=True, allow_empty=False, max_length=500)
+
+    def validate_decisions(self, decisions):
+        ids = [decision['id'] for decision in decisions]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each extension request can only be decided once per call.")
+        return decisions
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        decisions = {decision['id']: decision['status'] for decision in validated_data['decisions']}
+
+        with tenancy.atomic():
+            # One guarded UPDATE per decided status: only PENDING requests on tasks this user assigned (Rule 5) move
+            decided_at = now()
+            applied = set()
+            for status in ('APPROVED', 'REJECTED'):
+                pks = [pk for pk, decision in decisions.items() if decision == status]
+                if pks:
+                    extra = {'approved_by': user, 'approved_at': decided_at} if status == 'APPROVED' else {'approved_by': user}
+                    changes = EXTENSION_STATUS.bulk_transition(DeadlineExtensionLog.objects.filter(pk__in=pks), status, user, **extra)
+                    applied.update(change.pk for change in changes)
+
+            extension_requests = {
+                extension.pk: extension
+                for extension in DeadlineExtensionLog.objects.select_related('task', 'request_by').filter(pk__in=decisions)
+            }
+            errors = {}
+            for pk in decisions.keys() - applied:
+                extension = extension_requests.get(pk)
+                if extension is None or extension.task.assigned_by_id != user.pk:
+                    errors[pk] = "Not found, or not a request on a task you assigned."
+                else:
+                    errors[pk] = f"Cannot change status from '{extension.status}' to '{decisions[pk]}'."
+            if errors:
+                # Either every decision is applied or none is
+                raise serializers.ValidationError({'decisions': dict(sorted(errors.items()))})
+
+            # Several approvals for one task: the latest deadline wins
+            new_deadlines = {}
+            for extension in extension_requests.values():
+                if extension.status == 'APPROVED':
+                    task_id = extension.task_id
+                    new_deadlines[task_id] = max(new_deadlines.get(task_id, extension.new_deadline), extension.new_deadline)
+
+            tasks = list(Task.objects.select_for_update().filter(pk__in=new_deadlines))
+            for task in tasks:
+                task.due_date = new_deadlines[task.pk]
+                task.version += 1
+                task.updated_at = decided_at
+            Task.objects.bulk_update(tasks, ['due_date', 'version', 'updated_at'])
+            if tasks:
+                tasks_bulk_updated.send(sender=Task, tasks=tasks, fields=['due_date'], user=user)
+
+            # One digest per requester, whatever the number of decisions
+            notifications.extensions_decided(extension_requests.values())
+
+        return list(extension_requests.values())
+
+
+
+class LoginSerializer(serializers.Serializer):
+    """
+    Plain fields only: no model introspection or uniqueness validators on the login path.
+    """
+    username = serializers.CharField(max_length=150)
     password = serializers.CharField(style={'input_type': 'password'})
-    
-    class Meta:
-        model = User
-        fields = ("username", "password")
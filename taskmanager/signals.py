@@ -1,44 +1,239 @@
-from django.db.models.signals import post_save
+from django.contrib.auth.models import User, Group
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from django.core.mail import send_mail
 from django.conf import settings
-from .models import Task, DeadlineExtensionLog
+from .models import Task, DeadlineExtensionLog, Workspace
+from .transitions import transitioned, tasks_bulk_updated, tasks_bulk_created
+from . import audit, feed, assignment, metrics, notifications, rollup, webhooks
+from .roles import DEVELOPER
 
+# Notifications are buffered and sent as per-recipient digests, see notifications.py
 @receiver(post_save, sender=Task)
-def send_task_assignment_email(sender, instance, created, **kwargs):
-    if created and instance.assigned_to:
-        subject = f"New Task Assigned: {instance.name}"
-        message = f"""
-        Hello {instance.assigned_to.username},
+def send_task_assignment_email(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.assigned_to:
+        notifications.task_assigned(instance)
 
-        You have been assigned a new task: "{instance.name}".
 
-        Details:
-        - Description: {instance.description}
-        - Due Date: {instance.due_date}
-        - Created At: {instance.created_at}
+@receiver(post_save, sender=DeadlineExtensionLog)
+def send_deadline_extention_email(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        notifications.extension_requested(instance)
+
+
+@receiver(post_save, sender=Task)
+def record_task_change(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    changes = audit.diff(instance)
+    if changes:
+        audit.record(instance.pk, changes, workspace_id=instance.workspace_id)
+    audit.mark_saved(instance)
+
+
+@receiver(post_delete, sender=Task)
+def record_task_deletion(sender, instance, **kwargs):
+    audit.record(instance.pk, {'deleted': True}, workspace_id=instance.workspace_id)
+
+
+@receiver(transitioned, sender=Task)
+def record_bulk_task_transition(sender, transitions, user=None, bulk=False, **kwargs):
+    # Instance saves are already recorded by post_save, only queryset updates need this
+    if bulk:
+        # Not from the active workspace: bulk transitions also run outside of requests
+        workspaces = dict(Task._base_manager.filter(pk__in=[transition.pk for transition in transitions]).values_list('pk', 'workspace_id'))
+        for transition in transitions:
+            audit.record(transition.pk, {'status': transition.target}, actor=user, workspace_id=workspaces.get(transition.pk))
+
+
+# Before the audit handlers below make the new values the loaded ones
+@receiver(pre_save, sender=Task)
+def remember_previous_users(sender, instance, raw=False, **kwargs):
+    if not raw:
+        feed.remember_previous_users(instance)
+
+
+@receiver(tasks_bulk_updated, sender=Task)
+def remember_bulk_previous_users(sender, tasks, **kwargs):
+    for task in tasks:
+        feed.remember_previous_users(task)
+
+
+@receiver(tasks_bulk_updated, sender=Task)
+@receiver(tasks_bulk_created, sender=Task)
+def record_bulk_task_update(sender, tasks, user=None, **kwargs):
+    for task in tasks:
+        changes = audit.diff(task)
+        if changes:
+            audit.record(task.pk, changes, actor=user, workspace_id=task.workspace_id)
+        audit.mark_saved(task)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=DeadlineExtensionLog)
+def capture_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        feed.capture(instance)
+
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=DeadlineExtensionLog)
+def capture_deletion(sender, instance, **kwargs):
+    feed.capture(instance, 'delete')
+
+
+@receiver(transitioned)
+def capture_bulk_transition(sender, transitions, bulk=False, **kwargs):
+    if bulk:
+        feed.capture_many(sender, [transition.pk for transition in transitions])
+
+
+@receiver(tasks_bulk_updated, sender=Task)
+@receiver(tasks_bulk_created, sender=Task)
+def capture_bulk_update(sender, tasks, **kwargs):
+    feed.capture_all(tasks)
+
+
+# Keep the in-memory workload index (assignment.py) current without re-aggregating
+@receiver(post_save, sender=Task)
+def track_task_load(sender, instance, raw=False, **kwargs):
+    if not raw:
+        assignment.track(instance)
+
+
+@receiver(post_delete, sender=Task)
+def untrack_task_load(sender, instance, **kwargs):
+    assignment.untrack(instance.pk)
+
+
+@receiver(transitioned, sender=Task)
+def track_bulk_transition_load(sender, transitions, bulk=False, **kwargs):
+    if bulk and assignment.current_indexes():
+        tasks = Task.objects.filter(pk__in=[transition.pk for transition in transitions])
+        for task in tasks.only('workspace', 'status', 'priority', 'due_date', 'assigned_to'):
+            assignment.track(task)
 
-        Please log in to the task manager app to view more details.
 
-        Best regards,
-        Task Manager Team
-        """
-        recipient_list = [instance.assigned_to.email]
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list)
+@receiver(tasks_bulk_updated, sender=Task)
+@receiver(tasks_bulk_created, sender=Task)
+def track_bulk_update_load(sender, tasks, **kwargs):
+    for task in tasks:
+        assignment.track(task)
+
+
+# Keep the subtask rollups of the parents current (rollup.py)
+@receiver(pre_save, sender=Task)
+def remember_rollup_parents(sender, instance, raw=False, **kwargs):
+    # The loaded values are still the old ones here
+    if not raw:
+        instance._rollup_parents = rollup.changed_parents(instance)
+
+
+@receiver(post_save, sender=Task)
+def refresh_parent_rollups(sender, instance, raw=False, **kwargs):
+    rollup.refresh_many(instance.__dict__.pop('_rollup_parents', ()))
+
+
+@receiver(post_delete, sender=Task)
+def refresh_parent_rollup_after_delete(sender, instance, **kwargs):
+    # Parents deleted in the same cascade are skipped by refresh()
+    if instance.parent_task_id is not None:
+        rollup.refresh(instance.parent_task_id)
+
+
+@receiver(transitioned, sender=Task)
+def refresh_bulk_transition_rollups(sender, transitions, bulk=False, **kwargs):
+    if bulk:
+        tasks = Task.objects.filter(pk__in=[transition.pk for transition in transitions])
+        rollup.refresh_many(tasks.values_list('parent_task_id', flat=True).distinct())
+
+
+@receiver(tasks_bulk_updated, sender=Task)
+def refresh_bulk_update_rollups(sender, tasks, fields=(), **kwargs):
+    if {'status', 'due_date', 'parent_task'} & set(fields):
+        rollup.refresh_many(task.parent_task_id for task in tasks)
+
+
+@receiver(tasks_bulk_created, sender=Task)
+def refresh_bulk_create_rollups(sender, tasks, **kwargs):
+    # Created trees are filled in from their leaves' parents up
+    rollup.refresh_many(task.parent_task_id for task in tasks)
+
+
+# Fold status changes and extension requests into the per-developer metrics (metrics.py)
+@receiver(transitioned, sender=Task)
+def track_transition_metrics(sender, transitions, **kwargs):
+    metrics.record_transitions(transitions)
 
 
 @receiver(post_save, sender=DeadlineExtensionLog)
-def send_deadline_extention_email(sender, instance, created, **kwargs):
-    if created:
-        subject = f"Task Deadline Extension Request by {instance.request_by}"
-        message = f"""
-        Hello,
-
-        A deadline extension request has been made for the task "{instance.task.name}" by {instance.request_by.username}.
-        The new due date is: {instance.new_deadline}.
-        Reason: {instance.reason}
-        Requested By: {instance.request_by.username}
-        """ 
-        recipient_list = ['karan.lodaya@weservecodes.com']
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list)
+def track_extension_request_metrics(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        metrics.extension_requested(instance)
+
+
+# Queue the webhook deliveries of subscribed endpoints (webhooks.py)
+@receiver(pre_save, sender=Task)
+def remember_assignee_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance._assignee_changed = webhooks.assignee_changed(instance)
+
+
+@receiver(post_save, sender=Task)
+def queue_assignment_webhooks(sender, instance, raw=False, **kwargs):
+    if instance.__dict__.pop('_assignee_changed', False) and instance.assigned_to_id is not None:
+        webhooks.tasks_assigned([instance])
+
+
+@receiver(tasks_bulk_updated, sender=Task)
+def queue_bulk_assignment_webhooks(sender, tasks, fields=(), **kwargs):
+    if 'assigned_to' in fields:
+        webhooks.tasks_assigned([task for task in tasks if task.assigned_to_id is not None])
+
+
+@receiver(tasks_bulk_created, sender=Task)
+def queue_bulk_create_assignment_webhooks(sender, tasks, **kwargs):
+    webhooks.tasks_assigned([task for task in tasks if task.assigned_to_id is not None])
+
+
+@receiver(transitioned)
+def queue_transition_webhooks(sender, transitions, user=None, **kwargs):
+    webhooks.transitions_applied(sender, transitions, user)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def track_developers(sender, instance, action, pk_set, reverse=False, **kwargs):
+    indexes = assignment.current_indexes()
+    if not indexes or action not in ('post_add', 'post_remove'):
+        return
+    # user.groups.add(group), or reversed group.user_set.add(user)
+    group_ids, user_ids = ({instance.pk}, pk_set) if reverse else (pk_set, {instance.pk})
+    if not Group.objects.filter(pk__in=group_ids, name=DEVELOPER).exists():
+        return
+    memberships = Workspace.members.through.objects.filter(user__in=user_ids, workspace__in=indexes).values_list('workspace_id', 'user_id')
+    assignment.developers_changed(memberships, joined=action == 'post_add')
+
+
+@receiver(m2m_changed, sender=Workspace.members.through)
+def track_workspace_developers(sender, instance, action, pk_set, reverse=False, **kwargs):
+    indexes = assignment.current_indexes()
+    if not indexes or action not in ('post_add', 'post_remove'):
+        return
+    # workspace.members.add(user), or reversed user.workspaces.add(workspace)
+    workspace_ids, user_ids = (pk_set, {instance.pk}) if reverse else ({instance.pk}, pk_set)
+    workspace_ids = [workspace_id for workspace_id in workspace_ids if workspace_id in indexes]
+    if not workspace_ids:
+        return
+    developer_ids = list(User.objects.filter(pk__in=user_ids, groups__name=DEVELOPER).values_list('pk', flat=True))
+    assignment.developers_changed(
+        [(workspace_id, developer_id) for workspace_id in workspace_ids for developer_id in developer_ids],
+        joined=action == 'post_add',
+    )
+
 
+@receiver(post_save, sender=User)
+def join_default_workspace(sender, instance, created, raw=False, **kwargs):
+    # Single-organization installs keep working without managing workspaces
+    slug = getattr(settings, 'TASK_WORKSPACE_AUTO_JOIN', None)
+    if created and not raw and slug:
+        workspace, _ = Workspace.objects.get_or_create(slug=slug, defaults={'name': slug.capitalize()})
+        workspace.members.add(instance)
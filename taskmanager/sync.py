@@ -0,0 +1,153 @@
+"""
+Delta sync for offline clients.
+
+The cursor is the ChangeEvent sequence number the client has seen, wrapped
+in an opaque token. It does not depend on any clock, so clock skew between
+servers or devices cannot make a client skip changes, and sequence numbers
+are given in commit order (see feed.py), so neither can a long transaction. A sync reads the
+events after the cursor, collapses several changes to the same row into
+one, and loads the current rows with one query per model, so the cost
+follows the number of changes rather than the number of tasks.
+
+A client without a cursor gets everything visible to it, in pages of
+SNAPSHOT_PAGE_SIZE rows per model by primary key. Until the last page the
+cursor is a snapshot cursor that also holds the position in the snapshot.
+After the last page it is a plain sequence cursor.
+"""
+import base64
+import binascii
+
+from django.db.models import Q
+
+from . import feed
+from .models import Task, DeadlineExtensionLog
+
+
+CURSOR_PREFIX = 'v1:'
+SNAPSHOT_PREFIX = 's1:'
+SNAPSHOT_PAGE_SIZE = feed.BATCH_SIZE
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _wrap(prefix, numbers):
+    return base64.urlsafe_b64encode((prefix + ':'.join(map(str, numbers))).encode()).decode().rstrip('=')
+
+
+def _unwrap(cursor, prefix, count):
+    # The numbers of a cursor with `prefix`, None for a cursor of the other kind
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if not raw.startswith(prefix):
+        return None
+    numbers = raw[len(prefix):].split(':')
+    if len(numbers) != count or not all(number.isdigit() for number in numbers):
+        raise InvalidCursor(cursor)
+    return [int(number) for number in numbers]
+
+
+def encode_cursor(sequence):
+    return _wrap(CURSOR_PREFIX, [sequence])
+
+
+def decode_cursor(cursor):
+    numbers = _unwrap(cursor, CURSOR_PREFIX, 1)
+    if numbers is None:
+        raise InvalidCursor(cursor)
+    return numbers[0]
+
+
+def encode_snapshot_cursor(sequence, task_after, extension_after):
+    return _wrap(SNAPSHOT_PREFIX, [sequence, task_after, extension_after])
+
+
+def decode_snapshot_cursor(cursor):
+    """
+    (sequence, last task id, last extension id) of a snapshot in progress, or
+    None for a sequence cursor.
+    """
+    numbers = _unwrap(cursor, SNAPSHOT_PREFIX, 3)
+    return tuple(numbers) if numbers is not None else None
+
+
+def visible_tasks(user):
+    tasks = Task.objects.all()
+    if not user.is_superuser:
+        tasks = tasks.filter(Q(assigned_to=user) | Q(assigned_by=user))
+    return tasks
+
+
+def visible_extensions(user):
+    extensions = DeadlineExtensionLog.objects.all()
+    if not user.is_superuser:
+        extensions = extensions.filter(Q(request_by=user) | Q(task__assigned_to=user) | Q(task__assigned_by=user))
+    return extensions
+
+
+def full_snapshot(user, sequence=None, task_after=0, extension_after=0, limit=SNAPSHOT_PAGE_SIZE):
+    """
+    A page of everything the user can see, for a client without a cursor. The
+    sequence is taken before the first page so that changes made meanwhile are
+    sent again once the snapshot is done.
+    """
+    if sequence is None:
+        sequence = feed.latest_sequence()
+    tasks = list(visible_tasks(user).filter(pk__gt=task_after).order_by('pk')[:limit + 1])
+    extensions = list(visible_extensions(user).filter(pk__gt=extension_after).order_by('pk')[:limit + 1])
+    has_more = len(tasks) > limit or len(extensions) > limit
+    tasks, extensions = tasks[:limit], extensions[:limit]
+
+    if has_more:
+        cursor = encode_snapshot_cursor(
+            sequence, tasks[-1].pk if tasks else task_after, extensions[-1].pk if extensions else extension_after,
+        )
+    else:
+        cursor = encode_cursor(sequence)
+    return {
+        'sequence': sequence,
+        'cursor': cursor,
+        'has_more': has_more,
+        'tasks': tasks,
+        'deadline_extensions': extensions,
+        'deleted_tasks': [],
+        'deleted_deadline_extensions': [],
+    }
+
+
+def changes_since(user, sequence, limit=feed.BATCH_SIZE):
+    events = feed.events_after(sequence, user, limit=limit + 1)
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    # Only the last change of each row matters
+    latest = {}
+    for event in events:
+        latest[(event.model, event.object_id)] = event.operation
+
+    upserted = {'task': [], 'deadlineextensionlog': []}
+    deleted = {'task': [], 'deadlineextensionlog': []}
+    for (model, object_id), operation in latest.items():
+        (deleted if operation == 'delete' else upserted)[model].append(object_id)
+
+    tasks = list(visible_tasks(user).filter(pk__in=upserted['task'])) if upserted['task'] else []
+    extensions = list(visible_extensions(user).filter(pk__in=upserted['deadlineextensionlog'])) if upserted['deadlineextensionlog'] else []
+
+    # Rows that changed but are no longer visible (deleted later, or reassigned away) become tombstones too.
+    # The previous owner and assignee see the event that took the task away (feed.visible_to).
+    deleted['task'] += sorted(set(upserted['task']) - {task.pk for task in tasks})
+    deleted['deadlineextensionlog'] += sorted(set(upserted['deadlineextensionlog']) - {extension.pk for extension in extensions})
+
+    sequence = events[-1].sequence if events else sequence
+    return {
+        'sequence': sequence,
+        'cursor': encode_cursor(sequence),
+        'has_more': has_more,
+        'tasks': tasks,
+        'deadline_extensions': extensions,
+        'deleted_tasks': deleted['task'],
+        'deleted_deadline_extensions': deleted['deadlineextensionlog'],
+    }
@@ -0,0 +1,169 @@
+"""
+Workspaces (tenants).
+
+Every Task, DeadlineExtensionLog, TaskTemplate and ArchivedTask belongs
+to a workspace. API views activate the request's workspace
+(WorkspaceScopedMixin) and, while one is active, the default managers of
+the workspace models only ever return its rows, so no view, filter or
+helper can read or change another tenant's data by accident. Management commands and the admin run
+without an active workspace and see everything.
+
+The workspace comes from the X-Workspace header (its slug), or is the
+user's first workspace when the header is missing. Every query of a tenant
+starts with its workspace id and the tenant-leading indexes, so its cost
+does not grow with the number of other tenants.
+
+A large tenant can be given its own database: set Workspace.database to
+an alias from settings.DATABASES and WorkspaceRouter sends its task
+tables there. That database carries the full schema (run migrate for the
+alias) and a copy of the users. The audit log and the change feed stay
+in the default database.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from rest_framework.exceptions import PermissionDenied
+
+
+WORKSPACE_HEADER = 'X-Workspace'
+
+# Routed to the workspace's database (the auto-created M2M table goes with Task)
+ROUTED_MODELS = {
+    'task', 'deadlineextensionlog', 'tasktemplate', 'archivedtask', 'task_deadline_extension_logs',
+    'developerdailystats', 'developermetrics',
+}
+
+_active = ContextVar('taskmanager_active_workspace', default=None)
+
+
+def active_workspace():
+    return _active.get()
+
+
+@contextmanager
+def activate(workspace):
+    """
+    Scope every workspace model query inside the block to `workspace`.
+    """
+    token = _active.set(workspace)
+    try:
+        yield workspace
+    finally:
+        _active.reset(token)
+
+
+def resolve_workspace(request):
+    """
+    The workspace named by the X-Workspace header, or the user's first one.
+    Users only get workspaces they are a member of, superusers any.
+    """
+    from .models import Workspace
+
+    user = request.user
+    workspaces = Workspace.objects.all() if user.is_superuser else user.workspaces.all()
+    slug = request.headers.get(WORKSPACE_HEADER)
+    if slug:
+        workspace = workspaces.filter(slug=slug).first()
+        if workspace is None:
+            raise PermissionDenied(f"You are not a member of the workspace '{slug}'.")
+        return workspace
+
+    workspace = workspaces.order_by('pk').first()
+    if workspace is None:
+        raise PermissionDenied("You are not a member of any workspace.")
+    return workspace
+
+
+def is_member(user):
+    """
+    Whether `user` may be given tasks in the active workspace (always, outside of one).
+    """
+    workspace = active_workspace()
+    return workspace is None or workspace.members.filter(pk=user.pk).exists()
+
+
+class WorkspaceScopedMixin:
+    """
+    For DRF views: resolves and activates the request's workspace once the
+    user is authenticated, for the rest of the request.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        request.workspace = resolve_workspace(request)
+        self._workspace_token = _active.set(request.workspace)
+
+    def _deactivate(self):
+        token = getattr(self, '_workspace_token', None)
+        if token is not None:
+            _active.reset(token)
+            self._workspace_token = None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        self._deactivate()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Uncaught exceptions skip finalize_response, the thread's next request must not inherit the workspace
+            self._deactivate()
+
+
+def database_for(workspace):
+    if workspace is not None and workspace.database in connections.databases:
+        return workspace.database
+    return DEFAULT_DB_ALIAS
+
+
+def databases():
+    """
+    Every database alias that holds workspace data.
+    """
+    from .models import Workspace
+
+    aliases = set(Workspace.objects.values_list('database', flat=True)) | {DEFAULT_DB_ALIAS}
+    return sorted(alias for alias in aliases if alias in connections.databases)
+
+
+def atomic():
+    """
+    transaction.atomic() on the database the active workspace's tasks live in.
+    """
+    return transaction.atomic(using=router.db_for_write(_task_model()))
+
+
+def on_commit(func):
+    transaction.on_commit(func, using=router.db_for_write(_task_model()))
+
+
+def _task_model():
+    from .models import Task
+    return Task
+
+
+class WorkspaceRouter:
+    """
+    Sends the task tables of the active workspace to its own database.
+    """
+
+    def _route(self, model):
+        if model._meta.app_label == 'taskmanager' and model._meta.model_name in ROUTED_MODELS:
+            workspace = active_workspace()
+            if workspace is not None and workspace.database != DEFAULT_DB_ALIAS:
+                return database_for(workspace)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Users and workspaces are copied to every tenant database
+        if {obj1._meta.model_name, obj2._meta.model_name} & {'user', 'workspace'}:
+            return True
+        return None
@@ -1,3 +1,1511 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import datetime
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.contrib import admin
+from django.contrib.auth.models import User, Group, Permission
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction, OperationalError
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from asgiref.sync import async_to_sync
+
+from task_managment import database
+
+from .admin import EstimatedCountPaginator, TaskAutocompleteFilter
+from . import archive, assignment, audit, feed, idempotency, metrics, notifications, profiling, recurrence, rollup, sync, tenancy, throttling, timeline, webhooks, work_queue
+from .concurrency import PreconditionFailed
+from .roles import SHARED_POOL
+from .filters import TaskFilter
+from .models import Task, DeadlineExtensionLog, TaskEvent, TaskTemplate, ArchivedTask, ChangeEvent, Workspace, Notification, DeveloperDailyStats, IdempotencyKey, StaleVersionError, WebhookEndpoint, WebhookDelivery
+from .serializers import TaskSerializer, TaskTemplateSerializer, TaskTemplateNodeSerializer, TaskBulkAutoAssignSerializer, DeadlineExtensionApprovalSerializer, DeadlineExtensionBulkDecisionSerializer
+from .transitions import TASK_STATUS, TransitionError, transitioned, tasks_bulk_updated
+from .views import TaskListCreateView, TaskDetailView, TaskClaimView, DeadlineExtensionRequestListCreateView, TaskTimelineView, DeveloperMetricsView, LoginAPIView, task_change_feed
+
+
+def make_task(user, **kwargs):
+    fields = {
+        'name': 'Task',
+        'description': '',
+        'due_date': datetime.date.today() + datetime.timedelta(days=7),
+        'assigned_to': user,
+        'assigned_by': user,
+    }
+    fields.update(kwargs)
+    return Task.objects.create(**fields)
+
+
+class TaskVersioningTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.task = make_task(self.user)
+
+    def test_save_versioned_bumps_version(self):
+        self.task.name = 'Renamed'
+        self.task.save_versioned()
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.version, 2)
+        self.assertEqual(self.task.name, 'Renamed')
+
+    def test_stale_instance_cannot_overwrite(self):
+        first = Task.objects.get(pk=self.task.pk)
+        second = Task.objects.get(pk=self.task.pk)
+
+        first.name = 'First'
+        first.save_versioned()
+
+        second.name = 'Second'
+        with self.assertRaises(StaleVersionError):
+            second.save_versioned()
+
+        self.assertEqual(Task.objects.get(pk=self.task.pk).name, 'First')
+
+    def test_if_match_mismatch_is_rejected(self):
+        request = APIRequestFactory().patch('/tasks/', HTTP_IF_MATCH='"7"')
+        serializer = TaskSerializer(self.task, data={'name': 'New'}, partial=True, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+
+        with self.assertRaises(PreconditionFailed):
+            serializer.save()
+
+
+class TaskConcurrencyStressTests(TransactionTestCase):
+    """
+    Many writers doing read-modify-write on the same task at once. Every writer
+    appends its own marker, so a lost update would show up as a missing marker.
+    """
+    writers = 8
+    writes_per_writer = 10
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.task = make_task(self.user)
+
+    def _writer(self, number, conflicts):
+        try:
+            for write in range(self.writes_per_writer):
+                while True:
+                    try:
+                        task = Task.objects.get(pk=self.task.pk)
+                        task.description += f'[{number}:{write}]'
+                        task.save_versioned(update_fields=['description'])
+                        break
+                    except (StaleVersionError, OperationalError):
+                        # Lost the race (or the sqlite write lock), re-read and retry
+                        conflicts.append(number)
+                        time.sleep(0.001)
+        finally:
+            connection.close()
+
+    def test_parallel_writers_do_not_lose_updates(self):
+        conflicts = []
+        threads = [threading.Thread(target=self._writer, args=(number, conflicts)) for number in range(self.writers)]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        task = Task.objects.get(pk=self.task.pk)
+        total = self.writers * self.writes_per_writer
+        for number in range(self.writers):
+            for write in range(self.writes_per_writer):
+                self.assertIn(f'[{number}:{write}]', task.description)
+        self.assertEqual(task.version, 1 + total)
+        # Retries must not stall the writers, keep well above a few writes/s
+        self.assertGreater(total / elapsed, 5, f'{len(conflicts)} retries in {elapsed:.2f}s')
+
+
+class TaskStateMachineTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+
+    def test_pending_cannot_jump_to_completed(self):
+        task = make_task(self.user)
+        with self.assertRaisesMessage(TransitionError, 'must be In Progress'):
+            TASK_STATUS.check(task, 'Completed')
+
+    def test_completed_requires_completed_parent(self):
+        parent = make_task(self.user)
+        child = make_task(self.user, parent_task=parent, status='In Progress')
+        with self.assertRaisesMessage(TransitionError, 'dependencies are completed'):
+            TASK_STATUS.check(child, 'Completed')
+
+    def test_bulk_update_rechecks_the_source_state(self):
+        moved = make_task(self.user, status='In Progress')
+        reopened = make_task(self.user, status='In Progress')
+
+        # Another writer changes a row between the locking read and the UPDATE (no row locks on SQLite)
+        changed = []
+        def concurrent_write(execute, sql, params, many, context):
+            if sql.startswith('UPDATE') and not changed:
+                changed.append(True)
+                Task.objects.filter(pk=reopened.pk).update(status='Pending')
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(concurrent_write):
+            changes = TASK_STATUS.bulk_transition(Task.objects.all(), 'Completed')
+        self.assertEqual([change.pk for change in changes], [moved.pk])
+        self.assertEqual(Task.objects.get(pk=reopened.pk).status, 'Pending')
+
+    def test_bulk_transition_skips_ineligible_rows(self):
+        parent = make_task(self.user, status='In Progress')
+        ready = make_task(self.user, status='In Progress')
+        blocked = make_task(self.user, parent_task=parent, status='In Progress')
+        pending = make_task(self.user)
+
+        received = []
+        handler = lambda sender, transitions, **kwargs: received.extend(transitions)
+        transitioned.connect(handler, sender=Task)
+        try:
+            changes = TASK_STATUS.bulk_transition(Task.objects.all(), 'Completed')
+        finally:
+            transitioned.disconnect(handler, sender=Task)
+
+        self.assertEqual({change.pk for change in changes}, {parent.pk, ready.pk})
+        self.assertEqual(received, changes)
+        self.assertEqual(Task.objects.get(pk=blocked.pk).status, 'In Progress')
+        self.assertEqual(Task.objects.get(pk=pending.pk).status, 'Pending')
+        self.assertEqual(Task.objects.get(pk=ready.pk).version, 2)
+
+
+class TaskAuditTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+
+    def test_only_changed_fields_are_recorded(self):
+        task = make_task(self.user)
+        task = Task.objects.get(pk=task.pk)
+        task.status = 'In Progress'
+        task.save()
+
+        changes = list(TaskEvent.objects.for_task(task.pk).values_list('changes', flat=True))
+        self.assertEqual(len(changes), 2)
+        self.assertEqual(changes[0]['status'], 'Pending')
+        self.assertEqual(changes[1], {'status': 'In Progress'})
+
+    def test_state_at_replays_history(self):
+        task = make_task(self.user, name='Before')
+        between = now()
+        task = Task.objects.get(pk=task.pk)
+        task.name = 'After'
+        task.save()
+
+        self.assertEqual(TaskEvent.objects.state_at(task.pk, between)['name'], 'Before')
+        self.assertEqual(TaskEvent.objects.state_at(task.pk, now())['name'], 'After')
+
+        task.delete()
+        self.assertIsNone(TaskEvent.objects.state_at(task.pk, now()))
+
+    def test_batch_writes_one_insert_for_bulk_changes(self):
+        for _ in range(5):
+            make_task(self.user, status='In Progress')
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            with audit.batch():
+                TASK_STATUS.bulk_transition(Task.objects.all(), 'Completed')
+
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "taskmanager_taskevent"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(TaskEvent.objects.filter(changes__status='Completed').count(), 5)
+
+    def test_buffered_events_of_a_rolled_back_block_are_dropped(self):
+        task = make_task(self.user)
+        with self.captureOnCommitCallbacks(execute=True), audit.batch():
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                TASK_STATUS.bulk_transition(Task.objects.filter(pk=task.pk), 'In Progress')
+                raise RuntimeError('rolled back')
+            task = Task.objects.get(pk=task.pk)
+            task.name = 'Renamed'
+            task.save()
+
+        self.assertEqual(Task.objects.get(pk=task.pk).status, 'Pending')
+        changes = list(TaskEvent.objects.for_task(task.pk).values_list('changes', flat=True))
+        self.assertEqual(changes[1:], [{'name': 'Renamed'}])
+
+
+class ChangeFeedTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pass')
+
+    def test_writes_are_captured_in_sequence(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            task = make_task(self.user)
+            task.delete()
+
+        events = list(ChangeEvent.objects.order_by('sequence'))
+        self.assertEqual([event.operation for event in events], ['upsert', 'delete'])
+        self.assertEqual([event.sequence for event in events], [1, 2])
+        self.assertEqual(events[0].data['name'], 'Task')
+
+    def test_events_are_numbered_once_committed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_task(self.user, name='Early')
+        sequence = feed.latest_sequence()
+
+        with self.captureOnCommitCallbacks() as commit:
+            make_task(self.user, name='Late')
+        # Not delivered while its transaction is open, and the cursor does not move past it
+        self.assertEqual(feed.events_after(sequence, self.user), [])
+        self.assertEqual(sync.changes_since(self.user, sequence)['sequence'], sequence)
+
+        for callback in commit:
+            callback()
+        [event] = feed.events_after(sequence, self.user)
+        self.assertEqual((event.data['name'], event.sequence), ('Late', sequence + 1))
+        self.assertEqual(feed.number_events(), 0)
+
+    def test_users_only_see_their_own_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_task(self.user)
+
+        self.assertEqual(len(feed.events_after(0, self.user)), 1)
+        self.assertEqual(feed.events_after(0, self.other), [])
+
+    def test_stream_resumes_after_last_event_id(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_task(self.user, name='First')
+            make_task(self.user, name='Second')
+        first = ChangeEvent.objects.order_by('sequence').first()
+
+        async def first_frame():
+            frames = feed.stream(self.user, first.workspace_id, last_event_id=first.sequence)
+            try:
+                return await frames.__anext__()
+            finally:
+                await frames.aclose()
+
+        frame = async_to_sync(first_frame)()
+        self.assertIn('"name": "Second"', frame)
+        self.assertTrue(frame.startswith(f'id: {first.sequence + 1}'))
+
+
+class DeltaSyncTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(sync.decode_cursor(sync.encode_cursor(42)), 42)
+        with self.assertRaises(sync.InvalidCursor):
+            sync.decode_cursor('not-a-cursor')
+
+    def test_changes_since_returns_upserts_and_tombstones(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            kept = make_task(self.user, name='Kept')
+            removed = make_task(self.user, name='Removed')
+        sequence = feed.latest_sequence()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            kept.name = 'Renamed'
+            kept.save()
+            kept.save()
+            removed_pk = removed.pk
+            removed.delete()
+            make_task(self.user, name='Added')
+
+        changes = sync.changes_since(self.user, sequence)
+        self.assertEqual(sorted(task.name for task in changes['tasks']), ['Added', 'Renamed'])
+        self.assertEqual(changes['deleted_tasks'], [removed_pk])
+        self.assertFalse(changes['has_more'])
+        self.assertEqual(sync.changes_since(self.user, changes['sequence'])['tasks'], [])
+
+    def test_reassigned_tasks_become_tombstones_for_the_previous_assignee(self):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        other = User.objects.create_user('other', 'other@example.com', 'pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            task = make_task(self.user, assigned_by=owner)
+            moved = make_task(self.user, assigned_by=owner)
+        sequence = feed.latest_sequence()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.get(pk=task.pk)
+            task.assigned_to = other
+            task.save()
+            # A bulk reassignment too
+            moved = Task.objects.get(pk=moved.pk)
+            moved.assigned_to = other
+            Task.objects.bulk_update([moved], ['assigned_to'])
+            tasks_bulk_updated.send(sender=Task, tasks=[moved], fields=['assigned_to'], user=owner)
+
+        changes = sync.changes_since(self.user, sequence)
+        self.assertEqual((changes['tasks'], changes['deleted_tasks']), ([], [task.pk, moved.pk]))
+        self.assertEqual(len(sync.changes_since(other, sequence)['tasks']), 2)
+
+    def test_snapshot_is_paged(self):
+        tasks = [make_task(self.user, name=f'Task {number}') for number in range(5)]
+        seen, cursor = [], None
+        while True:
+            if cursor is None:
+                page = sync.full_snapshot(self.user, limit=2)
+            else:
+                page = sync.full_snapshot(self.user, *sync.decode_snapshot_cursor(cursor), limit=2)
+            seen += [task.pk for task in page['tasks']]
+            cursor = page['cursor']
+            if not page['has_more']:
+                break
+        self.assertEqual(seen, [task.pk for task in tasks])
+        # The last page hands over to delta sync from where the snapshot started
+        self.assertIsNone(sync.decode_snapshot_cursor(cursor))
+        self.assertEqual(sync.decode_cursor(cursor), page['sequence'])
+
+
+class AdminPerformanceTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.tasks = [make_task(self.admin, name=f'Task {number}', description='x' * 1000) for number in range(5)]
+        self.request = RequestFactory().get('/admin/')
+        self.request.user = self.admin
+
+    def test_count_is_capped(self):
+        class SmallLimitPaginator(EstimatedCountPaginator):
+            count_limit = 3
+
+        self.assertEqual(EstimatedCountPaginator(Task.objects.order_by('pk'), 2).count, 5)
+        paginator = SmallLimitPaginator(Task.objects.order_by('pk'), 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 3)
+        self.assertIn('LIMIT 3', queries[0]['sql'])
+
+    def test_autocomplete_filter_narrows_to_the_selected_row(self):
+        task, other = self.tasks[:2]
+        for extension_task in (task, other):
+            DeadlineExtensionLog.objects.create(task=extension_task, reason='More time', new_deadline=extension_task.due_date, request_by=self.admin)
+
+        model_admin = admin.site._registry[DeadlineExtensionLog]
+        selected = TaskAutocompleteFilter(self.request, {'task__id__exact': [str(task.pk)]}, DeadlineExtensionLog, model_admin)
+        self.assertEqual(list(selected.queryset(self.request, DeadlineExtensionLog.objects.all()).values_list('task', flat=True)), [task.pk])
+        self.assertEqual(selected.lookups(self.request, model_admin), ())
+
+        unfiltered = TaskAutocompleteFilter(self.request, {}, DeadlineExtensionLog, model_admin)
+        self.assertEqual(unfiltered.queryset(self.request, DeadlineExtensionLog.objects.all()).count(), 2)
+
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/taskmanager/deadlineextensionlog/', {'task__id__exact': task.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_changelist_queries_do_not_grow_with_the_rows(self):
+        self.client.force_login(self.admin)
+
+        def changelist_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get('/admin/taskmanager/task/').status_code, 200)
+            return [query['sql'] for query in queries]
+
+        before = changelist_queries()
+        for number in range(20):
+            make_task(self.admin, name=f'More {number}')
+        after = changelist_queries()
+        self.assertEqual(len(after), len(before))
+        # The narrow SELECT leaves the long description out
+        rows = [sql for sql in after if 'FROM "taskmanager_task"' in sql and 'ORDER BY' in sql]
+        self.assertTrue(rows)
+        self.assertNotIn('"description"', rows[0])
+
+
+class BulkExtensionDecisionTests(TestCase):
+
+    def setUp(self):
+        self.provider = User.objects.create_user('provider', 'provider@example.com', 'pass')
+        self.first_dev = User.objects.create_user('first', 'first@example.com', 'pass')
+        self.second_dev = User.objects.create_user('second', 'second@example.com', 'pass')
+        self.task = make_task(self.first_dev, assigned_by=self.provider)
+        self.other_task = make_task(self.second_dev, assigned_by=self.provider)
+
+    def request_extension(self, task, user, days):
+        return DeadlineExtensionLog.objects.create(
+            task=task, request_by=user, reason='More time', new_deadline=task.due_date + datetime.timedelta(days=days),
+        )
+
+    def decide(self, user, decisions):
+        request = APIRequestFactory().post('/deadline-extension-approvals/bulk/')
+        request.user = user
+        serializer = DeadlineExtensionBulkDecisionSerializer(data={'decisions': decisions}, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    @override_settings(TASK_NOTIFICATION_WINDOW=0)
+    def test_decisions_are_applied_together_with_one_email_per_requester(self):
+        first = self.request_extension(self.task, self.first_dev, 3)
+        second = self.request_extension(self.task, self.first_dev, 5)
+        third = self.request_extension(self.other_task, self.second_dev, 2)
+        Notification.objects.all().delete()
+        mail.outbox = []
+
+        self.decide(self.provider, [
+            {'id': first.pk, 'status': 'APPROVED'},
+            {'id': second.pk, 'status': 'APPROVED'},
+            {'id': third.pk, 'status': 'REJECTED'},
+        ])
+        # Sent by the digest command, never from the request
+        self.assertEqual(mail.outbox, [])
+        call_command('send_notification_digests', stdout=io.StringIO())
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.due_date, second.new_deadline)
+        self.assertEqual(self.task.version, 2)
+        self.assertEqual(DeadlineExtensionLog.objects.get(pk=third.pk).status, 'REJECTED')
+        self.assertIsNotNone(DeadlineExtensionLog.objects.get(pk=first.pk).approved_at)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['first@example.com', 'second@example.com'])
+        self.assertEqual(mail.outbox[0].body.count("': approved"), 2)
+
+    def test_single_decision_moves_the_deadline(self):
+        extension = self.request_extension(self.task, self.first_dev, 3)
+        request = APIRequestFactory().patch(f'/deadline-extension-approvals/{extension.pk}/')
+        request.user = self.provider
+        serializer = DeadlineExtensionApprovalSerializer(extension, data={'status': 'APPROVED'}, partial=True, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.due_date, extension.new_deadline)
+
+    def test_requests_on_other_users_tasks_reject_the_whole_batch(self):
+        mine = self.request_extension(self.task, self.first_dev, 3)
+        foreign_task = make_task(self.first_dev, assigned_by=self.second_dev)
+        foreign = self.request_extension(foreign_task, self.first_dev, 3)
+
+        with self.assertRaises(ValidationError):
+            self.decide(self.provider, [{'id': mine.pk, 'status': 'APPROVED'}, {'id': foreign.pk, 'status': 'APPROVED'}])
+
+        self.assertEqual(DeadlineExtensionLog.objects.get(pk=mine.pk).status, 'PENDING')
+
+
+class AutoAssignmentTests(TestCase):
+
+    def setUp(self):
+        assignment.reset_index()
+        self.addCleanup(assignment.reset_index)
+        self.provider = User.objects.create_user('provider', 'provider@example.com', 'pass')
+        developers = Group.objects.create(name='Developer')
+        self.busy = User.objects.create_user('busy', 'busy@example.com', 'pass')
+        self.idle = User.objects.create_user('idle', 'idle@example.com', 'pass')
+        self.busy.groups.add(developers)
+        self.idle.groups.add(developers)
+
+    def test_load_index_prefers_least_loaded(self):
+        index = assignment.LoadIndex([1, 2, 3])
+        index.set_task(10, 1, 5)
+        index.set_task(11, 2, 1)
+        self.assertEqual(index.least_loaded(), 3)
+
+        index.set_task(12, 3, 8)
+        self.assertEqual(index.least_loaded(), 2)
+        index.discard_task(12)
+        self.assertEqual(index.least_loaded(), 3)
+
+    def test_batch_assignment_balances_load(self):
+        index = assignment.LoadIndex([1, 2])
+        self.assertEqual(index.assign([4, 1, 1, 1, 1]), [1, 2, 2, 2, 2])
+        self.assertEqual(index.loads, {1: 0.0, 2: 0.0})
+
+    def test_auto_assign_picks_developer_and_index_follows_saves(self):
+        make_task(self.busy, assigned_by=self.provider, priority='URGENT')
+        request = APIRequestFactory().post('/tasks/')
+        request.user = self.provider
+        data = {'name': 'New', 'description': 'Details', 'due_date': datetime.date.today() + datetime.timedelta(days=3), 'auto_assign': True}
+
+        serializer = TaskSerializer(data=data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            task = serializer.save(assigned_by=self.provider)
+        self.assertEqual(task.assigned_to, self.idle)
+
+        # Both now carry load. Queryset updates bypass the signals, the index sees them once it is rebuilt
+        Task.objects.filter(assigned_to=self.busy).update(status='Completed')
+        self.assertEqual(assignment.get_index().least_loaded(), self.idle.pk)
+        with override_settings(TASK_ASSIGNMENT_INDEX_TTL=0):
+            self.assertEqual(assignment.get_index().least_loaded(), self.busy.pk)
+
+    def test_index_follows_committed_changes_only(self):
+        index = assignment.get_index()
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                make_task(self.idle, assigned_by=self.provider, priority='URGENT')
+                raise RuntimeError('rolled back')
+        self.assertEqual(index.loads, {self.busy.pk: 0.0, self.idle.pk: 0.0})
+
+        # Group membership changes from either side reach the index
+        newcomer = User.objects.create_user('newcomer', 'newcomer@example.com', 'pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            Group.objects.get(name='Developer').user_set.add(newcomer)
+        self.assertIn(newcomer.pk, index.loads)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.busy.groups.remove(Group.objects.get(name='Developer'))
+        self.assertNotIn(self.busy.pk, index.loads)
+
+    def test_reassigned_tasks_old_load_does_not_bias_the_pick(self):
+        index = assignment.LoadIndex([1, 2])
+        index.set_task(10, 1, 8)
+        index.set_task(11, 2, 4)
+        self.assertEqual(index.assign([8], excluding=[10]), [1])
+        self.assertEqual(index.loads, {1: 8.0, 2: 4.0})
+
+        urgent = make_task(self.busy, assigned_by=self.provider, priority='URGENT')
+        make_task(self.idle, assigned_by=self.provider, priority='ASAP')
+        assignment.get_index()
+        request = APIRequestFactory().post('/tasks/auto-assign/')
+        request.user = self.provider
+        serializer = TaskBulkAutoAssignSerializer(data={'tasks': [urgent.pk]}, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+        # Without its own load the busy developer is the less loaded one
+        self.assertEqual(Task.objects.get(pk=urgent.pk).assigned_to, self.busy)
+
+    def test_assigned_to_is_required_without_auto_assign(self):
+        serializer = TaskSerializer(data={'name': 'New', 'description': 'Details', 'due_date': datetime.date.today()})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('assigned_to', serializer.errors)
+
+
+class WorkQueueTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pass')
+
+    def test_priority_rank_follows_priority(self):
+        task = make_task(self.user, priority='ASAP')
+        self.assertEqual(task.priority_rank, 2)
+        task.priority = 'URGENT'
+        task.save(update_fields=['priority'])
+        self.assertEqual(Task.objects.get(pk=task.pk).priority_rank, 3)
+
+    def test_next_tasks_ordered_by_priority_then_due_date(self):
+        today = datetime.date.today()
+        late_urgent = make_task(self.user, priority='URGENT', due_date=today + datetime.timedelta(days=5))
+        soon_urgent = make_task(self.user, priority='URGENT', due_date=today + datetime.timedelta(days=1))
+        make_task(self.user, priority='When Free', due_date=today)
+        make_task(self.user, priority='URGENT', status='In Progress')
+
+        self.assertEqual(work_queue.next_tasks(self.user, limit=2), [soon_urgent, late_urgent])
+
+    def test_claim_takes_top_task_once(self):
+        top = make_task(self.user, priority='URGENT')
+        make_task(self.user, priority='When Free')
+
+        claimed = work_queue.claim_next(self.other, pool=self.user)
+        self.assertEqual(claimed, top)
+        claimed.refresh_from_db()
+        self.assertEqual((claimed.status, claimed.assigned_to), ('In Progress', self.other))
+        self.assertNotEqual(work_queue.claim_next(self.other, pool=self.user), top)
+        self.assertIsNone(work_queue.claim_next(self.other, pool=self.user))
+
+    def test_claiming_from_another_queue_needs_a_shared_pool(self):
+        top = make_task(self.user, priority='URGENT')
+        self.other.user_permissions.add(*Permission.objects.filter(codename__in=['view_task', 'change_task']))
+
+        def claim(pool):
+            request = APIRequestFactory().post('/tasks/claim/', {'pool': pool}, format='json')
+            force_authenticate(request, self.other)
+            return TaskClaimView.as_view()(request)
+
+        self.assertEqual(claim('abc').status_code, 400)
+        self.assertEqual(claim(self.user.pk).status_code, 403)
+        self.assertEqual(Task.objects.get(pk=top.pk).assigned_to, self.user)
+
+        self.user.groups.add(Group.objects.create(name=SHARED_POOL))
+        response = claim(self.user.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], top.pk)
+
+
+class RecurringTaskTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('lead', 'lead@example.com', 'pass')
+        self.monday = datetime.date(2026, 3, 2)
+
+    def make_template(self, **kwargs):
+        fields = {'name': 'Weekly report', 'description': 'Write it', 'schedule': '* * 1',
+                  'assigned_to': self.user, 'assigned_by': self.user, 'starts_on': self.monday}
+        fields.update(kwargs)
+        return TaskTemplate.objects.create(**fields)
+
+    def test_schedule_matching(self):
+        self.assertEqual(recurrence.Schedule('* * 1').between(self.monday, self.monday + datetime.timedelta(days=13)),
+                         [self.monday, self.monday + datetime.timedelta(days=7)])
+        # Day of month and day of week both restricted: either one matches
+        self.assertTrue(recurrence.Schedule('15 * 1').matches(datetime.date(2026, 3, 15)))
+        self.assertTrue(recurrence.Schedule('15 * 1').matches(self.monday))
+        self.assertFalse(recurrence.Schedule('1-10/2 3 *').matches(datetime.date(2026, 3, 2)))
+        for invalid in ('* *', '32 * *', '* * mon', '*/0 * *'):
+            with self.assertRaises(recurrence.InvalidSchedule):
+                recurrence.Schedule(invalid)
+
+    def test_materialize_creates_subtask_trees_once(self):
+        root = self.make_template(due_in_days=4)
+        review = TaskTemplate.objects.create(name='Review', description='Review it', parent=root, due_in_days=3,
+                                             assigned_to=self.user, assigned_by=self.user)
+        TaskTemplate.objects.create(name='Sign off', description='Sign it', parent=review, due_in_days=3,
+                                    assigned_to=self.user, assigned_by=self.user)
+        until = self.monday + datetime.timedelta(days=13)
+
+        self.assertEqual(recurrence.materialize(until, chunk_size=1), 6)
+
+        reports = Task.objects.filter(template=root).order_by('due_date')
+        self.assertEqual([task.due_date for task in reports], [self.monday + datetime.timedelta(days=4), self.monday + datetime.timedelta(days=11)])
+        self.assertEqual(reports[0].subtasks.get().subtasks.get().name, 'Sign off')
+        self.assertEqual(reports[0].priority_rank, 0)
+        self.assertEqual(ChangeEvent.objects.filter(model='task').count(), 6)
+
+        # Nothing new on a rerun, not even when the watermark is lost
+        self.assertEqual(recurrence.materialize(until), 0)
+        TaskTemplate.objects.update(materialized_until=None)
+        self.assertEqual(recurrence.materialize(until), 0)
+        self.assertEqual(Task.objects.count(), 6)
+
+    def test_materialize_uses_few_queries(self):
+        for _ in range(20):
+            self.make_template()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(recurrence.materialize(self.monday + datetime.timedelta(days=6)), 20)
+        self.assertLess(len(queries), 15)
+
+    def test_create_template_with_subtasks(self):
+        request = APIRequestFactory().post('/task-templates/')
+        request.user = self.user
+        serializer = TaskTemplateSerializer(data={
+            'name': 'Release', 'description': 'Ship it', 'schedule': '1 * *', 'assigned_to': self.user.pk,
+            'subtasks': [{'name': 'Changelog', 'description': 'Write it', 'subtasks': [{'name': 'Proofread', 'description': 'Read it'}]}],
+        }, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        template = serializer.save(assigned_by=self.user)
+
+        self.assertEqual(template.children.get().children.get().assigned_to, self.user)
+        self.assertEqual(serializer.data['subtasks'][0]['subtasks'][0]['name'], 'Proofread')
+
+        invalid = TaskTemplateSerializer(data={'name': 'X', 'description': 'X', 'schedule': '* * 9', 'assigned_to': self.user.pk})
+        self.assertFalse(invalid.is_valid())
+        self.assertIn('schedule', invalid.errors)
+
+    def test_subtask_templates_are_not_due_after_their_parent(self):
+        data = {
+            'name': 'Release', 'description': 'Ship it', 'schedule': '1 * *', 'assigned_to': self.user.pk, 'due_in_days': 3,
+            'subtasks': [{'name': 'Changelog', 'description': 'Write it', 'due_in_days': 2,
+                          'subtasks': [{'name': 'Proofread', 'description': 'Read it', 'due_in_days': 5}]}],
+        }
+        serializer = TaskTemplateSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('Proofread', str(serializer.errors))
+
+        root = self.make_template(due_in_days=4)
+        child = TaskTemplate.objects.create(name='Review', description='Review it', parent=root, due_in_days=3,
+                                            assigned_to=self.user, assigned_by=self.user)
+        self.assertFalse(TaskTemplateSerializer(root, data={'due_in_days': 2}, partial=True).is_valid())
+        self.assertFalse(TaskTemplateNodeSerializer(child, data={'due_in_days': 5}, partial=True).is_valid())
+        self.assertTrue(TaskTemplateNodeSerializer(child, data={'due_in_days': 4}, partial=True).is_valid())
+
+
+class WorkspaceTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.user.user_permissions.add(*Permission.objects.filter(codename__in=['view_task', 'add_task']))
+        self.outsider = User.objects.create_user('outsider', 'outsider@example.com', 'pass')
+        self.acme = Workspace.objects.create(name='Acme', slug='acme')
+        self.globex = Workspace.objects.create(name='Globex', slug='globex')
+        self.acme.members.add(self.user)
+        self.globex.members.add(self.outsider)
+        self.acme_task = make_task(self.user, name='Acme task', workspace=self.acme)
+        self.globex_task = make_task(self.outsider, name='Globex task', workspace=self.globex)
+
+    def test_managers_and_filters_only_see_the_active_workspace(self):
+        with tenancy.activate(self.acme):
+            self.assertEqual(list(Task.objects.all()), [self.acme_task])
+            self.assertFalse(Task.objects.filter(pk=self.globex_task.pk).exists())
+            self.assertEqual(list(TaskFilter({}, queryset=Task._base_manager.all()).qs), [self.acme_task])
+            self.assertEqual({event.object_id for event in ChangeEvent.objects.all()}, {self.acme_task.pk})
+        self.assertEqual(Task.objects.count(), 2)
+
+    def test_change_feed_is_scoped_to_a_workspace_of_the_user(self):
+        feed.number_events()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.assertEqual([event.object_id for event in feed.events_after(0, admin, workspace_id=self.acme.pk)], [self.acme_task.pk])
+
+        async def first_frame():
+            frames = feed.stream(admin, self.globex.pk, last_event_id=0)
+            try:
+                return await frames.__anext__()
+            finally:
+                await frames.aclose()
+        self.assertIn('"name": "Globex task"', async_to_sync(first_frame)())
+
+        token = AccessToken.for_user(self.user)
+        request = RequestFactory().get('/feed/', HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_X_WORKSPACE='globex')
+        response = async_to_sync(task_change_feed)(request)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn(b"workspace 'globex'", response.content)
+
+    def test_new_rows_join_the_active_workspace(self):
+        with tenancy.activate(self.globex):
+            task = make_task(self.outsider)
+            extension = DeadlineExtensionLog.objects.create(task=task, reason='More time', new_deadline=task.due_date, request_by=self.outsider)
+        self.assertEqual((task.workspace, extension.workspace), (self.globex, self.globex))
+        self.assertEqual(TaskEvent.objects.filter(task_id=task.pk).get().workspace_id, self.globex.pk)
+
+    def test_bulk_transitions_are_audited_in_the_task_workspace(self):
+        TASK_STATUS.bulk_transition(Task.objects.filter(pk=self.globex_task.pk), 'In Progress')
+        event = TaskEvent.objects.filter(task_id=self.globex_task.pk, changes={'status': 'In Progress'}).get()
+        self.assertEqual(event.workspace_id, self.globex.pk)
+
+    def test_list_view_is_scoped_to_the_request_workspace(self):
+        factory = APIRequestFactory()
+        view = TaskListCreateView.as_view()
+
+        request = factory.get('/tasks/', HTTP_X_WORKSPACE='acme')
+        force_authenticate(request, self.user)
+        response = view(request)
+        self.assertEqual([task['id'] for task in response.data], [self.acme_task.pk])
+
+        request = factory.get('/tasks/', HTTP_X_WORKSPACE='globex')
+        force_authenticate(request, self.user)
+        self.assertEqual(view(request).status_code, 403)
+        self.assertIsNone(tenancy.active_workspace())
+
+    def test_cannot_reference_rows_or_users_of_another_workspace(self):
+        request = APIRequestFactory().post('/tasks/')
+        request.user = self.user
+        with tenancy.activate(self.acme):
+            serializer = TaskSerializer(data={
+                'name': 'Sneaky', 'description': 'X', 'due_date': datetime.date.today(),
+                'assigned_to': self.outsider.pk, 'parent_task': self.globex_task.pk,
+            }, context={'request': request})
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(set(serializer.errors), {'assigned_to', 'parent_task'})
+
+    def test_router_only_moves_task_tables(self):
+        router = tenancy.WorkspaceRouter()
+        self.acme.database = 'not-configured'
+        with tenancy.activate(self.acme):
+            self.assertEqual(router.db_for_write(Task), 'default')
+            self.assertIsNone(router.db_for_read(ChangeEvent))
+        self.assertIsNone(router.db_for_read(Task))
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('lead', 'lead@example.com', 'pass')
+        self.root = make_task(self.user, name='Release', status='Completed', description='Ship it')
+        self.child = make_task(self.user, name='Changelog', status='Completed', parent_task=self.root)
+        self.grandchild = make_task(self.user, name='Proofread', status='Completed', parent_task=self.child)
+        self.extension = DeadlineExtensionLog.objects.create(
+            task=self.child, reason='Typos', new_deadline=self.child.due_date, request_by=self.user, status='APPROVED',
+        )
+        self.open_root = make_task(self.user, name='Next release', status='Completed')
+        make_task(self.user, name='Still open', parent_task=self.open_root)
+        self.old = now() - datetime.timedelta(days=200)
+        Task.objects.update(updated_at=self.old)
+
+    def test_archives_only_finished_trees_and_restores_them(self):
+        self.assertEqual(archive.archive(days=90, batch_size=1), 3)
+
+        self.assertEqual(set(Task.objects.values_list('name', flat=True)), {'Next release', 'Still open'})
+        self.assertFalse(DeadlineExtensionLog.objects.exists())
+        archived = ArchivedTask.objects.get(pk=self.grandchild.pk)
+        self.assertEqual((archived.root_id, archived.depth), (self.root.pk, 2))
+        self.assertEqual(ArchivedTask.objects.get(pk=self.child.pk).data['extension_logs'][0]['reason'], 'Typos')
+
+        # Nothing left to do on a rerun
+        self.assertEqual(archive.archive(days=90), 0)
+
+        restored = archive.restore(self.grandchild.pk)
+        self.assertEqual(len(restored), 3)
+        self.assertFalse(ArchivedTask.objects.exists())
+        child = Task.objects.get(pk=self.child.pk)
+        self.assertEqual((child.parent_task_id, child.updated_at), (self.root.pk, self.old))
+        self.assertEqual(Task.objects.get(pk=self.root.pk).description, 'Ship it')
+        self.assertEqual(DeadlineExtensionLog.objects.get(pk=self.extension.pk).task_id, self.child.pk)
+
+    def test_recent_or_pending_trees_stay(self):
+        DeadlineExtensionLog.objects.filter(pk=self.extension.pk).update(status='PENDING')
+        self.assertEqual(archive.archive(days=90), 0)
+        self.assertEqual(archive.archive(days=365), 0)
+        with self.assertRaises(archive.NotArchived):
+            archive.restore(self.root.pk)
+
+
+class ThrottleTests(TestCase):
+
+    def setUp(self):
+        throttling.get_store().clear()
+        self.addCleanup(throttling.get_store().clear)
+
+    def test_token_bucket_refills_over_time(self):
+        bucket = (2, 0.0)
+        bucket, wait = throttling.take_token(bucket, 2, 1.0, 0.0)
+        bucket, wait = throttling.take_token(bucket, 2, 1.0, 0.0)
+        self.assertEqual(wait, 0)
+        bucket, wait = throttling.take_token(bucket, 2, 1.0, 0.25)
+        self.assertAlmostEqual(wait, 0.75)
+        bucket, wait = throttling.take_token(bucket, 2, 1.0, 1.0)
+        self.assertEqual(wait, 0)
+
+    def test_login_is_throttled_per_username_and_ip_before_hashing(self):
+        User.objects.create_user('dev', 'dev@example.com', 'pass')
+        factory = APIRequestFactory()
+        view = LoginAPIView.as_view()
+
+        statuses = []
+        for attempt in range(6):
+            request = factory.post('/login/', {'username': 'Dev', 'password': 'wrong'}, REMOTE_ADDR='10.0.0.1')
+            response = view(request)
+            statuses.append(response.status_code)
+
+        self.assertEqual(statuses, [401] * 5 + [429])
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        # Someone else failing on the name does not lock its owner out
+        request = factory.post('/login/', {'username': 'dev', 'password': 'pass'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(view(request).status_code, 200)
+
+    def test_login_is_throttled_per_account_across_ips(self):
+        factory = APIRequestFactory()
+        view = LoginAPIView.as_view()
+
+        statuses = []
+        for attempt in range(101):
+            # A different IP every time, as in a distributed credential stuffing run
+            request = factory.post('/login/', {'username': 'dev', 'password': 'wrong'}, REMOTE_ADDR=f'10.0.{attempt // 200}.{attempt % 200}')
+            statuses.append(view(request).status_code)
+
+        self.assertEqual(statuses, [401] * 100 + [429])
+
+    def test_forwarded_for_does_not_give_a_fresh_ip_bucket(self):
+        factory = APIRequestFactory()
+        view = LoginAPIView.as_view()
+
+        statuses = []
+        for attempt in range(21):
+            request = factory.post('/login/', {'username': f'user{attempt}', 'password': 'wrong'},
+                                   REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'192.168.0.{attempt}')
+            statuses.append(view(request).status_code)
+
+        self.assertEqual(statuses, [401] * 20 + [429])
+
+
+class LoginTests(TestCase):
+
+    def setUp(self):
+        throttling.get_store().clear()
+        self.addCleanup(throttling.get_store().clear)
+
+    def login(self, password):
+        request = APIRequestFactory().post('/login/', {'username': 'dev', 'password': password}, format='json')
+        return LoginAPIView.as_view()(request)
+
+    def test_login_returns_an_access_token(self):
+        User.objects.create_user('dev', 'dev@example.com', 'pass')
+        response = self.login('pass')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access_token', response.data)
+        self.assertEqual(self.login('wrong').status_code, 401)
+
+    def test_hash_is_upgraded_to_the_configured_cost_on_login(self):
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=1000):
+            user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.assertEqual(user.password.split('$')[1], '1000')
+
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.assertEqual(self.login('pass').status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual(user.password.split('$')[1], '2000')
+        self.assertTrue(user.check_password('pass'))
+
+    def test_auth_tokens_are_accepted(self):
+        user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        user.user_permissions.add(Permission.objects.get(codename='view_task'))
+        response = self.client.post('/auth/', {'username': 'dev', 'password': 'pass'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/tasks/', HTTP_AUTHORIZATION=f"Token {response.json()['token']}").status_code, 200)
+        self.assertEqual(self.client.get('/tasks/', HTTP_AUTHORIZATION='Token wrong').status_code, 401)
+
+    def test_the_suite_hashes_at_a_low_work_factor(self):
+        user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.assertEqual(user.password.split('$')[1], '1000')
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(TASK_PROFILING_ENABLED=True, TASK_PROFILING_DIR=self.directory, TASK_PROFILING_KEEP=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def get(self, user, **headers):
+        return self.client.get('/tasks/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}', **headers)
+
+    def test_staff_requests_are_captured_in_a_bounded_ring(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        make_task(admin)
+        self.assertEqual(self.get(admin).status_code, 200)
+        self.assertEqual(profiling.captures(self.directory), [])
+
+        for _ in range(3):
+            self.assertEqual(self.get(admin, HTTP_X_PROFILE='1').status_code, 200)
+        captured = profiling.captures(self.directory)
+        self.assertEqual(len(captured), 2)
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+        self.assertEqual((captured[0]['path'], captured[0]['user']), ('/tasks/', 'admin'))
+        self.assertGreater(captured[0]['queries'], 0)
+
+    def test_other_users_cannot_ask_for_a_profile(self):
+        user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.get(user, HTTP_X_PROFILE='1')
+        self.assertEqual(profiling.captures(self.directory), [])
+
+        # Checked before the profiler is started, not after the request
+        def request(authorization):
+            return RequestFactory().get('/tasks/', HTTP_AUTHORIZATION=authorization, HTTP_X_PROFILE='1')
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.assertEqual(profiling.staff_user(request(f'Bearer {AccessToken.for_user(admin)}')), admin)
+        self.assertIsNone(profiling.staff_user(request(f'Bearer {AccessToken.for_user(user)}')))
+        self.assertIsNone(profiling.staff_user(request('Bearer not-a-token')))
+
+
+class NotificationDigestTests(TestCase):
+
+    def setUp(self):
+        mail.outbox = []
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.dev = User.objects.create_user('dev', 'dev@example.com', 'pass')
+
+    @override_settings(TASK_NOTIFICATION_WINDOW=600)
+    def test_a_burst_becomes_one_digest_after_the_window(self):
+        for number in range(3):
+            make_task(self.dev, assigned_by=self.owner, name=f'Task {number}')
+        self.assertEqual(notifications.send_due(), 0)
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(notifications.send_due(now() + datetime.timedelta(seconds=601)), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['dev@example.com'])
+        self.assertEqual(mail.outbox[0].body.count("- 'Task "), 3)
+        self.assertFalse(Notification.objects.exists())
+
+    @override_settings(TASK_NOTIFICATION_WINDOW=0)
+    def test_extension_requests_go_to_the_task_owner(self):
+        task = make_task(self.dev, assigned_by=self.owner)
+        Notification.objects.all().delete()
+        DeadlineExtensionLog.objects.create(task=task, reason='More time', new_deadline=task.due_date, request_by=self.dev)
+        self.assertEqual(notifications.send_due(), 1)
+        self.assertEqual([message.to for message in mail.outbox], [['owner@example.com']])
+        self.assertIn('dev asks for a new deadline', mail.outbox[0].body)
+
+
+class TimelineTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pass')
+        self.monday = datetime.date(2026, 10, 19)
+        self.root = make_task(self.user, due_date=self.monday)
+        self.child = make_task(self.user, due_date=self.monday, parent_task=self.root, status='In Progress')
+        make_task(self.user, due_date=self.monday + datetime.timedelta(days=2))
+        make_task(self.other, due_date=self.monday + datetime.timedelta(days=8))
+
+    def test_buckets_per_day_and_week(self):
+        end = self.monday + datetime.timedelta(days=13)
+        days = timeline.buckets(self.monday, end, 'day', assigned_to=self.user.pk)
+        self.assertEqual([(bucket['start'], bucket['total']) for bucket in days], [(self.monday, 2), (self.monday + datetime.timedelta(days=2), 1)])
+        self.assertEqual(days[0]['by_status'], {'Pending': 1, 'In Progress': 1})
+
+        weeks = timeline.buckets(self.monday + datetime.timedelta(days=1), end, 'week')
+        self.assertEqual([(bucket['start'], bucket['total']) for bucket in weeks], [(self.monday, 1), (self.monday + datetime.timedelta(days=7), 1)])
+
+    def test_intervals_of_a_subtask_tree_are_read_from_the_index(self):
+        end = self.monday + datetime.timedelta(days=30)
+        intervals, truncated = timeline.intervals(self.monday, end, root_id=self.root.pk)
+        self.assertEqual([(interval['id'], interval['parent']) for interval in intervals], [(self.root.pk, None), (self.child.pk, self.root.pk)])
+        self.assertFalse(truncated)
+
+        # As in a request: the workspace is active, so every query starts with it
+        with tenancy.activate(self.root.workspace):
+            for assigned_to in (self.user.pk, None):
+                query = timeline.timeline_tasks(self.monday, end, assigned_to).values_list('id', 'parent_task_id', 'created_at', 'due_date', 'status')
+                self.assertIn('COVERING INDEX', query.explain())
+
+    def test_endpoint_validates_the_range(self):
+        self.user.user_permissions.add(Permission.objects.get(codename='view_task'))
+        view = TaskTimelineView.as_view()
+        factory = APIRequestFactory()
+
+        request = factory.get('/tasks/timeline/', {'start': '2026-10-19', 'bucket': 'week'})
+        force_authenticate(request, self.user)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['end'], len(response.data['intervals'])), (datetime.date(2027, 1, 17), 4))
+
+        request = factory.get('/tasks/timeline/', {'start': '2026-10-19', 'end': '2026-10-01', 'bucket': 'year'})
+        force_authenticate(request, self.user)
+        self.assertEqual(set(view(request).data), {'end', 'bucket'})
+
+        request = factory.get('/tasks/timeline/', {'start': '2024-02-30'})
+        force_authenticate(request, self.user)
+        response = view(request)
+        self.assertEqual((response.status_code, set(response.data)), (400, {'start', 'end'}))
+
+
+class SparseFieldsetTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_task'))
+        for number in range(5):
+            root = make_task(self.user, name=f'Root {number}', description='x' * 1000)
+            child = make_task(self.user, parent_task=root)
+            make_task(self.user, parent_task=child)
+
+    def list_tasks(self, **params):
+        request = APIRequestFactory().get('/tasks/', params)
+        force_authenticate(request, self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = TaskListCreateView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        task_queries = [query['sql'] for query in queries if 'FROM "taskmanager_task"' in query['sql']]
+        return response.data, task_queries
+
+    def test_only_requested_columns_are_fetched(self):
+        data, queries = self.list_tasks(fields='id,name,status')
+        self.assertEqual(set(data[0]), {'id', 'name', 'status'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"description"', queries[0])
+        self.assertNotIn('auth_user', queries[0])
+
+        data, queries = self.list_tasks(fields='id,assigned_to', expand='subtasks')
+        self.assertEqual(set(data[0]), {'id', 'assigned_to', 'subtasks'})
+        self.assertEqual(data[0]['assigned_to']['username'], 'dev')
+
+        data, queries = self.list_tasks(exclude='description,subtasks')
+        self.assertNotIn('description', data[0])
+        self.assertIn('assigned_by', data[0])
+
+    def test_full_representation_does_not_query_per_task(self):
+        data, queries = self.list_tasks()
+        root = next(task for task in data if task['name'] == 'Root 0')
+        self.assertEqual(root['subtasks'][0]['subtasks'][0]['assigned_to']['username'], 'dev')
+        # The list itself plus one query per prefetched subtask level
+        self.assertEqual(len(queries), 1 + 3)
+
+
+class TaskDetailTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('provider', 'provider@example.com', 'pass')
+        self.user.user_permissions.add(*Permission.objects.filter(codename__in=['view_task', 'change_task', 'delete_task']))
+        self.task = make_task(self.user)
+        self.subtask = make_task(self.user, parent_task=self.task)
+        self.factory = APIRequestFactory()
+        self.view = TaskDetailView.as_view()
+
+    def call(self, method, data=None, **headers):
+        request = getattr(self.factory, method)(f'/tasks/{self.task.pk}/', data, format='json', **headers)
+        force_authenticate(request, self.user)
+        return self.view(request, pk=self.task.pk)
+
+    def test_conditional_get_answers_304_from_the_validators(self):
+        response = self.call('get')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.task.pk)
+        self.assertNotIn('subtasks', response.data)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.call('get', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        task_queries = [query['sql'] for query in queries if 'FROM "taskmanager_task"' in query['sql']]
+        self.assertEqual(len(task_queries), 1)
+        self.assertNotIn('"description"', task_queries[0])
+
+        request = self.factory.get(f'/tasks/{self.task.pk}/', {'expand': 'subtasks'}, HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(request, self.user)
+        response = self.view(request, pk=self.task.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([subtask['id'] for subtask in response.data['subtasks']], [self.subtask.pk])
+
+    def test_writes_are_guarded_by_if_match(self):
+        etag = self.call('get')['ETag']
+        response = self.call('patch', {'name': 'Renamed'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # The old version is gone: neither a second write nor a delete may apply to it
+        self.assertEqual(self.call('patch', {'name': 'Again'}, HTTP_IF_MATCH=etag).status_code, 412)
+        self.assertEqual(self.call('delete', HTTP_IF_MATCH=etag).status_code, 412)
+        self.assertEqual(self.call('delete', HTTP_IF_MATCH=response['ETag']).status_code, 204)
+        self.assertFalse(Task.objects.filter(pk=self.task.pk).exists())
+
+
+class DatabaseConfigTests(TestCase):
+
+    def test_postgres_url_with_pool_and_statement_timeout(self):
+        env = {
+            'DATABASE_URL': 'postgres://tasks:p%40ss@db:5433/tasks?sslmode=require',
+            'DATABASE_URL_BIG': 'postgres://tasks@big-db/tasks',
+            'TASK_DB_POOL': '1',
+            'TASK_WEB_THREADS': '8',
+            'TASK_DB_STATEMENT_TIMEOUT': '5000',
+        }
+        databases = database.databases(env, default_url='sqlite:///unused.sqlite3')
+        self.assertEqual(sorted(databases), ['big', 'default'])
+
+        default = databases['default']
+        self.assertEqual(default['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((default['USER'], default['PASSWORD'], default['HOST'], default['PORT'], default['NAME']), ('tasks', 'p@ss', 'db', '5433', 'tasks'))
+        self.assertEqual(default['OPTIONS']['sslmode'], 'require')
+        self.assertEqual(default['OPTIONS']['options'], '-c statement_timeout=5000')
+        # One connection per request thread, and no persistent connections on top of the pool
+        self.assertEqual(default['OPTIONS']['pool'], {'min_size': 2, 'max_size': 8, 'timeout': 10.0})
+        self.assertEqual(default['CONN_MAX_AGE'], 0)
+        self.assertTrue(default['CONN_HEALTH_CHECKS'])
+
+    def test_sqlite_fallback_keeps_persistent_connections(self):
+        databases = database.databases({'TASK_DB_CONN_MAX_AGE': '120'}, default_url='sqlite:////srv/tasks/db.sqlite3')
+        self.assertEqual(databases['default']['NAME'], '/srv/tasks/db.sqlite3')
+        self.assertEqual(databases['default']['CONN_MAX_AGE'], 120)
+        self.assertEqual(databases['default']['OPTIONS'], {})
+
+        with self.assertRaises(ValueError):
+            database.parse_url('mysql://db/tasks')
+
+
+class DeveloperMetricsTests(TestCase):
+
+    def setUp(self):
+        self.developer = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.developer.groups.add(Group.objects.create(name='Developer'))
+        self.provider = User.objects.create_user('provider', 'provider@example.com', 'pass')
+        self.provider.groups.add(Group.objects.create(name='Task Providers'))
+        for user in (self.developer, self.provider):
+            user.user_permissions.add(Permission.objects.get(codename='view_task'))
+
+    def finish(self, task, late=False):
+        task.status = 'In Progress'
+        task.save()
+        TASK_STATUS.announce([(task, 'Pending')], 'In Progress')
+        Task.objects.filter(pk=task.pk).update(started_at=now() - datetime.timedelta(hours=2))
+        if late:
+            Task.objects.filter(pk=task.pk).update(due_date=datetime.date.today() - datetime.timedelta(days=1))
+        return TASK_STATUS.bulk_transition(Task.objects.filter(pk=task.pk), 'Completed')
+
+    def get(self, user, **params):
+        request = APIRequestFactory().get('/metrics/developers/', params)
+        force_authenticate(request, user)
+        return DeveloperMetricsView.as_view()(request)
+
+    def test_counters_follow_transitions_and_extension_requests(self):
+        on_time, late = make_task(self.developer), make_task(self.developer)
+        # Read first, so the summary rows exist and the events are added to them
+        self.assertEqual(self.get(self.provider).data[0]['completed'], 0)
+
+        self.finish(on_time)
+        self.finish(late, late=True)
+        DeadlineExtensionLog.objects.create(task=late, reason='More time', new_deadline=late.due_date, request_by=self.developer)
+        on_time.refresh_from_db()
+        self.assertIsNotNone(on_time.completed_at)
+
+        response = self.get(self.provider, window=7)
+        self.assertEqual(response.status_code, 200)
+        [row] = response.data
+        self.assertEqual((row['username'], row['started'], row['completed']), ('dev', 2, 2))
+        self.assertEqual(row['on_time_rate'], 0.5)
+        self.assertAlmostEqual(row['avg_cycle_time_hours'], 2, places=1)
+        self.assertEqual((row['extensions_requested'], row['extensions_per_completed_task']), (1, 0.5))
+
+        # Reopening takes the completion back: reopened and completed again counts once,
+        # reopened for good not at all, as when the counters are rebuilt from the stored times
+        previous = {'completed_at': on_time.completed_at}
+        on_time.status = 'In Progress'
+        on_time.save()
+        TASK_STATUS.announce([(on_time, 'Completed', previous)], 'In Progress')
+        TASK_STATUS.bulk_transition(Task.objects.filter(pk=on_time.pk), 'Completed')
+        TASK_STATUS.bulk_transition(Task.objects.filter(pk=late.pk), 'Pending')
+        self.assertIsNone(Task.objects.get(pk=late.pk).completed_at)
+        incremental = self.get(self.provider, window=7).data[0]
+        self.assertEqual((incremental['completed'], incremental['on_time_rate'], incremental['extensions_requested']), (1, 1.0, 1))
+
+        metrics.rebuild(Workspace.objects.get(slug='default'))
+        self.assertEqual(self.get(self.provider, window=7).data[0], incremental)
+
+    def test_reads_one_summary_row_per_developer(self):
+        self.finish(make_task(self.developer))
+        self.get(self.provider)
+        with CaptureQueriesContext(connection) as queries:
+            self.get(self.provider)
+        self.assertFalse([query for query in queries if 'developerdailystats' in query['sql']])
+
+        # Days outside the window drop out when a new day's summaries are computed
+        DeveloperDailyStats.objects.update(day=datetime.date.today() - datetime.timedelta(days=7))
+        tomorrow = metrics.summaries([self.developer.pk], 7, today=datetime.date.today() + datetime.timedelta(days=1))
+        self.assertEqual(tomorrow[self.developer.pk].completed, 0)
+
+        # Developers only see themselves
+        self.assertEqual([row['developer'] for row in self.get(self.developer, window=30).data], [self.developer.pk])
+        self.assertEqual(self.get(self.provider, window=5).status_code, 400)
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.today = datetime.date.today()
+        self.root = make_task(self.user, due_date=self.today + datetime.timedelta(days=30))
+        self.child = make_task(self.user, parent_task=self.root, due_date=self.today + datetime.timedelta(days=20))
+        self.grandchild = make_task(self.user, parent_task=self.child, due_date=self.today + datetime.timedelta(days=10))
+
+    def rollup_of(self, task):
+        return Task.objects.filter(pk=task.pk).values_list(*rollup.ROLLUP_FIELDS).get()
+
+    def test_kept_on_create_status_change_reparent_and_delete(self):
+        self.assertEqual(self.rollup_of(self.root), (2, 0, self.today + datetime.timedelta(days=10)))
+        self.assertEqual(self.rollup_of(self.child), (1, 0, self.today + datetime.timedelta(days=10)))
+
+        self.grandchild.status = 'Completed'
+        self.grandchild.save()
+        self.assertEqual(self.rollup_of(self.root)[:2], (2, 1))
+
+        # Moving the subtask up takes its progress and date away from the old parent only
+        self.grandchild.parent_task = self.root
+        self.grandchild.save()
+        self.assertEqual(self.rollup_of(self.child), (0, 0, None))
+        self.assertEqual(self.rollup_of(self.root), (2, 1, self.today + datetime.timedelta(days=10)))
+
+        # A later due date is recomputed from the other children
+        self.grandchild.due_date = self.today + datetime.timedelta(days=25)
+        self.grandchild.save()
+        self.assertEqual(self.rollup_of(self.root)[2], self.today + datetime.timedelta(days=20))
+
+        extra = make_task(self.user, parent_task=self.child, due_date=self.today)
+        self.assertEqual(self.rollup_of(self.root), (3, 1, self.today))
+        self.child.delete()
+        self.assertEqual(self.rollup_of(self.root), (1, 1, self.today + datetime.timedelta(days=25)))
+        self.assertFalse(Task.objects.filter(pk=extra.pk).exists())
+        self.assertEqual(rollup.mismatches(), [])
+
+    def test_bulk_transitions_and_the_check_and_rebuild_commands(self):
+        TASK_STATUS.bulk_transition(Task.objects.filter(pk__in=[self.child.pk, self.grandchild.pk]), 'In Progress')
+        self.grandchild.refresh_from_db()
+        self.grandchild.status = 'Completed'
+        self.grandchild.save()
+        self.assertEqual(self.rollup_of(self.root)[:2], (2, 1))
+
+        response = TaskSerializer(Task.objects.get(pk=self.root.pk)).data
+        self.assertEqual((response['descendant_count'], response['completed_descendant_count']), (2, 1))
+
+        Task.objects.filter(pk=self.root.pk).update(descendant_count=7)
+        with self.assertRaises(CommandError):
+            call_command('check_rollups', stdout=io.StringIO())
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        call_command('check_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rollup_of(self.root)[0], 2)
+
+    def test_parent_cycles_are_rejected_and_not_followed(self):
+        for parent in (self.root, self.grandchild):
+            serializer = TaskSerializer(self.root, data={'parent_task': parent.pk}, partial=True)
+            self.assertFalse(serializer.is_valid())
+            self.assertIn('parent_task', serializer.errors)
+
+        # Cycles written around the serializer do not hang the walkers
+        Task.objects.filter(pk=self.root.pk).update(parent_task=self.grandchild)
+        self.assertEqual(rollup.ancestor_ids(self.root.pk), [self.root.pk, self.grandchild.pk, self.child.pk])
+        self.assertEqual(sorted(timeline.tree_ids(self.root.pk)), sorted([self.root.pk, self.child.pk, self.grandchild.pk]))
+
+    def test_rollup_changes_bump_the_version(self):
+        version = Task.objects.get(pk=self.root.pk).version
+        make_task(self.user, parent_task=self.child, due_date=self.today)
+        self.assertGreater(Task.objects.get(pk=self.root.pk).version, version)
+
+
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.user.user_permissions.add(*Permission.objects.filter(codename__in=['view_task', 'add_task', 'add_deadlineextensionlog']))
+        self.factory = APIRequestFactory()
+
+    def post(self, view, path, data, key):
+        request = self.factory.post(path, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        force_authenticate(request, self.user)
+        return view.as_view()(request)
+
+    def test_retried_task_creation_runs_once(self):
+        payload = {'name': 'Ship it', 'description': 'Release the build', 'due_date': str(datetime.date.today()), 'assigned_to': self.user.pk}
+        first = self.post(TaskListCreateView, '/tasks/', payload, 'key-1')
+        retry = self.post(TaskListCreateView, '/tasks/', payload, 'key-1')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Task.objects.filter(name='Ship it').count(), 1)
+
+        # Same key, other request: refused rather than answered with the wrong response
+        self.assertEqual(self.post(TaskListCreateView, '/tasks/', dict(payload, name='Other'), 'key-1').status_code, 422)
+
+        # A duplicate arriving while the first attempt still runs has to retry later
+        IdempotencyKey.objects.filter(key='key-1').update(status_code=None)
+        busy = self.post(TaskListCreateView, '/tasks/', payload, 'key-1')
+        self.assertEqual(busy.status_code, 409)
+        self.assertEqual(Task.objects.filter(name='Ship it').count(), 1)
+
+    def test_retried_extension_request_uses_the_quota_once(self):
+        task = make_task(self.user)
+        payload = {'task': task.pk, 'reason': 'Blocked', 'new_deadline': str(task.due_date + datetime.timedelta(days=3))}
+
+        # A rejected attempt releases the key, the corrected request may use it
+        invalid = self.post(DeadlineExtensionRequestListCreateView, '/deadline-extension-requests/', dict(payload, new_deadline=str(task.due_date)), 'ext-1')
+        self.assertEqual(invalid.status_code, 400)
+        for _ in range(3):
+            response = self.post(DeadlineExtensionRequestListCreateView, '/deadline-extension-requests/', payload, 'ext-1')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(task.extension_logs.count(), 1)
+
+        IdempotencyKey.objects.update(expires_at=now() - datetime.timedelta(seconds=1))
+        self.assertEqual(idempotency.purge_expired(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class IdempotencyTransactionTests(TransactionTestCase):
+    """
+    Failures before and after the commit of the create, which a TestCase's
+    surrounding transaction would hide.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.user.user_permissions.add(*Permission.objects.filter(codename__in=['view_task', 'add_task']))
+        self.payload = {'name': 'Ship it', 'description': 'Release the build', 'due_date': str(datetime.date.today()), 'assigned_to': self.user.pk}
+
+    def post(self, fail, key):
+        class FailingView(TaskListCreateView):
+            def perform_create(self, serializer):
+                super().perform_create(serializer)
+                if fail == 'before commit':
+                    raise RuntimeError(fail)
+                transaction.on_commit(lambda: (_ for _ in ()).throw(RuntimeError(fail)))
+
+        request = APIRequestFactory().post('/tasks/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        force_authenticate(request, self.user)
+        return FailingView.as_view()(request)
+
+    def test_the_key_is_released_only_when_the_create_rolled_back(self):
+        with self.assertRaises(RuntimeError):
+            self.post('before commit', 'key-1')
+        self.assertFalse(Task.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        # Committed, then failed: the retry gets the stored response instead of a second task
+        with self.assertRaises(RuntimeError):
+            self.post('after commit', 'key-2')
+        retry = self.post('after commit', 'key-2')
+        self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (201, 'true'))
+        self.assertEqual(Task.objects.count(), 1)
+
+
+class WebhookReceiver(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, as most receivers
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((dict(self.headers), body))
+        status_code = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status_code)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class WebhookTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dev', 'dev@example.com', 'pass')
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookReceiver)
+        self.server.received, self.server.statuses = [], []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/hook'
+
+    def dispatch(self):
+        async def run_once():
+            dispatcher = webhooks.Dispatcher(timeout=5)
+            try:
+                return await dispatcher.run_once()
+            finally:
+                dispatcher.pool.close()
+        return async_to_sync(run_once)()
+
+    def test_status_change_is_delivered_signed(self):
+        endpoint = WebhookEndpoint.objects.create(url=self.url, secret='s3cret', events=['task.status_changed'])
+        WebhookEndpoint.objects.create(url=self.url, secret='other', events=['extension.decided'])
+        task = make_task(self.user)  # task.assigned: not subscribed
+        TASK_STATUS.bulk_transition(Task.objects.filter(pk=task.pk), 'In Progress', self.user)
+        self.assertEqual(WebhookDelivery.objects.count(), 1)
+
+        self.assertEqual(self.dispatch(), 1)
+        headers, body = self.server.received[0]
+        self.assertTrue(webhooks.verify('s3cret', headers[webhooks.SIGNATURE_HEADER], body))
+        self.assertFalse(webhooks.verify('wrong', headers[webhooks.SIGNATURE_HEADER], body))
+        payload = json.loads(body)
+        self.assertEqual((payload['event'], payload['data']['from'], payload['data']['to']), ('task.status_changed', 'Pending', 'In Progress'))
+        self.assertEqual(payload['data']['task']['id'], task.pk)
+        delivery = WebhookDelivery.objects.get()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.response_status, delivery.endpoint), ('delivered', 1, 200, endpoint))
+        self.assertEqual(self.dispatch(), 0)
+
+    @override_settings(TASK_WEBHOOK_BREAKER_THRESHOLD=2, TASK_WEBHOOK_RETRY_BASE=60)
+    def test_failures_back_off_and_open_the_circuit(self):
+        endpoint = WebhookEndpoint.objects.create(url=self.url, secret='s3cret', max_concurrency=1)
+        for _ in range(3):
+            make_task(self.user)  # task.assigned
+        self.server.statuses = [500, 500]
+
+        started = now()
+        self.assertEqual(self.dispatch(), 3)
+        # Two failures open the circuit, the third delivery is put off without an attempt
+        self.assertEqual(len(self.server.received), 2)
+        endpoint.refresh_from_db()
+        self.assertEqual(endpoint.failure_count, 2)
+        self.assertGreater(endpoint.circuit_open_until, started)
+        failed = WebhookDelivery.objects.filter(attempts=1)
+        self.assertEqual([delivery.last_error for delivery in failed], ['HTTP 500', 'HTTP 500'])
+        for delivery in failed:
+            self.assertLessEqual(delivery.next_attempt_at, now() + datetime.timedelta(seconds=120))
+        self.assertEqual(WebhookDelivery.objects.get(attempts=0).next_attempt_at, endpoint.circuit_open_until)
+        self.assertEqual(self.dispatch(), 0)
+
+        # After the cooldown one probe goes out, its success closes the circuit
+        WebhookEndpoint.objects.update(circuit_open_until=now())
+        WebhookDelivery.objects.update(next_attempt_at=now())
+        self.assertEqual(self.dispatch(), 1)
+        endpoint.refresh_from_db()
+        self.assertEqual(endpoint.failure_count, 0)
+        self.assertEqual(self.dispatch(), 2)
+        self.assertEqual(WebhookDelivery.objects.filter(status='delivered').count(), 3)
 
-# Create your tests here.
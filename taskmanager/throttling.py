@@ -0,0 +1,192 @@
+"""
+Token-bucket throttles.
+
+Each key (an IP, a username, a user) owns a bucket holding up to `N`
+tokens that refills at N tokens per period. A request takes one token,
+or is refused with the time until the next token (sent as Retry-After).
+Bursts up to N are allowed, the sustained rate is capped at N per period.
+
+Rates use DRF's DEFAULT_THROTTLE_RATES setting ('5/min' and so on). The
+buckets live in process memory by default, which makes a check a dict
+lookup under a lock: limits then apply per worker process. Set
+TASK_THROTTLE_STORE = 'cache' to share them between processes through the
+Django cache (e.g. Redis), at the cost of a cache round trip.
+
+The login throttles run before the password is hashed, so a credential
+stuffing burst is turned away without spending PBKDF2 time on it. Clients
+are told apart by REMOTE_ADDR only: X-Forwarded-For is set by the client
+unless a proxy in front rewrites it, so trusting it would hand out a fresh
+bucket per forged header. Behind a proxy, have it set REMOTE_ADDR.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    '5/min' -> (5, 60.0)
+    """
+    count, period = rate.split('/')
+    return int(count), float(PERIODS[period[0]])
+
+
+def take_token(bucket, capacity, refill_rate, now):
+    """
+    Refill a (tokens, updated) bucket up to `now` and take one token.
+    Returns the new bucket and 0, or the unchanged bucket and the seconds
+    until a token is available.
+    """
+    tokens, updated = bucket
+    tokens = min(capacity, tokens + max(0.0, now - updated) * refill_rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / refill_rate
+
+
+class LocalBucketStore:
+    """
+    Buckets in process memory. The least recently used ones are dropped past
+    `max_buckets`; a dropped bucket simply comes back full.
+    """
+
+    def __init__(self, max_buckets=100000):
+        self.max_buckets = max_buckets
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate):
+        now = time.monotonic()
+        with self.lock:
+            bucket, wait = take_token(self.buckets.pop(key, (capacity, now)), capacity, refill_rate, now)
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Buckets in the Django cache, shared by every process. Read and write are
+    not atomic, so concurrent requests for one key may let a few extra through.
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    def consume(self, key, capacity, refill_rate):
+        cache = caches[self.alias]
+        now = time.time()
+        bucket, wait = take_token(cache.get(f'throttle:{key}', (capacity, now)), capacity, refill_rate, now)
+        # A bucket left alone until it is full again does not need to be kept
+        cache.set(f'throttle:{key}', bucket, timeout=int(capacity / refill_rate) + 1)
+        return wait
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        if getattr(settings, 'TASK_THROTTLE_STORE', 'local') == 'cache':
+            _store = CacheBucketStore(getattr(settings, 'TASK_THROTTLE_CACHE', 'default'))
+        else:
+            _store = LocalBucketStore()
+    return _store
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR')
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+
+    def __init__(self):
+        self.rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        self.wait_time = None
+
+    def get_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_key(request, view)
+        if key is None:
+            return True
+
+        capacity, period = parse_rate(self.rate)
+        self.wait_time = get_store().consume(f'{self.scope}:{key}', capacity, capacity / period)
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
+
+
+class LoginIPThrottle(TokenBucketThrottle):
+    """
+    Login attempts per client IP.
+    """
+    scope = 'login_ip'
+
+    def get_key(self, request, view):
+        return client_ip(request)
+
+
+def login_username(request):
+    username = request.data.get('username') if hasattr(request.data, 'get') else None
+    if not username or not isinstance(username, str):
+        return None
+    return username.strip().lower()
+
+
+class LoginUsernameThrottle(TokenBucketThrottle):
+    """
+    Login attempts per username from one IP. Keyed on the pair, so that
+    failing logins from elsewhere cannot lock the owner of the name out.
+    """
+    scope = 'login_username'
+
+    def get_key(self, request, view):
+        username = login_username(request)
+        return username and f'{username}:{client_ip(request)}'
+
+
+class LoginAccountThrottle(TokenBucketThrottle):
+    """
+    Login attempts per username, whatever IP they come from. A larger bucket
+    than the per-IP ones: it caps a credential stuffing run spread over many
+    IPs, and takes that many failures before it locks the owner out too.
+    """
+    scope = 'login_account'
+
+    def get_key(self, request, view):
+        return login_username(request)
+
+
+class WriteThrottle(TokenBucketThrottle):
+    """
+    Writes per user (per IP for anonymous clients). Reads are not throttled.
+    """
+    scope = 'write'
+
+    def get_key(self, request, view):
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return None
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{client_ip(request)}'
@@ -0,0 +1,85 @@
+"""
+Calendar and timeline reads.
+
+`buckets()` counts the tasks due per day or per week, split by status,
+and `intervals()` lists (id, parent, created_at, due_date, status) for a
+Gantt view. Both select only columns held by a tenant-leading index,
+task_ws_timeline_idx for the whole workspace or
+task_ws_assignee_timeline_idx for one assignee, so the database answers
+them from the index alone and no task row is loaded.
+"""
+import datetime
+
+from django.db.models import Count
+
+from .models import Task
+
+
+MAX_DAYS = 366  # Longest range one request may cover
+MAX_INTERVALS = 5000
+BUCKETS = ('day', 'week')
+
+
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - datetime.timedelta(days=day.weekday())  # Weeks start on Monday
+    return day
+
+
+def timeline_tasks(start, end, assigned_to=None):
+    tasks = Task.objects.filter(due_date__range=(start, end))
+    if assigned_to is not None:
+        tasks = tasks.filter(assigned_to=assigned_to)
+    return tasks
+
+
+def buckets(start, end, bucket='day', assigned_to=None):
+    """
+    [{'start': date, 'total': n, 'by_status': {status: n}}] for each day or
+    week from `start` to `end` that has tasks due, in date order.
+    """
+    counts = (
+        timeline_tasks(start, end, assigned_to)
+        .values('due_date', 'status')
+        .annotate(count=Count('*'))
+        .order_by()
+    )
+
+    # At most one row per day and status, so folding days into weeks here is cheap
+    totals = {}
+    for row in counts:
+        entry = totals.setdefault(bucket_start(row['due_date'], bucket), {'total': 0, 'by_status': {}})
+        entry['total'] += row['count']
+        entry['by_status'][row['status']] = entry['by_status'].get(row['status'], 0) + row['count']
+    return [{'start': day, **totals[day]} for day in sorted(totals)]
+
+
+def tree_ids(root_id):
+    """
+    Ids of `root_id` and every task below it, one query per tree level.
+    Tasks seen before are not followed again, should the parents form a cycle.
+    """
+    ids, parents = [root_id], [root_id]
+    while parents:
+        parents = list(Task.objects.filter(parent_task__in=parents).exclude(id__in=ids).values_list('id', flat=True))
+        ids += parents
+    return ids
+
+
+def intervals(start, end, assigned_to=None, root_id=None, limit=MAX_INTERVALS):
+    """
+    Compact intervals (created_at to due_date) of the tasks due in the range,
+    by due date. Returns the intervals and whether `limit` cut the list short.
+    """
+    tasks = timeline_tasks(start, end, assigned_to)
+    if root_id is not None:
+        tasks = tasks.filter(id__in=tree_ids(root_id))
+
+    rows = list(
+        tasks.order_by('due_date', 'id')
+        .values_list('id', 'parent_task_id', 'created_at', 'due_date', 'status')[:limit + 1]
+    )
+    return [
+        {'id': task_id, 'parent': parent_id, 'start': created_at, 'end': due_date, 'status': task_status}
+        for task_id, parent_id, created_at, due_date, task_status in rows[:limit]
+    ], len(rows) > limit
@@ -0,0 +1,195 @@
+"""
+Declarative state machines for Task.status and DeadlineExtensionLog.status.
+
+Each machine is declared as a list of (source, target) edges plus optional
+guards. The edges are compiled into frozensets and lookup dicts when this
+module is imported, so checking a transition is a single set lookup and a
+bulk transition is a single guarded UPDATE.
+
+Every applied transition is announced through the `transitioned` signal
+(sender is the model class) so notifications, audit and metrics can hook
+in without touching the serializers.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.dispatch import Signal
+from django.utils.timezone import now
+
+from .models import Task, DeadlineExtensionLog
+
+
+# Sent with sender=<model class>, transitions=[Transition, ...], user=<User or None>
+# and bulk=True when the rows were changed by a queryset UPDATE (no post_save was sent)
+transitioned = Signal()
+
+# Sent with sender=Task, tasks=[Task, ...], fields=[...], user=<User or None> after
+# other task fields were written with bulk_update (again, no post_save was sent)
+tasks_bulk_updated = Signal()
+
+# Sent with sender=Task, tasks=[Task, ...], user=<User or None> after tasks were
+# inserted with bulk_create (no post_save was sent)
+tasks_bulk_created = Signal()
+
+# `previous` holds the machine's `remember` fields as they were before the change, or None
+Transition = namedtuple('Transition', ['pk', 'source', 'target', 'previous'], defaults=[None])
+
+
+class TransitionError(Exception):
+    pass
+
+
+class StateMachine:
+
+    def __init__(self, model, field, edges, guards=None, bulk_guards=None, messages=None, remember=()):
+        self.model = model
+        self.field = field
+        self.remember = tuple(remember)
+        self.states = frozenset(value for value, label in model._meta.get_field(field).choices)
+
+        # Compile the tables once: O(1) membership checks and per-target source lists
+        self.edges = frozenset(edges)
+        self.sources_for = {}
+        for source, target in self.edges:
+            if source not in self.states or target not in self.states:
+                raise ValueError(f"Unknown state in transition {source!r} -> {target!r} for {model.__name__}.{field}")
+            self.sources_for.setdefault(target, set()).add(source)
+        self.sources_for = {target: frozenset(sources) for target, sources in self.sources_for.items()}
+
+        self.guards = dict(guards or {})
+        self.bulk_guards = dict(bulk_guards or {})
+        self.messages = dict(messages or {})
+
+    def can(self, source, target):
+        return source == target or (source, target) in self.edges
+
+    def check(self, instance, target, user=None):
+        """
+        Raise TransitionError if `instance` may not move to `target`.
+        Staying in the same state is always allowed.
+        """
+        source = getattr(instance, self.field)
+        if source == target:
+            return
+        if target not in self.states:
+            raise TransitionError(f"'{target}' is not a valid {self.field}.")
+        if (source, target) not in self.edges:
+            raise TransitionError(self.messages.get((source, target), f"Cannot change {self.field} from '{source}' to '{target}'."))
+
+        guard = self.guards.get(target)
+        if guard:
+            error = guard(instance, user)
+            if error:
+                raise TransitionError(error)
+
+    def announce(self, instances_and_sources, target, user=None):
+        """
+        Send `transitioned` for saved instances. Each item is (instance, source)
+        or (instance, source, {remembered field: value before the save}).
+        """
+        changes = [Transition(instance.pk, source, target, *previous) for instance, source, *previous in instances_and_sources if source != target]
+        if changes:
+            transitioned.send(sender=self.model, transitions=changes, user=user, bulk=False)
+        return changes
+
+    def bulk_transition(self, queryset, target, user=None, **extra_fields):
+        """
+        Move every row of `queryset` that is allowed to reach `target` with one
+        guarded UPDATE. Rows in a disallowed state or failing the guard are left
+        alone. Returns the list of applied Transition tuples.
+        """
+        sources = self.sources_for.get(target)
+        if not sources:
+            raise TransitionError(f"No transition leads to '{target}'.")
+
+        eligible = queryset.filter(**{f'{self.field}__in': sources})
+        guard = self.bulk_guards.get(target)
+        if guard is not None:
+            eligible = eligible.filter(guard(user))
+
+        values = {self.field: target, **extra_fields}
+        if self.model is Task:
+            moment = now()
+            values.update(version=F('version') + 1, updated_at=moment, **Task.status_stamps(target, moment))
+
+        with transaction.atomic(using=eligible.db):
+            # The sources (and remembered fields) are read first. The Task guard joins
+            # the parent (LEFT OUTER JOIN), only this table's rows can be locked
+            rows = list(eligible.select_for_update(of=('self',)).values_list('pk', self.field, *self.remember))
+            if not rows:
+                return []
+            # The UPDATE repeats the source and guard conditions: without row locks
+            # (SQLite) a row changed in between is left alone instead of overwritten
+            pks = [pk for pk, source, *previous in rows]
+            updated = eligible.filter(pk__in=pks).update(**values)
+            if updated < len(rows):
+                moved = set(self.model._base_manager.using(eligible.db).filter(pk__in=pks, **{self.field: target}).values_list('pk', flat=True))
+                rows = [row for row in rows if row[0] in moved]
+
+        changes = [
+            Transition(pk, source, target, dict(zip(self.remember, previous)) if self.remember else None)
+            for pk, source, *previous in rows
+        ]
+        if changes:
+            transitioned.send(sender=self.model, transitions=changes, user=user, bulk=True)
+        return changes
+
+
+def _parent_completed(task, user):
+    # Rule 1: A task can only be marked Completed if all its dependencies are completed
+    parent_task = task.parent_task
+    if parent_task and parent_task.status != 'Completed':
+        return f"A task can only be marked as Completed if all its dependencies are completed. Parent task '{parent_task.name}' is not completed yet."
+
+
+def _is_task_owner(extension_log, user):
+    # Rule 5: An extension request can only be approved or rejected by the user who assigned the task
+    if user is None or user != extension_log.task.assigned_by:
+        return "Only the assigned user can approve or reject a deadline extension request."
+
+
+TASK_STATUS = StateMachine(
+    Task, 'status',
+    edges=[
+        ('Pending', 'In Progress'),
+        ('In Progress', 'Pending'),
+        ('In Progress', 'Completed'),
+        ('Completed', 'In Progress'),
+        ('Completed', 'Pending'),
+    ],
+    guards={
+        'Completed': _parent_completed,
+    },
+    bulk_guards={
+        'Completed': lambda user: Q(parent_task__isnull=True) | Q(parent_task__status='Completed'),
+    },
+    messages={
+        ('Pending', 'Completed'): "A task must be In Progress before it can be marked as Completed.",
+    },
+    # Reopening clears completed_at, the metrics need it to take the completion back
+    remember=('completed_at',),
+)
+
+
+EXTENSION_STATUS = StateMachine(
+    DeadlineExtensionLog, 'status',
+    edges=[
+        ('PENDING', 'APPROVED'),
+        ('PENDING', 'REJECTED'),
+    ],
+    guards={
+        'APPROVED': _is_task_owner,
+        'REJECTED': _is_task_owner,
+    },
+    bulk_guards={
+        'APPROVED': lambda user: Q(task__assigned_by=user),
+        'REJECTED': lambda user: Q(task__assigned_by=user),
+    },
+)
+
+
+EXTENSION_DECISION_MESSAGES = {
+    'APPROVED': "The deadline extension request has been approved successfully.",
+    'REJECTED': "The deadline extension request has been rejected successfully.",
+}
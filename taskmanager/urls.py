@@ -1,9 +1,12 @@
-from django.urls import path,include
-from rest_framework.authtoken.views import obtain_auth_token
+from django.urls import path
+from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework_simplejwt.views import TokenObtainPairView,TokenRefreshView,TokenVerifyView
-from .views import TaskListCreateView,DeadlineExtensionRequestListCreateView,DeadlineExtensionApprovalListView,DeadlineExtensionApprovalRetriveUpdateView, LoginAPIView
+from .views import TaskListCreateView,TaskDetailView,ArchivedTaskListView,ArchivedTaskDetailView,ArchivedTaskRestoreView,TaskTemplateListCreateView,TaskTemplateDetailView,TaskHistoryView,TaskAutoAssignView,TaskQueueView,TaskClaimView,TaskTimelineView,DeveloperMetricsView,DeadlineExtensionRequestListCreateView,DeadlineExtensionApprovalListView,DeadlineExtensionApprovalRetriveUpdateView, DeadlineExtensionBulkDecisionView, LoginAPIView, DeltaSyncView, task_change_feed
+from .throttling import LoginIPThrottle, LoginUsernameThrottle
 
 
+# The token endpoints check passwords too
+LOGIN_THROTTLES = [LoginIPThrottle, LoginUsernameThrottle]
 
 
 urlpatterns = [
@@ -12,15 +15,46 @@ urlpatterns = [
     path('login/', LoginAPIView.as_view(), name='login'),
 
     # path('api-auth/', include('rest_framework.urls')),
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/', TokenObtainPairView.as_view(throttle_classes=LOGIN_THROTTLES), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
 
     # Task views
     path('tasks/', TaskListCreateView.as_view(), name='task-list-create'),
 
+    #priority work queue
+    path('tasks/next/', TaskQueueView.as_view(), name='task-queue'),
+    path('tasks/claim/', TaskClaimView.as_view(), name='task-claim'),
+
+    #calendar / Gantt timeline
+    path('tasks/timeline/', TaskTimelineView.as_view(), name='task-timeline'),
+
+    #batch auto-assignment
+    path('tasks/auto-assign/', TaskAutoAssignView.as_view(), name='task-auto-assign'),
+
     #task Detail view
-    path('tasks/<int:pk>/', TaskListCreateView.as_view(), name='task-detail'),
+    path('tasks/<int:pk>/', TaskDetailView.as_view(), name='task-detail'),
+
+    #task history (audit log)
+    path('tasks/<int:pk>/history/', TaskHistoryView.as_view(), name='task-history'),
+
+    #recurring task templates
+    path('task-templates/', TaskTemplateListCreateView.as_view(), name='task-template-list-create'),
+    path('task-templates/<int:pk>/', TaskTemplateDetailView.as_view(), name='task-template-detail'),
+
+    #archived (cold) tasks
+    path('archive/tasks/', ArchivedTaskListView.as_view(), name='archived-task-list'),
+    path('archive/tasks/<int:pk>/', ArchivedTaskDetailView.as_view(), name='archived-task-detail'),
+    path('archive/tasks/<int:pk>/restore/', ArchivedTaskRestoreView.as_view(), name='archived-task-restore'),
+
+    #per-developer workload and SLA metrics
+    path('metrics/developers/', DeveloperMetricsView.as_view(), name='developer-metrics'),
+
+    #live change feed (Server-Sent Events)
+    path('feed/', task_change_feed, name='task-change-feed'),
+
+    #delta sync for offline clients
+    path('sync/', DeltaSyncView.as_view(), name='delta-sync'),
     
     # Deadline Extension Request views
     path('deadline-extension-requests/', DeadlineExtensionRequestListCreateView.as_view(), name='deadline-extension-request-list-create'),
@@ -28,8 +62,9 @@ urlpatterns = [
     # Deadline Extension Approval views
     path('deadline-extension-approvals/', DeadlineExtensionApprovalListView.as_view(), name='deadline-extension-approval-list'),
     path('deadline-extension-approvals/<int:pk>/', DeadlineExtensionApprovalRetriveUpdateView.as_view(), name='deadline-extension-approval-update'),
+    path('deadline-extension-approvals/bulk/', DeadlineExtensionBulkDecisionView.as_view(), name='deadline-extension-approval-bulk'),
     
-    path('auth/', obtain_auth_token, name='auth'),
+    path('auth/', ObtainAuthToken.as_view(throttle_classes=LOGIN_THROTTLES), name='auth'),
 
     # If you are using DefaultRouter for ModelViewSets (uncomment above if needed)
     # path('api/', include(router.urls)),
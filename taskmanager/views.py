@@ -1,20 +1,34 @@
-from rest_framework.generics import ListCreateAPIView, ListAPIView, UpdateAPIView, RetrieveUpdateAPIView
+import datetime
+
+from rest_framework.generics import ListCreateAPIView, ListAPIView, RetrieveAPIView, RetrieveUpdateAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.pagination import CursorPagination
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated, DjangoModelPermissions, IsAdminUser, BasePermission, AllowAny
+from rest_framework.permissions import IsAuthenticated, BasePermission, AllowAny, SAFE_METHODS
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
-from django.utils.timezone import now
-from django.core.mail import send_mail
-from django.conf import settings
-from .models import Task, DeadlineExtensionLog
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.timezone import is_naive, make_aware
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .models import Task, DeadlineExtensionLog, TaskEvent, TaskTemplate, ArchivedTask, User
 from django.contrib.auth import authenticate
-from .serializers import TaskSerializer, DeadlineExtensionRequestSerializer, DeadlineExtensionApprovalSerializer , LoginSerializer
-from .filters import TaskFilter, DeadlineExtensionLogFilter
+from .serializers import TaskSerializer, ArchivedTaskSerializer, TaskQueueSerializer, TaskClaimSerializer, TaskTemplateSerializer, TaskBulkAutoAssignSerializer, TaskEventSerializer, TaskSyncSerializer, DeadlineExtensionSyncSerializer, DeadlineExtensionRequestSerializer, DeadlineExtensionApprovalSerializer, DeadlineExtensionBulkDecisionSerializer, LoginSerializer
+from .filters import TaskFilter, DeadlineExtensionLogFilter, ArchivedTaskFilter
+from .transitions import EXTENSION_DECISION_MESSAGES
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.authtoken.models import Token
-from rest_framework.authentication import TokenAuthentication
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+from . import archive, feed, metrics, sync, tenancy, timeline, work_queue
+from .tenancy import WorkspaceScopedMixin
+from .idempotency import IdempotentCreateMixin
+from .concurrency import PreconditionFailed, etag_for, parse_if_match
+from .roles import has_role, DEVELOPER, TASK_PROVIDER
+from .throttling import LoginIPThrottle, LoginUsernameThrottle, LoginAccountThrottle
 
 # from permissions import DjangoModelPermissions
 
@@ -30,7 +44,7 @@ class CustomPermissions(BasePermission):
             return False
 
         # Permissions for Task views
-        if isinstance(view, TaskListCreateView):# or isinstance(view, TaskDetailView):
+        if isinstance(view, TaskListCreateView) or isinstance(view, TaskDetailView):
             # Developers can only view tasks
             if request.method in ['GET', 'HEAD', 'OPTIONS']:
                 return user.has_perm('taskmanager.view_task')
@@ -40,8 +54,46 @@ class CustomPermissions(BasePermission):
                 return user.has_perm('taskmanager.add_task')
 
             # Task Providers can update/delete tasks
-            if request.method in ['PUT', 'PATCH', 'DELETE']:
-                return user.has_perm('taskmanager.change_task') or user.has_perm('taskmanager.delete_task')
+            if request.method in ['PUT', 'PATCH']:
+                return user.has_perm('taskmanager.change_task')
+            if request.method == 'DELETE':
+                return user.has_perm('taskmanager.delete_task')
+
+        # Recurring templates create tasks, so they follow the task permissions
+        if isinstance(view, TaskTemplateListCreateView) or isinstance(view, TaskTemplateDetailView):
+            if request.method in ['GET', 'HEAD', 'OPTIONS']:
+                return user.has_perm('taskmanager.view_task')
+            if request.method == 'POST':
+                return user.has_perm('taskmanager.add_task')
+            if request.method in ['PUT', 'PATCH']:
+                return user.has_perm('taskmanager.change_task')
+            if request.method == 'DELETE':
+                return user.has_perm('taskmanager.delete_task')
+
+        # Everyone with access to tasks can read their queue, claiming changes a task
+        if isinstance(view, TaskQueueView) or isinstance(view, TaskClaimView) or isinstance(view, TaskTimelineView):
+            if request.method in ['GET', 'HEAD', 'OPTIONS']:
+                return user.has_perm('taskmanager.view_task')
+            if request.method == 'POST':
+                return user.has_perm('taskmanager.change_task')
+
+        # Task Providers can hand pending tasks to the workload scheduler
+        if isinstance(view, TaskAutoAssignView):
+            if request.method == 'POST':
+                return user.has_perm('taskmanager.change_task')
+
+        # The archive is read-only, restoring puts tasks back into the hot table
+        if isinstance(view, ArchivedTaskListView) or isinstance(view, ArchivedTaskDetailView):
+            if request.method in ['GET', 'HEAD', 'OPTIONS']:
+                return user.has_perm('taskmanager.view_task')
+        if isinstance(view, ArchivedTaskRestoreView):
+            if request.method == 'POST':
+                return user.has_perm('taskmanager.add_task')
+
+        # Task history, delta sync and metrics are read-only
+        if isinstance(view, TaskHistoryView) or isinstance(view, DeltaSyncView) or isinstance(view, DeveloperMetricsView):
+            if request.method in ['GET', 'HEAD', 'OPTIONS']:
+                return user.has_perm('taskmanager.view_task')
 
 
 
@@ -53,7 +105,7 @@ class CustomPermissions(BasePermission):
                 return user.has_perm('taskmanager.view_deadlineextensionlog')
 
             # Developers can create requestsc
-            if request.method == 'POST' and not request.user.groups.filter(name='Task Providers').exists():
+            if request.method == 'POST' and not has_role(request.user, TASK_PROVIDER):
                 return user.has_perm('taskmanager.add_deadlineextensionlog')
 
             # Task Providers can update or delete requests
@@ -61,6 +113,11 @@ class CustomPermissions(BasePermission):
                 return user.has_perm('taskmanager.change_deadlineextensionlog') or user.has_perm('taskmanager.delete_deadlineextensionlog')
 
 
+        # Task Providers can decide many requests at once
+        if isinstance(view, DeadlineExtensionBulkDecisionView):
+            if request.method == 'POST':
+                return user.has_perm('taskmanager.change_deadlineextensionlog')
+
         if isinstance(view, DeadlineExtensionApprovalListView) or isinstance(view, DeadlineExtensionApprovalRetriveUpdateView):
             # Developers can not approve requests
             if request.method in ['PUT', 'PATCH', 'DELETE','GET', 'HEAD', 'OPTIONS']:
@@ -71,10 +128,37 @@ class CustomPermissions(BasePermission):
         return False
 
 
+class SparseFieldsetQuerysetMixin:
+    """
+    For views whose serializer uses SparseFieldsetMixin: reads load only the
+    columns and relations the requested fieldset renders.
+    """
+    expand_by_default = True  # Whether expandable fields are rendered without ?expand=
+    always_load = ()  # Columns the view itself reads from the object
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand_by_default'] = self.expand_by_default
+        return context
+
+    def selected_fields(self):
+        return self.get_serializer_class().selected_fields(self.request, self.expand_by_default)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        fields = self.selected_fields()
+        if fields is not None:
+            fields = fields | set(self.always_load)
+        return self.get_serializer_class().project(queryset, fields)
+
+
 #View for create and read tasks 
-class TaskListCreateView(ListCreateAPIView):
+class TaskListCreateView(WorkspaceScopedMixin, IdempotentCreateMixin, SparseFieldsetQuerysetMixin, ListCreateAPIView):
     """
-    List all tasks and allow task creation.
+    List all tasks and allow task creation. Retried POSTs with the same
+    Idempotency-Key create the task once (see idempotency.py).
     """
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
@@ -90,11 +174,405 @@ class TaskListCreateView(ListCreateAPIView):
         serializer.save(assigned_by=self.request.user)
 
 
+#view for read, update and delete a single task
+class TaskDetailView(WorkspaceScopedMixin, SparseFieldsetQuerysetMixin, RetrieveUpdateDestroyAPIView):
+    """
+    One task. Subtasks are only included with `?expand=subtasks`.
+
+    Without subtasks the response carries an ETag (the task version) and
+    Last-Modified (updated_at), and a GET with a matching If-None-Match or
+    If-Modified-Since is answered 304 from a primary key lookup of those two
+    columns, without loading the task. Writes sent with If-Match only apply
+    to that version, otherwise they fail with 412.
+    """
+    queryset = Task.objects.all()
+    serializer_class = TaskSerializer
+    permission_classes = [IsAuthenticated, CustomPermissions]
+    expand_by_default = False
+    always_load = ('version', 'updated_at')
+
+    def retrieve(self, request, *args, **kwargs):
+        # Subtasks change without touching this task's version, so no validators then
+        validated = 'subtasks' not in self.selected_fields()
+        if validated:
+            validators = self.get_queryset().filter(pk=kwargs['pk']).values_list('version', 'updated_at').first()
+            if validators is not None:
+                version, updated_at = validators
+                not_modified = get_conditional_response(request, etag=etag_for(version), last_modified=int(updated_at.timestamp()))
+                if not_modified is not None:
+                    return not_modified
+
+        task = self.get_object()
+        response = Response(self.get_serializer(task).data)
+        if validated:
+            self.set_validators(response, task)
+        return response
+
+    def perform_update(self, serializer):
+        # TaskSerializer.update checks If-Match against the version
+        self.updated_task = serializer.save()
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        self.set_validators(response, self.updated_task)
+        return response
+
+    def perform_destroy(self, instance):
+        expected_version = parse_if_match(self.request)
+        with tenancy.atomic():
+            version = Task.objects.select_for_update().filter(pk=instance.pk).values_list('version', flat=True).first()
+            if expected_version is not None and version != expected_version:
+                raise PreconditionFailed()
+            instance.delete()
+
+    def set_validators(self, response, task):
+        response['ETag'] = etag_for(task.version)
+        response['Last-Modified'] = http_date(task.updated_at.timestamp())
+
+
+#views for recurring task templates
+class TaskTemplateListCreateView(WorkspaceScopedMixin, ListCreateAPIView):
+    """
+    List the user's recurring task templates and create new ones, with their subtask tree.
+    """
+    serializer_class = TaskTemplateSerializer
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+    def get_queryset(self):
+        templates = TaskTemplate.objects.filter(parent__isnull=True).order_by('pk')
+        if not self.request.user.is_superuser:
+            templates = templates.filter(assigned_by=self.request.user)
+        return templates
+
+    def perform_create(self, serializer):
+        serializer.save(assigned_by=self.request.user)
+
+
+class TaskTemplateDetailView(WorkspaceScopedMixin, RetrieveUpdateDestroyAPIView):
+    """
+    Read, change, pause (`is_active`) or delete a recurring task template.
+    Tasks already created from it are kept.
+    """
+    serializer_class = TaskTemplateSerializer
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+    def get_queryset(self):
+        templates = TaskTemplate.objects.filter(parent__isnull=True)
+        if not self.request.user.is_superuser:
+            templates = templates.filter(assigned_by=self.request.user)
+        return templates
+
+
+
+#view for "what should I do next"
+class TaskQueueView(WorkspaceScopedMixin, APIView):
+    """
+    The user's top tasks by priority and due date. `?limit=` (default 10, max 100), `?status=` (default Pending).
+    """
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 100)
+        except ValueError:
+            return Response({'limit': 'Must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        task_status = request.query_params.get('status', 'Pending')
+        if task_status not in dict(Task.STATUS_CHOICES):
+            return Response({'status': f"'{task_status}' is not a valid status."}, status=status.HTTP_400_BAD_REQUEST)
+
+        tasks = work_queue.next_tasks(request.user, limit, task_status)
+        return Response(TaskQueueSerializer(tasks, many=True).data, status=status.HTTP_200_OK)
+
+
+#view for calendar / Gantt planning
+class TaskTimelineView(WorkspaceScopedMixin, APIView):
+    """
+    Tasks due from `?start=` (default today) to `?end=` (default start + 90 days):
+    counts per `?bucket=day|week` and compact intervals for a Gantt chart.
+    `?assigned_to=<user id>` narrows to one assignee, `?root=<task id>` the
+    intervals to one subtask tree.
+    """
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+    def get(self, request):
+        params = request.query_params
+        errors = {}
+
+        def date_param(name, default):
+            if not params.get(name):
+                return default
+            try:
+                return parse_date(params[name])
+            except ValueError:
+                # Well formed but impossible, like 2024-02-30
+                return None
+
+        start = date_param('start', datetime.date.today())
+        if start is None:
+            errors['start'] = 'Must be a date (YYYY-MM-DD).'
+        end = date_param('end', start and start + datetime.timedelta(days=90))
+        if end is None:
+            errors['end'] = 'Must be a date (YYYY-MM-DD).'
+        elif start and not 0 <= (end - start).days < timeline.MAX_DAYS:
+            errors['end'] = f'Must be on or after start and at most {timeline.MAX_DAYS} days later.'
+
+        bucket = params.get('bucket', 'day')
+        if bucket not in timeline.BUCKETS:
+            errors['bucket'] = f"Must be one of {', '.join(timeline.BUCKETS)}."
+
+        ids = {}
+        for name in ('assigned_to', 'root'):
+            try:
+                ids[name] = int(params[name]) if params.get(name) else None
+            except ValueError:
+                errors[name] = 'Must be a number.'
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        intervals, truncated = timeline.intervals(start, end, ids['assigned_to'], ids['root'])
+        return Response({
+            'start': start,
+            'end': end,
+            'bucket': bucket,
+            'buckets': timeline.buckets(start, end, bucket, ids['assigned_to']),
+            'intervals': intervals,
+            'truncated': truncated,
+        }, status=status.HTTP_200_OK)
+
+
+#view for per-developer workload and SLA metrics
+class DeveloperMetricsView(WorkspaceScopedMixin, APIView):
+    """
+    Cycle time, on-time rate and extension frequency per developer over the
+    last `?window=` days (one of TASK_METRICS_WINDOWS). Task Providers see
+    every developer of the workspace or the ones in `?developer=<id>,<id>`,
+    developers only themselves.
+    """
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+    def get(self, request):
+        windows = metrics.windows()
+        try:
+            window_days = int(request.query_params.get('window', windows[0]))
+        except ValueError:
+            window_days = None
+        if window_days not in windows:
+            return Response({'window': f"Must be one of {', '.join(map(str, windows))}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        developers = request.workspace.members.filter(groups__name=DEVELOPER)
+        if not has_role(request.user, TASK_PROVIDER):
+            developers = developers.filter(pk=request.user.pk)
+        elif request.query_params.get('developer'):
+            try:
+                developers = developers.filter(pk__in=[int(pk) for pk in request.query_params['developer'].split(',')])
+            except ValueError:
+                return Response({'developer': 'Must be a comma separated list of user ids.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        names = dict(developers.order_by('username').values_list('pk', 'username'))
+        rows = metrics.summaries(list(names), window_days)
+        return Response([
+            {**metrics.report(rows[developer_id]), 'username': username}
+            for developer_id, username in names.items()
+        ], status=status.HTTP_200_OK)
+
+
+#view for pull-based work distribution
+class TaskClaimView(WorkspaceScopedMixin, APIView):
+    """
+    Atomically take the top pending task and start it. By default from the user's
+    own queue, or from a shared queue with `{"pool": <user id>}` (403 for queues
+    the user may not claim from, see work_queue.may_claim_from).
+    """
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+    def post(self, request):
+        serializer = TaskClaimSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pool = serializer.validated_data.get('pool')
+        if pool is not None:
+            pool = User.objects.filter(pk=pool).first()
+            if pool is None:
+                return Response({'pool': 'Unknown user.'}, status=status.HTTP_400_BAD_REQUEST)
+            if not work_queue.may_claim_from(request.user, pool):
+                return Response({'pool': 'You may not claim tasks from this queue.'}, status=status.HTTP_403_FORBIDDEN)
+
+        task = work_queue.claim_next(request.user, pool)
+        if task is None:
+            return Response({'Message': 'There are no pending tasks to claim.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(TaskQueueSerializer(task).data, status=status.HTTP_200_OK)
+
+
+
+#view for batch auto-assignment
+class TaskAutoAssignView(WorkspaceScopedMixin, APIView):
+    """
+    Re-assign the given pending tasks to the developers with the most spare capacity.
+    """
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+    def post(self, request):
+        serializer = TaskBulkAutoAssignSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        tasks = serializer.save()
+
+        return Response({
+            'status': 'success',
+            'message': f"{len(tasks)} task(s) have been assigned.",
+            'data': [{'id': task.pk, 'assigned_to': task.assigned_to_id} for task in tasks],
+        }, status=status.HTTP_200_OK)
+
+
+
+#views for archived tasks
+class ArchivePagination(CursorPagination):
+    page_size = 100
+    ordering = ('-completed_at', '-id')
+
+
+class ArchivedTaskListView(WorkspaceScopedMixin, ListAPIView):
+    """
+    Search the archived tasks, most recently completed first.
+    """
+    queryset = ArchivedTask.objects.all()
+    serializer_class = ArchivedTaskSerializer
+    pagination_class = ArchivePagination
+    filter_backends = (DjangoFilterBackend, SearchFilter)
+    filterset_class = ArchivedTaskFilter
+    search_fields = ['name']
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+
+class ArchivedTaskDetailView(WorkspaceScopedMixin, RetrieveAPIView):
+    queryset = ArchivedTask.objects.all()
+    serializer_class = ArchivedTaskSerializer
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+
+class ArchivedTaskRestoreView(WorkspaceScopedMixin, APIView):
+    """
+    Move the archived tree the task belongs to back into the task list.
+    """
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+    def post(self, request, pk):
+        try:
+            tasks = archive.restore(pk, request.user)
+        except archive.NotArchived as e:
+            return Response({'Message': str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'status': 'success',
+            'message': f"{len(tasks)} task(s) have been restored.",
+            'data': [task.pk for task in tasks],
+        }, status=status.HTTP_200_OK)
+
+
+
+#view for a task's change history
+class TaskHistoryView(WorkspaceScopedMixin, APIView):
+    """
+    List the recorded changes of a task, or rebuild its state at a point in time with `?at=<ISO datetime>`.
+    """
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+    def get(self, request, pk):
+        at = request.query_params.get('at')
+        if not at:
+            events = TaskEvent.objects.for_task(pk)
+            return Response(TaskEventSerializer(events, many=True).data, status=status.HTTP_200_OK)
+
+        moment = parse_datetime(at)
+        if moment is None:
+            return Response({'at': 'Enter a valid ISO 8601 date/time.'}, status=status.HTTP_400_BAD_REQUEST)
+        if is_naive(moment):
+            moment = make_aware(moment)
+
+        state = TaskEvent.objects.state_at(pk, moment)
+        if state is None:
+            return Response({'Message': 'The task did not exist at that time.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'task': pk, 'at': moment, 'state': state}, status=status.HTTP_200_OK)
+
+
+
+#view for offline/mobile delta sync
+class DeltaSyncView(WorkspaceScopedMixin, APIView):
+    """
+    Return the tasks and extension requests that changed since `?cursor=`, plus
+    tombstones for deleted ones. Without a cursor everything visible is returned,
+    in pages (`has_more`).
+    """
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+    def get(self, request):
+        cursor = request.query_params.get('cursor')
+        try:
+            # No cursor starts a snapshot, a snapshot cursor continues it
+            snapshot = sync.decode_snapshot_cursor(cursor) if cursor else ()
+            if snapshot is not None:
+                changes = sync.full_snapshot(request.user, *snapshot)
+            else:
+                changes = sync.changes_since(request.user, sync.decode_cursor(cursor))
+        except sync.InvalidCursor:
+            return Response({'cursor': 'Invalid sync cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'cursor': changes['cursor'],
+            'has_more': changes['has_more'],
+            'tasks': TaskSyncSerializer(changes['tasks'], many=True).data,
+            'deadline_extensions': DeadlineExtensionSyncSerializer(changes['deadline_extensions'], many=True).data,
+            'deleted': {
+                'tasks': changes['deleted_tasks'],
+                'deadline_extensions': changes['deleted_deadline_extensions'],
+            },
+        }, status=status.HTTP_200_OK)
+
+
+
+#Server-Sent Events feed of task and extension changes
+async def task_change_feed(request):
+    """
+    Stream the changes the user is allowed to see in their workspace (X-Workspace,
+    as for the other views). Reconnecting clients send the Last-Event-ID header (or
+    `?last_event_id=`) and receive what they missed first.
+    Needs to be served through asgi.py, a WSGI worker would be held for the whole stream.
+    """
+    try:
+        authenticated = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except (InvalidToken, AuthenticationFailed):
+        authenticated = None
+    if authenticated is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    user = authenticated[0]
+    if not await sync_to_async(user.has_perm)('taskmanager.view_task'):
+        return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
+
+    request.user = user
+    try:
+        workspace = await sync_to_async(tenancy.resolve_workspace)(request)
+    except PermissionDenied as e:
+        return JsonResponse({'detail': str(e.detail)}, status=status.HTTP_403_FORBIDDEN)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return JsonResponse({'last_event_id': 'Must be an event id.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(feed.stream(user, workspace.pk, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
+
+
 
 #view for create request and read request
-class DeadlineExtensionRequestListCreateView(ListCreateAPIView):
+class DeadlineExtensionRequestListCreateView(WorkspaceScopedMixin, IdempotentCreateMixin, SparseFieldsetQuerysetMixin, ListCreateAPIView):
     """
     List all deadline extension requests and allow creating new extension requests.
+    Retried POSTs with the same Idempotency-Key create the request once.
     """
     queryset = DeadlineExtensionLog.objects.all()
     serializer_class = DeadlineExtensionRequestSerializer
@@ -109,7 +587,7 @@ class DeadlineExtensionRequestListCreateView(ListCreateAPIView):
         serializer.save(request_by=self.request.user)
 
 #view for read requests
-class DeadlineExtensionApprovalListView(ListAPIView):
+class DeadlineExtensionApprovalListView(WorkspaceScopedMixin, SparseFieldsetQuerysetMixin, ListAPIView):
     """
     List all deadline extension requests for Task Providers to approve or reject.
     """
@@ -126,7 +604,7 @@ class DeadlineExtensionApprovalListView(ListAPIView):
 
 
 #view for read and update a specific request
-class DeadlineExtensionApprovalRetriveUpdateView(RetrieveUpdateAPIView):
+class DeadlineExtensionApprovalRetriveUpdateView(WorkspaceScopedMixin, SparseFieldsetQuerysetMixin, RetrieveUpdateAPIView):
     """
     Approve or reject a specific deadline extension request.
     """
@@ -134,23 +612,26 @@ class DeadlineExtensionApprovalRetriveUpdateView(RetrieveUpdateAPIView):
     serializer_class = DeadlineExtensionApprovalSerializer
     permission_classes = [IsAuthenticated, CustomPermissions]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in ['PUT', 'PATCH']:
+            # Row lock so two concurrent decisions on the same request are serialized
+            queryset = queryset.select_for_update()
+        return queryset
+
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
         kwargs['partial'] = partial
 
-        # Perform the update operation
-        response = super().update(request, *args, **kwargs)
+        # Perform the update operation, holding the row lock until commit
+        with tenancy.atomic():
+            response = super().update(request, *args, **kwargs)
 
         # Extract the updated status from the response
         updated_status = response.data.get("status", "").upper()
 
         # Set a custom message based on the status
-        if updated_status == "APPROVED":
-            message = "The deadline extension request has been approved successfully."
-        elif updated_status == "REJECTED":
-            message = "The deadline extension request has been rejected successfully."
-        else:
-            message = "The deadline extension request has been updated."
+        message = EXTENSION_DECISION_MESSAGES.get(updated_status, "The deadline extension request has been updated.")
 
         # Customize the response data
         response.data = {
@@ -161,6 +642,28 @@ class DeadlineExtensionApprovalRetriveUpdateView(RetrieveUpdateAPIView):
 
         return response
 
+
+
+
+#view for approving/rejecting many requests at once
+class DeadlineExtensionBulkDecisionView(WorkspaceScopedMixin, APIView):
+    """
+    Approve or reject several deadline extension requests in one call:
+    `{"decisions": [{"id": 1, "status": "APPROVED"}, {"id": 2, "status": "REJECTED"}]}`
+    """
+    permission_classes = [IsAuthenticated, CustomPermissions]
+
+    def post(self, request):
+        serializer = DeadlineExtensionBulkDecisionSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        decided = serializer.save()
+
+        return Response({
+            "status": "success",
+            "message": f"{len(decided)} deadline extension request(s) have been decided successfully.",
+            "data": [{'id': extension.pk, 'status': extension.status} for extension in decided],
+        }, status=status.HTTP_200_OK)
+
     
 
 
@@ -185,19 +688,23 @@ class DeadlineExtensionApprovalRetriveUpdateView(RetrieveUpdateAPIView):
 class LoginAPIView(APIView):
     serializer_class = LoginSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [LoginIPThrottle, LoginUsernameThrottle, LoginAccountThrottle]  # Checked before any password is hashed
 
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
-        if serializer.is_valid(raise_exception=True):
-            # Authenticate user using username and password
-            user = authenticate(username=serializer.data['username'], password=serializer.data['password'])
-            if user:
-                # Generate JWT tokens (Access and Refresh)
-                refresh = RefreshToken.for_user(user)
-                return Response({
-                    'id': user.id,
-                    'username':user.username,
-                    'email':user.email,
-                    'access_token': str(refresh.access_token),
-                }, status=status.HTTP_200_OK)
-            return Response({'Message': 'Invalid Username or Password'}, status=status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        serializer.is_valid(raise_exception=True)
+        credentials = serializer.validated_data
+
+        # Authenticate user using username and password (an outdated password hash is upgraded here)
+        user = authenticate(request, username=credentials['username'], password=credentials['password'])
+        if user is None:
+            return Response({'Message': 'Invalid Username or Password'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        # Only the access token is returned, so no refresh token (and no blacklist row) is made
+        access_token = AccessToken.for_user(user)
+        return Response({
+            'id': user.id,
+            'username':user.username,
+            'email':user.email,
+            'access_token': str(access_token),
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,425 @@
+"""
+Outbound webhooks.
+
+Integrations register a WebhookEndpoint per workspace with the events they
+want: task.assigned, task.status_changed and extension.decided. The signal
+handlers in signals.py queue one WebhookDelivery per event and subscribed
+endpoint, in the transaction of the change (an outbox). `manage.py
+dispatch_webhooks` runs the Dispatcher, which polls for due deliveries and
+sends them concurrently from an asyncio loop:
+
+- Every request is a JSON POST signed with the endpoint's secret:
+  X-Webhook-Signature: t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<body>">.
+  X-Webhook-Id is the delivery id. A delivery can arrive more than once, so
+  receivers should drop ids they have seen.
+- ConnectionPool caps the requests in flight over all endpoints at
+  TASK_WEBHOOK_MAX_CONNECTIONS and reuses keep-alive connections.
+  WebhookEndpoint.max_concurrency caps them per endpoint.
+- A failed delivery (no 2xx within TASK_WEBHOOK_TIMEOUT) is retried after
+  a random delay of up to TASK_WEBHOOK_RETRY_BASE * 2^attempts seconds,
+  capped at TASK_WEBHOOK_RETRY_CAP ("full jitter"). After
+  TASK_WEBHOOK_MAX_ATTEMPTS attempts it is marked failed.
+- After TASK_WEBHOOK_BREAKER_THRESHOLD consecutive failures an endpoint's
+  circuit opens. Nothing is sent to it for TASK_WEBHOOK_BREAKER_COOLDOWN
+  seconds, then a single probe delivery decides whether it closes again.
+
+Like the notification buffer, the deliveries live in the default database:
+for a workspace with its own database, a delivery is kept even if the
+change that caused it is rolled back.
+"""
+import asyncio
+import datetime
+import hashlib
+import hmac
+import json
+import random
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router, transaction
+from django.utils.timezone import now
+
+from .models import DeadlineExtensionLog, Task, WebhookDelivery, WebhookEndpoint
+
+
+SIGNATURE_HEADER = 'X-Webhook-Signature'
+USER_AGENT = 'taskmanager-webhooks/1'
+
+DEFAULTS = {
+    'MAX_CONNECTIONS': 20,
+    'TIMEOUT': 10,  # seconds per request
+    'BATCH_SIZE': 200,  # deliveries claimed per poll
+    'POLL_INTERVAL': 1.0,  # seconds between polls when nothing is due
+    'MAX_ATTEMPTS': 8,
+    'RETRY_BASE': 10,  # seconds
+    'RETRY_CAP': 60 * 60,
+    'BREAKER_THRESHOLD': 5,
+    'BREAKER_COOLDOWN': 5 * 60,
+    'KEEP_DAYS': 7,  # finished deliveries are deleted after this
+}
+
+TASK_FIELDS = ('id', 'name', 'status', 'priority', 'due_date', 'assigned_to_id', 'assigned_by_id', 'parent_task_id')
+
+Result = namedtuple('Result', ['delivery', 'status_code', 'error', 'skipped'])
+
+
+def setting(name):
+    return getattr(settings, f'TASK_WEBHOOK_{name}', DEFAULTS[name])
+
+
+def sign(secret, timestamp, body):
+    return hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+
+
+def verify(secret, header, body, tolerance=300):
+    """
+    Check an X-Webhook-Signature header, for receivers written in Python.
+    """
+    try:
+        parts = dict(part.split('=', 1) for part in header.split(','))
+        timestamp = int(parts['t'])
+    except (KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), parts.get('v1', ''))
+
+
+def backoff(attempts):
+    # Full jitter: retries of many deliveries that failed together spread out
+    return random.uniform(0, min(setting('RETRY_CAP'), setting('RETRY_BASE') * 2 ** attempts))
+
+
+# Queueing (sync, called from signals.py)
+
+def emit(event, workspace_id, items):
+    """
+    Queue a delivery of every `items` data dict to each active endpoint of the
+    workspace subscribed to `event`.
+    """
+    if not items:
+        return
+    endpoints = [
+        endpoint for endpoint in WebhookEndpoint.objects.filter(workspace_id=workspace_id, is_active=True)
+        if endpoint.subscribes_to(event)
+    ]
+    if not endpoints:
+        return
+    moment = now()
+    WebhookDelivery.objects.bulk_create([
+        WebhookDelivery(
+            endpoint=endpoint, event=event, next_attempt_at=moment,
+            payload={'event': event, 'created_at': moment, 'data': data},
+        )
+        for endpoint in endpoints
+        for data in items
+    ])
+
+
+def task_data(task):
+    return {field: getattr(task, field) for field in TASK_FIELDS}
+
+
+def tasks_assigned(tasks):
+    by_workspace = {}
+    for task in tasks:
+        by_workspace.setdefault(task.workspace_id, []).append({'task': task_data(task)})
+    for workspace_id, items in by_workspace.items():
+        emit('task.assigned', workspace_id, items)
+
+
+def assignee_changed(task):
+    """
+    Whether saving `task` gives it a new assignee. Call before the save.
+    """
+    loaded = getattr(task, '_loaded_values', None)
+    if loaded is None or task.pk is None:
+        return task.assigned_to_id is not None
+    return 'assigned_to_id' not in task.get_deferred_fields() and loaded.get('assigned_to_id') != task.assigned_to_id
+
+
+def transitions_applied(model, transitions, user=None):
+    if model is Task:
+        event, fields = 'task.status_changed', TASK_FIELDS
+    elif model is DeadlineExtensionLog:
+        event, fields = 'extension.decided', ('id', 'task_id', 'status', 'new_deadline', 'request_by_id', 'approved_by_id', 'approved_at')
+        transitions = [transition for transition in transitions if transition.target in ('APPROVED', 'REJECTED')]
+    else:
+        return
+    if not transitions:
+        return
+
+    changed = {transition.pk: transition for transition in transitions}
+    by_workspace = {}
+    for row in model.objects.filter(pk__in=changed).values('workspace_id', *fields):
+        transition = changed[row['id']]
+        item = {'from': transition.source, 'to': transition.target, 'actor_id': user.pk if user is not None else None}
+        item['task' if model is Task else 'extension'] = {field: row[field] for field in fields}
+        by_workspace.setdefault(row['workspace_id'], []).append(item)
+    for workspace_id, items in by_workspace.items():
+        emit(event, workspace_id, items)
+
+
+# Delivery state (sync, called from the dispatcher through sync_to_async)
+
+def claim_due(batch_size, moment=None):
+    """
+    Take up to `batch_size` due deliveries of endpoints whose circuit is
+    closed, one probe per endpoint whose cooldown is over. They are leased:
+    hidden from other dispatchers until the request has surely timed out.
+    """
+    moment = moment or now()
+    using = router.db_for_write(WebhookDelivery)
+    with transaction.atomic(using=using):
+        due = (
+            WebhookDelivery.objects.using(using)
+            .filter(status='pending', next_attempt_at__lte=moment, endpoint__is_active=True)
+            .exclude(endpoint__circuit_open_until__gt=moment)
+            .select_related('endpoint')
+            .order_by('next_attempt_at', 'pk')
+        )
+        if connections[using].features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True, of=('self',))
+
+        claimed, probes = [], set()
+        for delivery in due[:batch_size]:
+            if delivery.endpoint.failure_count >= setting('BREAKER_THRESHOLD'):
+                if delivery.endpoint_id in probes:
+                    continue
+                probes.add(delivery.endpoint_id)
+            claimed.append(delivery)
+
+        lease = moment + datetime.timedelta(seconds=setting('TIMEOUT') * 2 + 30)
+        WebhookDelivery.objects.using(using).filter(pk__in=[delivery.pk for delivery in claimed]).update(next_attempt_at=lease)
+    return claimed
+
+
+def record(results, breakers, moment=None):
+    """
+    Store the outcome of a batch: delivered, rescheduled with backoff, given
+    up, or put off while the endpoint's circuit is open.
+    """
+    moment = moment or now()
+    endpoints = []
+    for breaker in breakers:
+        endpoint = breaker.endpoint
+        endpoint.failure_count = breaker.failures
+        if breaker.is_open:
+            endpoint.circuit_open_until = moment + datetime.timedelta(seconds=setting('BREAKER_COOLDOWN'))
+        endpoints.append(endpoint)
+    open_until = {endpoint.pk: endpoint.circuit_open_until for endpoint in endpoints}
+
+    deliveries = []
+    for delivery, status_code, error, skipped in results:
+        if skipped:
+            delivery.next_attempt_at = open_until[delivery.endpoint_id] or moment
+        else:
+            delivery.attempts += 1
+            delivery.response_status = status_code
+            delivery.last_error = (error or '')[:500]
+            if error is None:
+                delivery.status = 'delivered'
+                delivery.delivered_at = moment
+            elif delivery.attempts >= setting('MAX_ATTEMPTS'):
+                delivery.status = 'failed'
+            else:
+                delivery.next_attempt_at = moment + datetime.timedelta(seconds=backoff(delivery.attempts))
+        deliveries.append(delivery)
+
+    with transaction.atomic(using=router.db_for_write(WebhookDelivery)):
+        WebhookDelivery.objects.bulk_update(
+            deliveries, ['status', 'attempts', 'next_attempt_at', 'response_status', 'last_error', 'delivered_at'],
+        )
+        WebhookEndpoint._base_manager.bulk_update(endpoints, ['failure_count', 'circuit_open_until'])
+
+
+def purge_finished(moment=None):
+    cutoff = (moment or now()) - datetime.timedelta(days=setting('KEEP_DAYS'))
+    return WebhookDelivery.objects.filter(status__in=['delivered', 'failed'], created_at__lt=cutoff).delete()[0]
+
+
+# Sending (async)
+
+class ConnectionPool:
+    """
+    A minimal HTTP/1.1 client: at most `max_connections` requests in flight,
+    idle keep-alive connections kept per origin (scheme, host, port) and
+    reused, at most `max_connections` of them in total.
+    """
+
+    def __init__(self, max_connections, timeout):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(max_connections)
+        self.idle = {}
+
+    async def post(self, url, body, headers):
+        """
+        POST `body` and return the response status code.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"Not an http(s) URL: {url}")
+        origin = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        lines = [f'POST {target} HTTP/1.1', f'Host: {parts.netloc.rsplit("@", 1)[-1]}', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+        async with self.slots:
+            return await asyncio.wait_for(self._send(origin, request), self.timeout)
+
+    async def _send(self, origin, request):
+        idle = self.idle.get(origin)
+        while idle:
+            reader, writer = idle.pop()
+            try:
+                return await self._exchange(origin, reader, writer, request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # The server closed the idle connection in the meantime
+                writer.close()
+
+        reader, writer = await asyncio.open_connection(origin[1], origin[2], ssl=True if origin[0] == 'https' else None)
+        try:
+            return await self._exchange(origin, reader, writer, request)
+        except BaseException:
+            writer.close()
+            raise
+
+    async def _exchange(self, origin, reader, writer, request):
+        writer.write(request)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed before the response.")
+        version, status_code = status_line.split(b' ', 2)[:2]
+        status_code = int(status_code)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+
+        # The body is not needed, but has to be read to reuse the connection
+        keep_alive = version == b'HTTP/1.1' and headers.get('connection') != 'close'
+        if status_code in (204, 304) or 100 <= status_code < 200:
+            pass
+        elif headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        else:
+            await reader.read()
+            keep_alive = False
+
+        if keep_alive and sum(map(len, self.idle.values())) < self.max_connections:
+            self.idle.setdefault(origin, []).append((reader, writer))
+        else:
+            writer.close()
+        return status_code
+
+    def close(self):
+        for idle in self.idle.values():
+            for reader, writer in idle:
+                writer.close()
+        self.idle = {}
+
+
+class Breaker:
+    """
+    Consecutive failures of one endpoint during a batch. An endpoint that was
+    already open gets one probe: a failure opens it again right away.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.failures = min(endpoint.failure_count, setting('BREAKER_THRESHOLD') - 1)
+
+    @property
+    def is_open(self):
+        return self.failures >= setting('BREAKER_THRESHOLD')
+
+    def record(self, ok):
+        self.failures = 0 if ok else self.failures + 1
+
+
+class Dispatcher:
+
+    def __init__(self, max_connections=None, timeout=None, batch_size=None):
+        self.timeout = timeout or setting('TIMEOUT')
+        self.batch_size = batch_size or setting('BATCH_SIZE')
+        self.pool = ConnectionPool(max_connections or setting('MAX_CONNECTIONS'), self.timeout)
+        self.endpoint_slots = {}
+
+    async def deliver(self, delivery, breaker):
+        endpoint = delivery.endpoint
+        # Keyed by the limit too, a changed limit takes effect on the next batch
+        key = (endpoint.pk, endpoint.max_concurrency)
+        slots = self.endpoint_slots.get(key)
+        if slots is None:
+            slots = self.endpoint_slots[key] = asyncio.Semaphore(max(1, endpoint.max_concurrency))
+
+        async with slots:
+            # Checked only once a slot is free: earlier requests may have tripped it
+            if breaker.is_open:
+                return Result(delivery, None, None, True)
+
+            body = json.dumps(delivery.payload, cls=DjangoJSONEncoder).encode()
+            timestamp = int(time.time())
+            headers = {
+                'Content-Type': 'application/json',
+                'User-Agent': USER_AGENT,
+                'X-Webhook-Id': str(delivery.pk),
+                'X-Webhook-Event': delivery.event,
+                SIGNATURE_HEADER: f't={timestamp},v1={sign(endpoint.secret, timestamp, body)}',
+            }
+            status_code, error = None, None
+            try:
+                status_code = await self.pool.post(endpoint.url, body, headers)
+                if not 200 <= status_code < 300:
+                    error = f'HTTP {status_code}'
+            except asyncio.TimeoutError:
+                error = f'No response within {self.timeout}s'
+            except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                error = f'{type(e).__name__}: {e}'
+            breaker.record(error is None)
+            return Result(delivery, status_code, error, False)
+
+    async def run_once(self):
+        """
+        Send one batch of due deliveries. Returns how many were claimed.
+        """
+        deliveries = await sync_to_async(claim_due)(self.batch_size)
+        if not deliveries:
+            return 0
+        breakers = {}
+        for delivery in deliveries:
+            breakers.setdefault(delivery.endpoint_id, Breaker(delivery.endpoint))
+        results = await asyncio.gather(*(self.deliver(delivery, breakers[delivery.endpoint_id]) for delivery in deliveries))
+        await sync_to_async(record)(results, breakers.values())
+        return len(deliveries)
+
+    async def run(self, poll_interval=None):
+        poll_interval = poll_interval or setting('POLL_INTERVAL')
+        next_purge = 0
+        try:
+            while True:
+                if time.monotonic() >= next_purge:
+                    await sync_to_async(purge_finished)()
+                    next_purge = time.monotonic() + 60 * 60
+                # A full batch means more may be waiting
+                if await self.run_once() < self.batch_size:
+                    await asyncio.sleep(poll_interval)
+        finally:
+            self.pool.close()
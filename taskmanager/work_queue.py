@@ -0,0 +1,72 @@
+"""
+Priority-ordered work queues.
+
+A queue is the Pending tasks assigned to one user, ordered by priority_rank
+(highest first) and due date. That order matches task_work_queue_idx, so
+reading the top of a queue is a single index range scan.
+
+Users claim from their own queue. They may also claim from a shared queue:
+the queue of an account in the Shared Pools group. Task Providers may claim
+from any queue in the workspace.
+"""
+from django.db import connections, transaction
+
+from . import tenancy
+from .models import Task, StaleVersionError
+from .roles import has_role, SHARED_POOL, TASK_PROVIDER
+from .transitions import TASK_STATUS
+
+
+CLAIM_CANDIDATES = 5  # Rows looked at per attempt where SKIP LOCKED is not available
+CLAIM_ATTEMPTS = 3
+
+
+def queue_for(user, status='Pending'):
+    return Task.objects.filter(assigned_to=user, status=status).order_by('-priority_rank', 'due_date', 'id')
+
+
+def next_tasks(user, limit=10, status='Pending'):
+    return list(queue_for(user, status)[:limit])
+
+
+def may_claim_from(user, pool):
+    if pool.pk == user.pk:
+        return True
+    return tenancy.is_member(pool) and (has_role(pool, SHARED_POOL) or has_role(user, TASK_PROVIDER))
+
+
+def claim_next(user, pool=None):
+    """
+    Atomically take the top Pending task of `pool`'s queue (the user's own queue
+    by default), assign it to `user` and move it to In Progress. Returns the
+    task, or None when the queue is empty.
+
+    On PostgreSQL rows locked by another claimer are skipped (SELECT ... FOR
+    UPDATE SKIP LOCKED), so concurrent claimers never wait on each other. Other
+    databases fall back to the optimistic version check: a claimer that loses
+    the race on a row moves on to the next candidate.
+    """
+    queue = queue_for(pool or user)
+    skip_locked = connections[queue.db].features.has_select_for_update_skip_locked
+
+    for _ in range(CLAIM_ATTEMPTS):
+        with transaction.atomic(using=queue.db):
+            if skip_locked:
+                candidates = list(queue.select_for_update(skip_locked=True, of=('self',))[:1])
+            else:
+                candidates = list(queue[:CLAIM_CANDIDATES])
+            if not candidates:
+                return None
+
+            for task in candidates:
+                try:
+                    with transaction.atomic(using=queue.db):
+                        task.status = 'In Progress'
+                        task.assigned_to = user
+                        task.save_versioned(update_fields=['status', 'assigned_to'])
+                except StaleVersionError:
+                    continue
+                TASK_STATUS.announce([(task, 'Pending')], 'In Progress', user)
+                return task
+
+    return None